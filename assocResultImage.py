@@ -9,6 +9,11 @@
 #      This script associate assay results to images, using the result
 #      keys and figure labels defined in the input file.
 #
+#      If RESULT_IMAGE_BATCH is 1, the script runs in batch mode:
+#      each input line carries its own J-number, the figure label lookups
+#      for all of the J-numbers are built with one grouped query (per
+#      batch of 500 J-numbers), and all associations go into one bcp file.
+#
 #  Usage:
 #
 #      assocResultImage.py
@@ -18,7 +23,10 @@
 #      MGD_DBUSER
 #      MGD_DBPASSWORDFILE
 #      RESULT_IMAGE_FILE
-#      REFERENCE
+#      REFERENCE (J:####; required unless RESULT_IMAGE_BATCH=1)
+#      RESULT_IMAGE_BATCH (1 for batch mode; default 0)
+#      LOOKUPCACHE, LOOKUPCACHETTL (optional lookup cache; see cachelib.py)
+#      LOADPROFILE (1 to run under cProfile; see metricslib.py)
 #
 #  Inputs:
 #
@@ -27,10 +35,23 @@
 #          1) Result key
 #          2) Figure label
 #
+#      or, in batch mode:
+#
+#          1) J-number (J:####)
+#          2) Result key
+#          3) Figure label
+#
 #  Outputs:
 #
 #      GXD_InSituResultImage.bcp
 #
+#      assocResultImage.diagnostics - bcp command/status and a one-line
+#      json summary (METRICS ...) of rows read/written, missing figure
+#      labels and phase timings
+#
+#      assocResultImage.metrics.json - the same summary, with the SQL
+#      statement counts/timings (and assocResultImage.prof if LOADPROFILE=1)
+#
 #  Exit Codes:
 #
 #      0:  Successful completion
@@ -55,22 +76,34 @@
 
 import sys
 import os
-import string
 import db
 import mgi_utils
-import loadlib
+import bcplib
+import inputlib
+import lookuplib
+import cachelib
+import metricslib
 
 #
 #  GLOBALS
 #
 resultImageFile = os.environ['RESULT_IMAGE_FILE']
-jNumber = os.environ['REFERENCE']
+batchMode = (os.environ.get('RESULT_IMAGE_BATCH', '0') == '1')
+
+if batchMode:
+    jNumber = ''
+else:
+    jNumber = os.environ.get('REFERENCE', '')
+    if jNumber == '':
+        sys.stderr.write('REFERENCE is not set (set RESULT_IMAGE_BATCH=1 for batch mode)\n')
+        sys.exit(1)
 
 FULLSIZE_IMAGE_TYPE_KEY = 1072158
-refKey = ''
-paneKeyLookup = {}
+paneKeyLookup = {}      # (J-number, figure label) : image pane key
 assocTable = 'GXD_InSituResultImage'
 bcpFile = assocTable + '.bcp'
+diagFileName = 'assocResultImage.diagnostics'
+metricsFileBase = 'assocResultImage'   # assocResultImage.metrics.json (see metricslib)
 cdate = mgi_utils.date('%m/%d/%Y')
 
 #
@@ -81,41 +114,75 @@ cdate = mgi_utils.date('%m/%d/%Y')
 # Throws: Nothing
 #
 def init ():
+    metricslib.begin(db)
     db.useOneConnection(1)
     return
 
 #
 # Purpose: Create a dictionary for looking up the image pane key for a
-#          figure label. All figure labels for the given reference are
-#          included.
+#          J-number/figure label. All figure labels for the given
+#          reference (or, in batch mode, for every reference in the
+#          input file) are included.
 # Returns: Nothing
-# Assumes: Nothing
+# Assumes: The input file is open
 # Effects: Sets global variable
 # Throws: Nothing
 #
 def buildPaneKeyLookup ():
-    global paneKeyLookup, refKey
+    global paneKeyLookup
+
+    metricslib.startTimer('buildPaneKeyLookup')
 
     #
-    # Get the reference key for the J-Number.
+    # Get the J-numbers to look up.
     #
-    refKey = loadlib.verifyReference(jNumber, 0, None)
+    if batchMode:
+        jNumbers = set()
+        for lineNum, tokens in inputlib.readRecords(fpResultImageFile, 3):
+            jNumbers.add(tokens[0])
+        fpResultImageFile.seek(0)
+    else:
+        jNumbers = set([jNumber])
+
+    #
+    # The figure labels of the references in the lookup cache:
+    # J-number : [[figure label, image pane key], ...]
+    #
+    cached = cachelib.getValues('figure', jNumbers)
+
+    for jnum, figures in cached.items():
+        for figureLabel, paneKey in figures:
+            paneKeyLookup[(jnum, figureLabel)] = paneKey
+        metricslib.incr('panes', len(figures))
 
     #
     # Get all the figure labels and associated image pane keys for the
-    # reference.
+    # other references, and cache them.
     #
-    results = db.sql('''select i.figureLabel, ip._ImagePane_key
-                     from IMG_Image i, IMG_ImagePane ip
-                     where i._Image_key = ip._Image_key
-		     and i._ImageType_key = %d 
-                     and i._Refs_key = %d''' % (FULLSIZE_IMAGE_TYPE_KEY, refKey), 'auto')
-
-    for r in results:
-        figureLabel = r['figureLabel']
-        paneKey = r['_ImagePane_key']
-        paneKeyLookup[figureLabel] = paneKey
-        print 'paneKeyLookup[' + figureLabel + '] = ' + str(paneKey)
+    found = {}
+
+    for inList in lookuplib.sqlInBatches(set(jNumbers) - set(cached.keys())):
+        results = db.sql('''select a.accID, i.figureLabel, ip._ImagePane_key
+                         from ACC_Accession a, IMG_Image i, IMG_ImagePane ip
+                         where a.accID in (%s)
+                         and a._MGIType_key = 1
+                         and a._LogicalDB_key = 1
+                         and a.prefixPart = 'J:'
+                         and a.preferred = 1
+                         and a._Object_key = i._Refs_key
+                         and i._Image_key = ip._Image_key
+                         and i._ImageType_key = %d''' % (inList, FULLSIZE_IMAGE_TYPE_KEY), 'auto')
+
+        for r in results:
+            paneKeyLookup[(r['accID'], r['figureLabel'])] = r['_ImagePane_key']
+            found.setdefault(r['accID'], []).append([r['figureLabel'], r['_ImagePane_key']])
+
+        metricslib.incr('panes', len(results))
+
+    cachelib.putValues('figure', found)
+
+    metricslib.incr('references', len(jNumbers))
+    metricslib.stopTimer('buildPaneKeyLookup')
 
     return
 
@@ -127,7 +194,7 @@ def buildPaneKeyLookup ():
 # Throws: Nothing
 #
 def openFiles ():
-    global eResultImageFile, fpBCPFile
+    global fpResultImageFile, diagFile
 
     #
     # Open the input file.
@@ -142,11 +209,17 @@ def openFiles ():
     # Open the output file.
     #
     try:
-        fpBCPFile = open(bcpFile, 'w')
+        bcplib.openBCPFile(assocTable, bcpFile)
     except:
         sys.stderr.write('Cannot open output file: ' + bcpFile + '\n')
         sys.exit(1)
 
+    try:
+        diagFile = open(diagFileName, 'w')
+    except:
+        sys.stderr.write('Cannot open output file: ' + diagFileName + '\n')
+        sys.exit(1)
+
     return
 
 #
@@ -158,7 +231,7 @@ def openFiles ():
 #
 def closeFiles ():
     fpResultImageFile.close()
-    fpBCPFile.close()
+    bcplib.closeBCPFiles()
     return
 
 #
@@ -180,8 +253,15 @@ def runBCP ():
     bcpCmd =  '%s %s %s %s %s %s "\\t" "\\n" mgd' \
         % (bcpCommand, db.get_sqlServer(), db.get_sqlDatabase(), assocTable, currentDir, bcpFile)
 
-    diagFile.write('%s\n' % bcpCmd)
-    os.system(bcpCmd)
+    metricslib.startTimer('bcp')
+    results = bcplib.runBCPCommands([(assocTable, bcpCmd)], {}, diagFile)
+    metricslib.stopTimer('bcp')
+
+    if results[0]['status'] != 0:
+        metricslib.end(metricsFileBase)
+        metricslib.writeSummary(diagFile)
+        sys.stderr.write('bcp of ' + assocTable + ' failed; see ' + diagFileName + '\n')
+        sys.exit(1)
 
     return
 
@@ -194,29 +274,40 @@ def runBCP ():
 #
 def process ():
 
+    metricslib.startTimer('process')
+
     #
     # Check each result key/figure label pair in the input file.
     #
 
-    line = fpResultImageFile.readline()
+    if batchMode:
+        numFields = 3
+    else:
+        numFields = 2
 
-    while line:
-        tokens = string.split(line[:-1], '\t')
-        resultKey = tokens[0]
-        figureLabel = tokens[1]
+    for lineNum, tokens in inputlib.readRecords(fpResultImageFile, numFields):
+
+        if batchMode:
+            jnum, resultKey, figureLabel = tokens[:3]
+        else:
+            jnum = jNumber
+            resultKey, figureLabel = tokens[:2]
+
+        metricslib.incr('rowsRead')
 
         #
         # Find the image pane key for the figure label and write it to the
         # bcp file to associate it with the result. If the figure label is
-        # not in the lookup, print an error message.
+        # not in the lookup, count it as missing (see the summary).
         #
-        if paneKeyLookup.has_key(figureLabel):
-            paneKey = paneKeyLookup[figureLabel]
-            fpBCPFile.write(str(resultKey) + '\t' + str(paneKey) + '\t' + cdate + '\t' + cdate + '\n')
+        if (jnum, figureLabel) in paneKeyLookup:
+            paneKey = paneKeyLookup[(jnum, figureLabel)]
+            bcplib.writeBCPRow(assocTable, (resultKey, paneKey, cdate, cdate))
+            metricslib.incr('rowsWritten')
         else:
-            print 'Missing pane key for figure label: ' + figureLabel
+            metricslib.countValue('missingLabels', jnum + ' ' + figureLabel)
 
-        line = fpResultImageFile.readline()
+    metricslib.stopTimer('process')
 
     return
 
@@ -224,10 +315,13 @@ def process ():
 # Main
 #
 init()
-buildPaneKeyLookup()
 openFiles()
+buildPaneKeyLookup()
 process()
 closeFiles()
 runBCP()
+metricslib.end(metricsFileBase)
+metricslib.writeSummary(diagFile)
+diagFile.close()
 sys.exit(0)
 
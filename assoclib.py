@@ -7,7 +7,7 @@
 #
 # Purpose:
 #
-#	Some common routines for association loads
+#       Some common routines for association loads
 #
 # Requirements Satisfied by This Program:
 #
@@ -23,70 +23,232 @@
 #
 # Assumes:
 #
-#	That no one else is adding records to the database.
+#       That no one else is adding records to the database.
 #
 # Bugs:
 #
 # Implementation:
 #
+#       The panes of each pix ID are held in imagePanes.  Without a pane
+#       label, the pane of a pix ID is its only pane, or its unlabeled
+#       pane (findPane).  The original verifyImage() took the first pane
+#       of any image instead; now an image with several panes and no
+#       unlabeled pane needs a pane label:  verifyImage() reports
+#       "Invalid Pane" and returns 0, and imageDict does not contain the
+#       pix ID.
+#
 
 import sys
 import os
-import string
 import db
-import accessionlib
+import inputlib
+import lookuplib
+import cachelib
+import keymaplib
+import metricslib
 
 #globals
 
 TAB = '\t'
 pixPrefix = 'PIX:'
-pixMgiType = 'Image'
-imageDict = {}	 # dictionary of pix id/image pane key
+pixMgiTypeKey = 9
+pixLogicalDBKey = 19
+imagePanes = keymaplib.KeyGroups(pixPrefix)     # pix ID : [(pane label, image pane key), ...] ([] if invalid)
+
+# Purpose:  read-only view of imagePanes in the original imageDict format
+#           (pix ID : image pane key, the pane verifyImage() returns
+#           without a pane label; see findPane), for the loads that read
+#           assoclib.imageDict
+# Assumes:  nothing
+
+class ImageDict:
+
+    def get(self, pixID, default = None):
+
+        paneKey = findPane(pixID, None)
+
+        if paneKey is None:
+            return default
+
+        return paneKey
+
+    def __getitem__(self, pixID):
+
+        paneKey = self.get(pixID)
+
+        if paneKey is None:
+            raise KeyError(pixID)
+
+        return paneKey
+
+    def __contains__(self, pixID):
+        return self.get(pixID) is not None
+
+imageDict = ImageDict()          # pix ID : image pane key (valid pix IDs only)
+
+# Purpose:  finds the image pane of a pix ID that has been loaded
+# Returns:  the primary key of the image pane, or None
+# Assumes:  nothing
+# Effects:  if paneLabel is given, returns the pane with that label;
+#       else returns the image's only pane, or its unlabeled pane.
+# Throws:
+
+def findPane(
+    pixID,              # pix accession ID; PIX:#### (string)
+    paneLabel           # pane label (string or None)
+    ):
+
+    paneKeys = imagePanes.getValues(pixID)
+
+    if paneKeys is None or len(paneKeys) == 0:
+        return None
+
+    if paneLabel == '':
+        paneLabel = None
+
+    if paneLabel is None and len(paneKeys) == 1:
+        return paneKeys[0]
 
-# Purpose:  verifies the pix ID
+    return imagePanes.find(pixID, paneLabel)
+
+# Purpose:  verifies the pix ID (and pane label)
 # Returns:  the primary key of the image pane or 0 if invalid
 # Assumes:  nothing
-# Effects:  verifies that the Image Pane exists by checking the imageDict
-#	dictionary for the pix ID or the database.
-#	writes to the error file if the Image Pane is invalid.
-#	adds the Pix ID/Key to the global imageDict dictionary if the
-#	Image is valid.
+# Effects:  verifies that the Image Pane exists by checking the
+#       imagePanes map, loading it from the
+#       database (verifyImages) if the pix ID has not been seen.
+#       the pane is found by findPane().
+#       writes to the error file if the Image Pane is invalid.
 # Throws:
 
 def verifyImage(
-    pixID,          # pix accession ID; PIX:#### (string)
-    lineNum,	    # line number (integer)
+    pixID,              # pix accession ID; PIX:#### (string)
+    lineNum,            # line number (integer)
+    errorFile,          # the error file to write to
+    paneLabel = None    # pane label (string)
+    ):
+
+    pixID = pixPrefix + pixID
+
+    if pixID not in imagePanes:
+        loadPanes([pixID])
+
+    paneKeys = imagePanes.getValues(pixID)
+
+    if len(paneKeys) == 0:
+        if errorFile is not None:
+            errorFile.write('Invalid Reference (%d): %s\n' % (lineNum, pixID))
+        return 0
+
+    paneKey = findPane(pixID, paneLabel)
+
+    if paneKey is not None:
+        return paneKey
+
+    if paneLabel == '':
+        paneLabel = None
+
+    if errorFile is not None:
+        errorFile.write('Invalid Pane (%d): %s %s\n' % (lineNum, pixID, paneLabel))
+
+    return 0
+
+# Purpose:  loads the image panes of a set of pix IDs, one query per batch
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  adds each pix ID, with its panes, to the global imagePanes map
+#       the panes of pix IDs in the lookup cache (cachelib) are not
+#       queried; the panes that are queried are cached
+#       adds to the loadPanes timing and counters (metricslib)
+# Throws:
+
+def loadPanes(
+    pixIDs          # pix accession IDs; PIX:#### (iterable of strings)
+    ):
+
+    metricslib.startTimer('loadPanes')
+
+    pixIDs = set([pixID for pixID in pixIDs if pixID not in imagePanes])
+
+    # pix ID : [[pane label, image pane key], ...]
+    cached = cachelib.getValues('pix', pixIDs)
+
+    for pixID, panes in cached.items():
+        imagePanes.setGroup(pixID, panes)
+
+    pixIDs = pixIDs - set(cached.keys())
+    found = {}
+
+    for inList in lookuplib.sqlInBatches(pixIDs):
+        results = db.sql('''
+            select a.accID, p.paneLabel, p._ImagePane_key
+            from ACC_Accession a, IMG_ImagePane p
+            where a.accID in (%s)
+            and a._LogicalDB_key = %d
+            and a._MGIType_key = %d
+            and a._Object_key = p._Image_key
+            order by p._ImagePane_key
+            ''' % (inList, pixLogicalDBKey, pixMgiTypeKey), 'auto')
+        for r in results:
+            paneLabel = r['paneLabel']
+            if paneLabel == '':
+                paneLabel = None
+            found.setdefault(r['accID'], []).append([paneLabel, r['_ImagePane_key']])
+        metricslib.incr('panesLoaded', len(results))
+
+    # invalid pix IDs get an empty group, so that they are not queried again
+
+    for pixID in pixIDs:
+        imagePanes.setGroup(pixID, found.get(pixID, []))
+
+    cachelib.putValues('pix', found)
+
+    metricslib.incr('pixIDsLoaded', len(pixIDs))
+    metricslib.stopTimer('loadPanes')
+
+# Purpose:  verifies a set of pix IDs with one query per batch
+# Returns:  list of the pix IDs (PIX:####) that are invalid
+# Assumes:  nothing
+# Effects:  loads the image panes of the pix IDs (loadPanes), so that
+#       verifyImage() does not go back to the database for them.
+#       writes each line with an invalid pix ID to the error file,
+#       in line order.
+# Throws:
+
+def verifyImages(
+    records,        # (line number, pix accession ID; ####) (iterable)
     errorFile       # the error file to write to
     ):
 
-    global imageDict
+    records = [(lineNum, pixPrefix + pixID) for lineNum, pixID in records]
 
-    pixID = pixPrefix + pixID
+    loadPanes([pixID for lineNum, pixID in records])
+
+    invalid = set()
+
+    for lineNum, pixID in sorted(records):
+        if len(imagePanes.getValues(pixID)) > 0:
+            continue
+        invalid.add(pixID)
+        if errorFile is not None:
+            errorFile.write('Invalid Reference (%d): %s\n' % (lineNum, pixID))
 
-    if imageDict.has_key(pixID):
-        imagePaneKey = imageDict[pixID]
-    else:
-        imageKey = accessionlib.get_Object_key(pixID, pixMgiType)
-        if imageKey is None:
-	    if errorFile is not None:
-                errorFile.write('Invalid Reference (%d): %s\n' % (lineNum, pixID))
-	    imagePaneKey = 0
-        else:
-	    results = db.sql('select _ImagePane_key from IMG_ImagePane where _Image_key = %s' % (imageKey), 'auto')
-	    imagePaneKey = results[0]['_ImagePane_key']
-            imageDict[pixID] = imagePaneKey
-
-    return imagePaneKey
+    return sorted(invalid)
+
+# Purpose:  reads the pixel file (pix file name/pix ID)
+# Returns:  dictionary of pix file name/pix ID
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:
 
 def readPixelFile(fp):
 
     pixelDict = {}
 
-    for line in fp.readlines():
-	tokens = string.split(line[:-1], TAB)
-	pixFileName = tokens[0]
-	pixID = tokens[1]
-	pixelDict[pixFileName] = pixID
+    for lineNum, tokens in inputlib.readRecords(fp, 2):
+        pixFileName = tokens[0]
+        pixID = tokens[1]
+        pixelDict[pixFileName] = pixID
 
     return pixelDict
 
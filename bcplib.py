@@ -0,0 +1,399 @@
+#!/usr/local/bin/python
+
+#
+# Program: bcplib.py
+#
+# Purpose:
+#
+#       Some common routines for writing bcp files
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#       bcplib.openBCPFile('IMG_Image', '/data/loads/IMG_Image.bcp')
+#       bcplib.writeBCPRow('IMG_Image', (imageKey, classKey, ...))
+#       bcplib.closeBCPFiles()
+#       results = bcplib.runBCPCommands(commands, dependencies, diagFile)
+#
+#       or, to COPY the rows straight into the database (no bcp files):
+#
+#       bcplib.openBCPFile('IMG_Image', None)
+#       ...
+#       results = bcplib.copyBCPFiles(['IMG_Image', ...], connection, diagFile)
+#
+# Envvars:
+#
+# Inputs:
+#
+# Outputs:
+#
+#       One bcp file per table
+#
+# Exit Codes:
+#
+# Assumes:
+#
+# Bugs:
+#
+# Implementation:
+#
+#       Rows are built with a single join of the field tuple and are
+#       held in a per-table buffer that is written out every
+#       bufferRows rows.
+#
+#       Field values are formatted like mgi_utils.prvalue():
+#       None is written as an empty (null) field, anything else as str().
+#
+#       runBCPCommands() starts each bcp command as soon as the tables it
+#       depends on (foreign keys) have loaded, so independent tables are
+#       loaded concurrently.
+#
+#       appendBCPFile() adds the rows of another bcp file (e.g. one
+#       written by a worker process) to a table, as they are.
+#
+#       A table opened without a file name is held in a spooled temporary
+#       file (in memory up to spoolSize bytes) instead of a bcp file, and
+#       copyBCPFiles() sends it to PostgreSQL with COPY ... FROM STDIN,
+#       over the caller's connection (e.g. lookuplib.getConnection()), so
+#       that bcplib does not depend on the db modules.  All tables are copied in one transaction, in the order given.
+#       A spool that has spilled to disk copies as fast as one held in
+#       memory, so spoolSize is kept small.
+#
+
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import concurrent.futures
+import metricslib
+
+#globals
+
+TAB = '\t'
+CRT = '\n'
+
+bufferRows = 10000          # number of rows held before writing
+fileBuffering = 1048576     # file buffer size (bytes)
+spoolSize = 16777216        # in-memory size of a COPY spool before it spills to disk (bytes)
+
+# table : {'fileName' : bcp file name,
+#          'fp' : file descriptor,
+#          'rows' : buffered rows,
+#          'rowCount' : number of rows written}
+
+bcpFiles = {}
+
+# Purpose:  opens the bcp file for a table
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  creates/truncates fileName
+#           if offset is given, keeps the first offset bytes (rowCount
+#           rows) of fileName and appends to them (see syncBCPFile())
+#           if fileName is None, the rows are spooled for copyBCPFiles()
+# Throws:   IOError if the file cannot be opened
+
+def openBCPFile(
+    table,          # table name (string)
+    fileName,       # bcp file name (string) or None
+    offset = None,  # size of the existing bcp file to keep (integer)
+    rowCount = 0    # number of rows in the kept part (integer)
+    ):
+
+    if fileName is None:
+        fp = tempfile.SpooledTemporaryFile(max_size = spoolSize, mode = 'w+')
+    elif offset is not None:
+        fp = open(fileName, 'r+', fileBuffering)
+        fp.truncate(offset)
+        fp.seek(offset)
+    else:
+        fp = open(fileName, 'w', fileBuffering)
+
+    if offset is None:
+        rowCount = 0
+
+    bcpFiles[table] = {
+        'fileName' : fileName,
+        'fp' : fp,
+        'rows' : [],
+        'rowCount' : rowCount
+        }
+
+# Purpose:  adds a row to the bcp file for a table
+# Returns:  nothing
+# Assumes:  openBCPFile(table) has been called
+# Effects:  writes the buffered rows to the bcp file every bufferRows rows
+#           (fields are formatted as mgi_utils.prvalue() does)
+# Throws:   nothing
+
+def writeBCPRow(
+    table,          # table name (string)
+    fields          # field values (tuple)
+    ):
+
+    bcpFile = bcpFiles[table]
+    rows = bcpFile['rows']
+    rows.append(TAB.join(['' if f is None else str(f) for f in fields]))
+
+    if len(rows) >= bufferRows:
+        flushBCPFile(table)
+
+# Purpose:  writes the buffered rows for a table to its bcp file
+# Returns:  nothing
+# Assumes:  openBCPFile(table) has been called
+# Effects:  writes to the bcp file
+# Throws:   nothing
+
+def flushBCPFile(
+    table           # table name (string)
+    ):
+
+    bcpFile = bcpFiles[table]
+    rows = bcpFile['rows']
+
+    if len(rows) == 0:
+        return
+
+    bcpFile['fp'].write(CRT.join(rows) + CRT)
+    bcpFile['rowCount'] = bcpFile['rowCount'] + len(rows)
+    del rows[:]
+
+# Purpose:  writes the buffered rows of all tables to their files
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  writes to the bcp files (e.g. before a fork, so that a
+#           child process does not inherit unwritten rows)
+# Throws:   nothing
+
+def flushBCPFiles():
+
+    for table in bcpFiles:
+        if not bcpFiles[table]['fp'].closed:
+            flushBCPFile(table)
+            bcpFiles[table]['fp'].flush()
+
+# Purpose:  appends the rows of a bcp file to the bcp file for a table
+# Returns:  nothing
+# Assumes:  openBCPFile(table) has been called
+#           fileName holds rowCount rows, formatted as writeBCPRow() does
+# Effects:  writes to the bcp file
+# Throws:   IOError if fileName cannot be read
+
+def appendBCPFile(
+    table,          # table name (string)
+    fileName,       # bcp file to append (string)
+    rowCount        # number of rows in fileName (integer)
+    ):
+
+    bcpFile = bcpFiles[table]
+
+    flushBCPFile(table)
+
+    fp = open(fileName, 'r')
+    shutil.copyfileobj(fp, bcpFile['fp'], fileBuffering)
+    fp.close()
+
+    bcpFile['rowCount'] = bcpFile['rowCount'] + rowCount
+
+# Purpose:  writes the rows of a table to disk, for a checkpoint
+# Returns:  [size of the bcp file (bytes), number of rows]
+# Assumes:  openBCPFile(table) has been called with a file name
+# Effects:  writes to the bcp file and syncs it to disk
+# Throws:   IOError
+
+def syncBCPFile(
+    table           # table name (string)
+    ):
+
+    bcpFile = bcpFiles[table]
+
+    flushBCPFile(table)
+    bcpFile['fp'].flush()
+    os.fsync(bcpFile['fp'].fileno())
+
+    return [bcpFile['fp'].tell(), bcpFile['rowCount']]
+
+# Purpose:  returns the number of rows written for a table
+# Returns:  integer
+# Assumes:  openBCPFile(table) has been called
+# Effects:  nothing
+# Throws:   nothing
+
+def getRowCount(
+    table           # table name (string)
+    ):
+
+    bcpFile = bcpFiles[table]
+    return bcpFile['rowCount'] + len(bcpFile['rows'])
+
+# Purpose:  flushes and closes the bcp file for a table
+# Returns:  nothing
+# Assumes:  openBCPFile(table) has been called
+# Effects:  closes the bcp file
+# Throws:   nothing
+
+def closeBCPFile(
+    table           # table name (string)
+    ):
+
+    bcpFile = bcpFiles[table]
+
+    # spooled tables stay open until copyBCPFiles()
+
+    if bcpFile['fp'].closed or bcpFile['fileName'] is None:
+        return
+
+    flushBCPFile(table)
+    bcpFile['fp'].close()
+
+# Purpose:  flushes and closes all open bcp files
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  closes the bcp files
+# Throws:   nothing
+
+def closeBCPFiles():
+
+    for table in bcpFiles:
+        closeBCPFile(table)
+
+# Purpose:  runs one bcp command once its dependencies have loaded
+# Returns:  dictionary of table, status (exit code), elapsed (seconds),
+#           rows, output
+# Assumes:  nothing
+# Effects:  runs the bcp command
+# Throws:   nothing
+
+def runBCPCommand(
+    table,          # table name (string)
+    bcpCmd,         # bcp command (string)
+    dependencies    # futures of the tables this table depends on (list)
+    ):
+
+    result = {'table' : table, 'status' : None, 'elapsed' : 0.0, 'output' : ''}
+
+    if table in bcpFiles:
+        result['rows'] = getRowCount(table)
+    else:
+        result['rows'] = None
+
+    for d in dependencies:
+        if d.result()['status'] != 0:
+            result['output'] = 'not run; %s failed\n' % (d.result()['table'])
+            return result
+
+    startTime = time.time()
+    p = subprocess.run(bcpCmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    result['elapsed'] = time.time() - startTime
+    result['status'] = p.returncode
+    result['output'] = p.stdout
+
+    return result
+
+# Purpose:  runs the bcp commands, loading independent tables concurrently
+# Returns:  list of runBCPCommand() results, in command order
+# Assumes:  every table in dependencies[table] appears before table
+#           in commands
+# Effects:  runs the bcp commands
+#           writes each command, its exit status, runtime and row count
+#           and its output to diagFile
+# Throws:   nothing
+
+def runBCPCommands(
+    commands,       # list of (table name, bcp command)
+    dependencies,   # table : list of tables that must be loaded first
+    diagFile        # diagnostics file descriptor
+    ):
+
+    futures = {}
+    results = []
+
+    # e.g. a rerun after every table has committed (see journallib)
+
+    if len(commands) == 0:
+        return results
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers = len(commands))
+
+    for table, bcpCmd in commands:
+        diagFile.write('%s\n' % bcpCmd)
+        d = [futures[t] for t in dependencies.get(table, []) if t in futures]
+        futures[table] = executor.submit(runBCPCommand, table, bcpCmd, d)
+
+    for table, bcpCmd in commands:
+        result = futures[table].result()
+        results.append(result)
+        metricslib.addTiming('bcp ' + table, result['elapsed'])
+        diagFile.write('\nbcp %s: status %s, %.2f sec, %s rows\n%s' \
+            % (table, result['status'], result['elapsed'], result['rows'], result['output']))
+
+    executor.shutdown()
+    diagFile.flush()
+
+    return results
+
+# Purpose:  COPYs the spooled rows for each table into the database
+# Returns:  list of results (same format as runBCPCommand()), in table order
+# Assumes:  each table was opened with openBCPFile(table, None)
+#           connection is a psycopg2 connection
+# Effects:  loads the tables in one transaction; commits if every COPY
+#           succeeds, else rolls back
+#           writes each table's status, runtime and row count to diagFile
+# Throws:   nothing
+
+def copyBCPFiles(
+    tables,         # table names, in foreign key order (list)
+    connection,     # database connection
+    diagFile        # diagnostics file descriptor
+    ):
+
+    cursor = connection.cursor()
+    results = []
+    failed = 0
+
+    for table in tables:
+
+        result = {'table' : table, 'status' : None, 'elapsed' : 0.0,
+                  'rows' : getRowCount(table), 'output' : ''}
+        results.append(result)
+
+        if failed:
+            result['output'] = 'not run; transaction rolled back\n'
+            continue
+
+        flushBCPFile(table)
+        fp = bcpFiles[table]['fp']
+        fp.seek(0)
+
+        copyCmd = "copy %s from stdin with null as ''" % (table)
+        diagFile.write('%s\n' % copyCmd)
+
+        startTime = time.time()
+        try:
+            cursor.copy_expert(copyCmd, fp)
+            result['status'] = 0
+        except Exception as e:
+            result['status'] = 1
+            result['output'] = '%s\n' % (e)
+            failed = 1
+        result['elapsed'] = time.time() - startTime
+
+        fp.close()
+
+    if failed:
+        connection.rollback()
+    else:
+        connection.commit()
+
+    cursor.close()
+
+    for result in results:
+        metricslib.addTiming('copy ' + result['table'], result['elapsed'])
+        diagFile.write('\ncopy %s: status %s, %.2f sec, %s rows\n%s' \
+            % (result['table'], result['status'], result['elapsed'], result['rows'], result['output']))
+
+    diagFile.flush()
+
+    return results
+
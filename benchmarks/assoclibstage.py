@@ -0,0 +1,56 @@
+#!/usr/local/bin/python
+
+#
+# Program: assoclibstage.py
+#
+# Purpose:
+#
+#       The assoclib stage of the pipeline benchmark (pipeline.py):
+#       reads a pixel mapping file and verifies every PIX ID and pane
+#       the way the association loads do
+#
+# Usage:
+#
+#       assoclibstage.py [pixel mapping file] [output directory]
+#
+# Outputs:
+#
+#       [output directory]/assoclib.metrics.json
+#
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db
+import assoclib
+import metricslib
+
+#
+# Main
+#
+
+pixelFileName = sys.argv[1]
+outputDir = sys.argv[2]
+
+metricslib.begin(db)
+
+fp = open(pixelFileName, 'r')
+pixelDict = assoclib.readPixelFile(fp)
+fp.close()
+
+metricslib.startTimer('verifyImages')
+assoclib.verifyImages(enumerate(pixelDict.values(), 1), None)
+metricslib.stopTimer('verifyImages')
+
+metricslib.startTimer('verifyImage')
+lineNum = 0
+for pixFileName, pixID in pixelDict.items():
+    lineNum = lineNum + 1
+    if assoclib.verifyImage(pixID, lineNum, None) != 0:
+        metricslib.incr('rowsWritten')
+    metricslib.incr('rowsRead')
+metricslib.stopTimer('verifyImage')
+
+metricslib.end(os.path.join(outputDir, 'assoclib'))
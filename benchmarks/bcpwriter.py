@@ -0,0 +1,99 @@
+#!/usr/local/bin/python
+
+#
+# Program: bcpwriter.py
+#
+# Purpose:
+#
+#       Microbenchmark of bcplib.writeBCPRow() against the per-row
+#       string concatenation/write() used for ACC_Accession rows
+#
+# Usage:
+#
+#       bcpwriter.py [number of rows]       (default 1000000)
+#
+# Outputs:
+#
+#       rows/sec for each method to stdout
+#       the bcp files are written to a temporary directory and removed
+#
+
+import sys
+import os
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import bcplib
+
+TAB = '\t'
+CRT = '\n'
+
+accTable = 'ACC_Accession'
+loaddate = '10/18/2026'
+createdByKey = 1001
+
+# Purpose:  writes rows by string concatenation, one write() per row
+# Returns:  nothing
+
+def writeConcat(fileName, numRows):
+
+    fp = open(fileName, 'w')
+
+    for i in range(numRows):
+        fp.write(str(i) + TAB + \
+            'MGI:' + str(i) + TAB + \
+            'MGI:' + TAB + \
+            str(i) + TAB + \
+            '1' + TAB + \
+            str(i) + TAB + \
+            '9' + TAB + \
+            '0' + TAB + \
+            '1' + TAB + \
+            str(createdByKey) + TAB + \
+            str(createdByKey) + TAB + \
+            loaddate + TAB + loaddate + CRT)
+
+    fp.close()
+
+# Purpose:  writes rows with bcplib
+# Returns:  nothing
+
+def writeBCPLib(fileName, numRows):
+
+    bcplib.openBCPFile(accTable, fileName)
+
+    for i in range(numRows):
+        bcplib.writeBCPRow(accTable, (i, 'MGI:' + str(i), 'MGI:', i, '1', i, '9', '0', '1',
+            createdByKey, createdByKey, loaddate, loaddate))
+
+    bcplib.closeBCPFile(accTable)
+
+#
+# Main
+#
+
+if len(sys.argv) > 1:
+    numRows = int(sys.argv[1])
+else:
+    numRows = 1000000
+
+tmpDir = tempfile.mkdtemp()
+results = {}
+
+for name, writer in (('concat', writeConcat), ('bcplib', writeBCPLib)):
+    fileName = os.path.join(tmpDir, name + '.bcp')
+    startTime = time.perf_counter()
+    writer(fileName, numRows)
+    elapsed = time.perf_counter() - startTime
+    results[name] = fileName
+    print('%-8s %10d rows %8.2f sec %12.0f rows/sec' % (name, numRows, elapsed, numRows / elapsed))
+
+if open(results['concat']).read() != open(results['bcplib']).read():
+    print('bcp files differ')
+
+for fileName in results.values():
+    os.remove(fileName)
+os.rmdir(tmpDir)
+
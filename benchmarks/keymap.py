@@ -0,0 +1,239 @@
+#!/usr/local/bin/python
+
+#
+# Program: keymap.py
+#
+# Purpose:
+#
+#       Benchmark of the keymaplib maps against the dictionaries they
+#       replace:  memory use, build time and lookup time of
+#
+#       imagePix        PIX ID : _Image_key (gxdimageload.py)
+#       panes           PIX:#### : panes, (PIX:####, pane label) : pane
+#                       key (the imageDict/paneDict dictionaries that
+#                       assoclib.py imagePanes replaces)
+#       figures         (J-number, figure label) : pane key of one large
+#                       reference (assocResultImage.py), against a
+#                       KeyGroups group per J-number
+#
+# Usage:
+#
+#       keymap.py [-n entries] [-p max panes] [-g percent GUDMAP]
+#                 [-f figures] [-o output file]
+#
+#       -n      number of images (default 1000000)
+#       -p      maximum number of panes per image (default 3)
+#       -g      percent of the images with non-numeric (GUDMAP) IDs
+#               (default 0)
+#       -f      number of figures of the reference, of 2 panes each,
+#               both with the figure's label (default 20000)
+#       -o      json results file (default: none)
+#
+# Outputs:
+#
+#       One line per structure to stdout:  KB held after the build
+#       (tracemalloc), seconds to build, microseconds per lookup
+#
+# Implementation:
+#
+#       The memory of a structure is what tracemalloc reports as held
+#       once it is built, including the key strings the dictionaries keep
+#       (the input lines they came from are not kept).  Lookups go
+#       through every key once, in random order, with newly built key
+#       strings, as a load does.
+#
+
+import sys
+import os
+import getopt
+import json
+import random
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import keymaplib
+
+pixBase = 100000        # PIX ID of image 0
+
+# Purpose:  returns the PIX ID of image i
+
+def pixID(i, gudmap):
+    if i % 100 < gudmap:
+        return 'GUDMAP:%d' % (i)
+    return str(pixBase + i)
+
+# Purpose:  returns the panes of image i
+
+def panes(i, maxPanes):
+    n = 1 + (i * 7919) % maxPanes
+    if n == 1:
+        return [(None, i * 32)]
+    return [(chr(ord('A') + j), i * 32 + j) for j in range(n)]
+
+# Purpose:  builds a structure, measuring its memory and build time
+#           (timed without tracemalloc, which slows allocation down)
+# Returns:  (structure, KB, seconds)
+
+def measureBuild(build):
+
+    startTime = time.time()
+    structure = build()
+    elapsed = time.time() - startTime
+    del structure
+
+    tracemalloc.start()
+    structure = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return structure, current // 1024, elapsed
+
+# Purpose:  times a lookup function over all images in random order
+# Returns:  microseconds per lookup
+
+def measureLookup(lookup, order):
+
+    startTime = time.time()
+    for i in order:
+        lookup(i)
+    elapsed = time.time() - startTime
+
+    return 1000000.0 * elapsed / len(order)
+
+#
+# Main
+#
+
+try:
+    opts, args = getopt.getopt(sys.argv[1:], 'n:p:g:f:o:')
+except getopt.GetoptError as e:
+    sys.stderr.write('%s\n' % (e))
+    sys.exit(1)
+
+numImages = 1000000
+maxPanes = 3
+gudmap = 0
+numFigures = 20000
+outputFileName = None
+
+for opt, value in opts:
+    if opt == '-n':
+        numImages = int(value)
+    elif opt == '-p':
+        maxPanes = int(value)
+    elif opt == '-g':
+        gudmap = int(value)
+    elif opt == '-f':
+        numFigures = int(value)
+    elif opt == '-o':
+        outputFileName = value
+
+order = list(range(numImages))
+random.Random(numImages).shuffle(order)
+
+results = {'images' : numImages, 'maxPanes' : maxPanes, 'gudmapPercent' : gudmap,
+    'figures' : numFigures,
+    'date' : time.strftime('%Y-%m-%d %H:%M:%S'), 'structures' : {}}
+
+# imagePix
+
+def buildDict():
+    m = {}
+    for i in range(numImages):
+        m[pixID(i, gudmap)] = i + 1
+    return m
+
+def buildKeyMap():
+    m = keymaplib.KeyMap()
+    for i in range(numImages):
+        m[pixID(i, gudmap)] = i + 1
+    return m
+
+for name, build in (('imagePix dict', buildDict), ('imagePix KeyMap', buildKeyMap)):
+    m, kb, seconds = measureBuild(build)
+    usec = measureLookup(lambda i: m.get(pixID(i, gudmap)), order)
+    results['structures'][name] = {'KB' : kb, 'buildSeconds' : round(seconds, 3), 'lookupUsec' : round(usec, 3)}
+    del m
+
+# assoclib panes:  the only pane, or the pane with a label
+
+def buildPaneDicts():
+    imageDict = {}
+    paneDict = {}
+    for i in range(numImages):
+        p = 'PIX:' + pixID(i, gudmap)
+        imageDict[p] = []
+        for label, key in panes(i, maxPanes):
+            imageDict[p].append(key)
+            paneDict[(p, label)] = key
+    return imageDict, paneDict
+
+def lookupPaneDicts(dicts, i):
+    imageDict, paneDict = dicts
+    p = 'PIX:' + pixID(i, gudmap)
+    if len(imageDict[p]) == 1:
+        return imageDict[p][0]
+    return paneDict[(p, 'A')]
+
+def buildKeyGroups():
+    g = keymaplib.KeyGroups('PIX:')
+    for i in range(numImages):
+        g.setGroup('PIX:' + pixID(i, gudmap), panes(i, maxPanes))
+    return g
+
+def lookupKeyGroups(g, i):
+    p = 'PIX:' + pixID(i, gudmap)
+    paneKeys = g.getValues(p)
+    if len(paneKeys) == 1:
+        return paneKeys[0]
+    return g.find(p, 'A')
+
+for name, build, lookup in (('panes dict', buildPaneDicts, lookupPaneDicts),
+                            ('panes KeyGroups', buildKeyGroups, lookupKeyGroups)):
+    s, kb, seconds = measureBuild(build)
+    usec = measureLookup(lambda i: lookup(s, i), order)
+    results['structures'][name] = {'KB' : kb, 'buildSeconds' : round(seconds, 3), 'lookupUsec' : round(usec, 3)}
+    del s
+
+# assocResultImage figures:  the pane of a figure label of one reference
+
+figureOrder = list(range(numFigures))
+random.Random(numFigures).shuffle(figureOrder)
+
+def figures():
+    return [('Fig %d' % (i), i * 2 + j) for i in range(numFigures) for j in range(2)]
+
+def buildFigureDict():
+    m = {}
+    for label, key in figures():
+        m[('J:1000', label)] = key
+    return m
+
+def lookupFigureDict(m, i):
+    return m.get(('J:1000', 'Fig %d' % (i)))
+
+def buildFigureGroups():
+    g = keymaplib.KeyGroups('J:')
+    g.setGroup('J:1000', figures())
+    return g
+
+def lookupFigureGroups(g, i):
+    return g.find('J:1000', 'Fig %d' % (i))
+
+for name, build, lookup in (('figures dict', buildFigureDict, lookupFigureDict),
+                            ('figures KeyGroups', buildFigureGroups, lookupFigureGroups)):
+    s, kb, seconds = measureBuild(build)
+    usec = measureLookup(lambda i: lookup(s, i), figureOrder)
+    results['structures'][name] = {'KB' : kb, 'buildSeconds' : round(seconds, 3), 'lookupUsec' : round(usec, 3)}
+    del s
+
+for name, r in results['structures'].items():
+    print('%-18s %10d KB %8.2f sec build %8.3f usec/lookup' % (name, r['KB'], r['buildSeconds'], r['lookupUsec']))
+
+if outputFileName is not None:
+    fp = open(outputFileName, 'w')
+    json.dump(results, fp, indent = 1, sort_keys = True)
+    fp.write('\n')
+    fp.close()
@@ -0,0 +1,324 @@
+#!/usr/local/bin/python
+
+#
+# Program: pipeline.py
+#
+# Purpose:
+#
+#       Benchmark of the image load pipeline on synthetic data:
+#       generates image, image pane, result/image and pixel mapping
+#       files, runs each stage as a subprocess and reports rows/sec,
+#       peak RSS and the number of queries of each stage
+#
+# Usage:
+#
+#       pipeline.py [-i images] [-p max panes] [-s stages] [-l latency]
+#                   [-d data directory] [-o output file] [--db] [--snapshot]
+#                   [--cache]
+#
+#       -i      number of images (default 1000; e.g. 1000 to 1000000)
+#       -p      maximum number of panes per image; each image has
+#               1..max panes (default 1; e.g. 1 to 20)
+#       -s      comma-separated stages (default: all)
+#               gxdimageload, assocResultImage, gudmapimageAssoc, assoclib
+#       -l      seconds added to each stub query (default 0)
+#       -d      directory for the data and the stages' output files
+#               (default: a temporary directory, removed afterwards)
+#       -o      json results file (default: pipeline-<date>.json)
+#       --db    use the db/loadlib/mgi_utils modules on PYTHONPATH (a
+#               local PostgreSQL loaded with matching data) instead of
+#               the stubs in benchmarks/stubs
+#       --snapshot
+#               run gxdimageload.py as an offline preview, from a snapshot
+#               of the synthetic data (IMAGELOADSNAPSHOT; see lookuplib.py)
+#       --cache use the lookup cache (LOOKUPCACHE; see cachelib.py) in
+#               the data directory; rerun with the same -d to measure
+#               the stages with a warm cache
+#
+# Envvars:
+#
+#       With --db, the MGD_DB* settings of the database
+#
+# Outputs:
+#
+#       One line per stage to stdout, and the json results file:
+#
+#       {"images" : ..., "maxPanes" : ..., "db" : "stub" | "local", "snapshot", "cache",
+#        "date" : ..., "stages" : {stage : {"rows", "seconds",
+#        "rowsPerSec", "peakRSSKB", "queries", "status"}}}
+#
+# Bugs:
+#
+#       bcp commands always go to the stub bcpin.csh, so nothing is
+#       loaded, even with --db.  gxdimageload.py runs in preview mode
+#       with --db; gudmapimageAssoc.py still reserves accession keys, so
+#       use a scratch database.
+#
+# Implementation:
+#
+#       The stub db module answers the queries from the data layout in
+#       stubs/benchdata.py, which the generator also uses.
+#
+#       Peak RSS is the ru_maxrss of each stage's process (os.wait4);
+#       the number of queries is the statement count in the stage's
+#       metrics file (metricslib.py).
+#
+
+import sys
+import os
+import getopt
+import json
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+stubDir = os.path.join(benchDir, 'stubs')
+repoDir = os.path.dirname(benchDir)
+
+sys.path.insert(0, stubDir)
+
+import benchdata
+
+TAB = '\t'
+CRT = '\n'
+
+allStages = ['gxdimageload', 'assocResultImage', 'gudmapimageAssoc', 'assoclib']
+
+copyrightNote = 'Questions regarding this image or its use in publications should be directed ' + \
+    'to the author. This image is from Smith J et al., Development 2009 Apr;136(7):1101-12.'
+imageNote = 'Whole-mount in situ hybridization of an E10.5 embryo, lateral view. ' + \
+    'Expression is detected in the forelimb bud and the somites.'
+
+# Purpose:  writes the synthetic input files
+# Returns:  dictionary of file kind : file name
+
+def generateFiles(dataDir, numImages, maxPanes):
+
+    rng = random.Random(numImages)
+
+    files = {
+        'image' : os.path.join(dataDir, 'image.txt'),
+        'pane' : os.path.join(dataDir, 'imagepane.txt'),
+        'resultImage' : os.path.join(dataDir, 'resultimage.txt'),
+        'pixel' : os.path.join(dataDir, 'pixel.txt'),
+        }
+
+    imageFile = open(files['image'], 'w')
+    paneFile = open(files['pane'], 'w')
+    resultFile = open(files['resultImage'], 'w')
+    pixelFile = open(files['pixel'], 'w')
+
+    for i in range(numImages):
+
+        pixID = str(benchdata.pixID(i))
+        jnum = benchdata.jNumber(i)
+        figureLabel = benchdata.figureLabel(i)
+        xdim = rng.randint(200, 4000)
+        ydim = rng.randint(200, 4000)
+
+        if i % 3 == 0:
+            imageInfo = '105|IMG%07d' % (i)
+        else:
+            imageInfo = ''
+
+        imageFile.write(TAB.join([jnum, '', 'Expression', pixID, str(xdim), str(ydim),
+            figureLabel, copyrightNote, imageNote, imageInfo]) + CRT)
+
+        n = benchdata.numPanes(i, maxPanes)
+        for p in range(n):
+            paneFile.write(TAB.join([pixID, benchdata.paneLabel(p, n),
+                str(xdim // n), str(ydim)]) + CRT)
+
+        # one result per image; 1 in 50 has a figure label that is not loaded
+
+        if i % 50 == 49:
+            resultFile.write(TAB.join([jnum, str(i + 1), figureLabel + 'x']) + CRT)
+        else:
+            resultFile.write(TAB.join([jnum, str(i + 1), figureLabel]) + CRT)
+
+        pixelFile.write('image%07d.jpg' % (i) + TAB + pixID + CRT)
+
+    imageFile.close()
+    paneFile.close()
+    resultFile.close()
+    pixelFile.close()
+
+    return files
+
+# Purpose:  returns the command, environment, working directory, metrics
+#           file base and number of input rows of a stage
+# Returns:  (command, env, cwd, metrics file base, rows)
+
+def stageCommand(stage, files, outDir, numImages, useDB, useSnapshot, useCache):
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = repoDir
+    if not useDB:
+        env['PYTHONPATH'] = stubDir + os.pathsep + repoDir
+    env.setdefault('MGD_DBUSER', 'bench')
+    env.setdefault('MGD_DBPASSWORDFILE', '/dev/null')
+    env['PG_DBUTILS'] = stubDir
+    env['CREATEDBY'] = env.get('CREATEDBY', 'bench')
+    if useCache:
+        env['LOOKUPCACHE'] = os.path.join(outDir, 'lookupcache.db')
+
+    stageDir = os.path.join(outDir, stage)
+    os.makedirs(stageDir, exist_ok = True)
+
+    if stage == 'gxdimageload':
+        env['IMAGELOADMODE'] = 'preview' if useDB or useSnapshot else 'load'
+        if useSnapshot:
+            env['IMAGELOADSNAPSHOT'] = files['snapshot']
+        env['IMAGELOADDATADIR'] = stageDir
+        env['COPYRIGHTFILE'] = os.path.join(stageDir, 'IMG_Copyright.in')
+        env['CAPTIONFILE'] = os.path.join(stageDir, 'IMG_Caption.in')
+        env['IMAGEFILE'] = files['image']
+        env['IMAGEPANEFILE'] = files['pane']
+        env['QUALIFIER_FULLSIZE'] = 'bench'
+        return ([sys.executable, os.path.join(repoDir, 'gxdimageload.py')], env, stageDir,
+                os.path.join(stageDir, 'gxdimageload'), numImages)
+
+    if stage == 'assocResultImage':
+        env['RESULT_IMAGE_FILE'] = files['resultImage']
+        env.pop('REFERENCE', None)
+        env['RESULT_IMAGE_BATCH'] = '1'
+        return ([sys.executable, os.path.join(repoDir, 'assocResultImage.py')], env, stageDir,
+                os.path.join(stageDir, 'assocResultImage'), numImages)
+
+    if stage == 'gudmapimageAssoc':
+        env['IMAGE_ACCESSION'] = os.path.join(stageDir, 'ACC_Accession_Image.bcp')
+        env['REFERENCE'] = benchdata.jNumber(0)
+        env['GUDMAP_LOGICALDB'] = '163'
+        return ([sys.executable, os.path.join(repoDir, 'gudmapimageAssoc.py')], env, stageDir,
+                os.path.join(stageDir, 'gudmapimageAssoc'), numImages)
+
+    if stage == 'assoclib':
+        return ([sys.executable, os.path.join(benchDir, 'assoclibstage.py'), files['pixel'], stageDir],
+                env, stageDir, os.path.join(stageDir, 'assoclib'), numImages)
+
+    raise ValueError('Unknown stage: %s' % (stage))
+
+# Purpose:  runs one stage as a subprocess
+# Returns:  dictionary of rows, seconds, rowsPerSec, peakRSSKB, queries, status
+
+def runStage(stage, files, outDir, numImages, useDB, useSnapshot, useCache):
+
+    cmd, env, cwd, metricsBase, rows = stageCommand(stage, files, outDir, numImages, useDB, useSnapshot, useCache)
+
+    logFile = open(os.path.join(cwd, stage + '.log'), 'w')
+
+    startTime = time.time()
+    p = subprocess.Popen(cmd, env = env, cwd = cwd, stdout = logFile, stderr = subprocess.STDOUT)
+    pid, status, rusage = os.wait4(p.pid, 0)
+    elapsed = time.time() - startTime
+    p.returncode = os.waitstatus_to_exitcode(status)
+
+    logFile.close()
+
+    queries = None
+    if os.path.exists(metricsBase + '.metrics.json'):
+        metrics = json.load(open(metricsBase + '.metrics.json'))
+        queries = sum([s['count'] for s in metrics.get('statements', {}).values()])
+
+    return {
+        'rows' : rows,
+        'seconds' : round(elapsed, 3),
+        'rowsPerSec' : round(rows / max(elapsed, 0.001), 1),
+        'peakRSSKB' : rusage.ru_maxrss,
+        'queries' : queries,
+        'status' : p.returncode
+        }
+
+#
+# Main
+#
+
+try:
+    opts, args = getopt.getopt(sys.argv[1:], 'i:p:s:l:d:o:', ['db', 'snapshot', 'cache'])
+except getopt.GetoptError as e:
+    sys.stderr.write('%s\n' % (e))
+    sys.exit(1)
+
+numImages = 1000
+maxPanes = 1
+stages = allStages
+latency = '0'
+dataDir = None
+outputFileName = 'pipeline-%s.json' % (time.strftime('%Y%m%d-%H%M%S'))
+useDB = 0
+useSnapshot = 0
+useCache = 0
+
+for opt, value in opts:
+    if opt == '-i':
+        numImages = int(value)
+    elif opt == '-p':
+        maxPanes = int(value)
+    elif opt == '-s':
+        stages = value.split(',')
+    elif opt == '-l':
+        latency = value
+    elif opt == '-d':
+        dataDir = value
+    elif opt == '-o':
+        outputFileName = value
+    elif opt == '--db':
+        useDB = 1
+    elif opt == '--snapshot':
+        useSnapshot = 1
+    elif opt == '--cache':
+        useCache = 1
+
+# the stub db module reads the data layout from the environment
+
+os.environ['BENCH_IMAGES'] = str(numImages)
+os.environ['BENCH_MAX_PANES'] = str(maxPanes)
+os.environ['BENCH_SQL_LATENCY'] = latency
+
+if dataDir is None:
+    outDir = tempfile.mkdtemp()
+else:
+    outDir = dataDir
+    os.makedirs(outDir, exist_ok = True)
+
+startTime = time.time()
+files = generateFiles(outDir, numImages, maxPanes)
+
+files['snapshot'] = os.path.join(outDir, 'snapshot.json')
+fp = open(files['snapshot'], 'w')
+json.dump(benchdata.snapshot(os.environ.get('CREATEDBY', 'bench')), fp)
+fp.close()
+print('generated %d images in %.2f sec (%s)' % (numImages, time.time() - startTime, outDir))
+
+results = {
+    'images' : numImages,
+    'maxPanes' : maxPanes,
+    'latency' : float(latency),
+    'db' : 'local' if useDB else 'stub',
+    'snapshot' : useSnapshot,
+    'cache' : useCache,
+    'date' : time.strftime('%Y-%m-%d %H:%M:%S'),
+    'stages' : {}
+    }
+
+for stage in stages:
+    r = runStage(stage, files, outDir, numImages, useDB, useSnapshot, useCache)
+    results['stages'][stage] = r
+    print('%-18s %8d rows %8.2f sec %10.0f rows/sec %8d KB %6s queries  status %s' \
+        % (stage, r['rows'], r['seconds'], r['rowsPerSec'], r['peakRSSKB'], r['queries'], r['status']))
+
+fp = open(outputFileName, 'w')
+json.dump(results, fp, indent = 1, sort_keys = True)
+fp.write(CRT)
+fp.close()
+
+if dataDir is None:
+    shutil.rmtree(outDir)
+
+failed = [s for s in stages if results['stages'][s]['status'] != 0]
+if len(failed) > 0:
+    sys.stderr.write('failed: %s\n' % (', '.join(failed)))
+    sys.exit(1)
@@ -0,0 +1,88 @@
+#
+# Program: benchdata.py
+#
+# Purpose:
+#
+#       Layout of the synthetic data shared by the benchmark data
+#       generator (pipeline.py) and the stub db module, so that the
+#       stub answers the queries the way a database holding the
+#       generated images would
+#
+# Envvars:
+#
+#       BENCH_IMAGES            number of images
+#       BENCH_MAX_PANES         maximum number of panes per image
+#
+
+import os
+
+#globals
+
+numImages = int(os.environ.get('BENCH_IMAGES', '1000'))
+maxPanes = int(os.environ.get('BENCH_MAX_PANES', '1'))
+
+pixBase = 100000        # PIX ID of image 0
+refBase = 1000          # J: number of the first reference
+imagesPerRef = 50       # images per reference (figure labels Fig 0..49)
+
+# Purpose:  returns the PIX ID of image i
+
+def pixID(i):
+    return pixBase + i
+
+# Purpose:  returns the J: of image i
+
+def jNumber(i):
+    return 'J:%d' % (refBase + i // imagesPerRef)
+
+# Purpose:  returns the figure label of image i
+
+def figureLabel(i):
+    return 'Fig %d' % (i % imagesPerRef)
+
+# Purpose:  returns the number of panes of image i (1..maxPanes,
+#           spread evenly)
+
+def numPanes(i, maxPanes = maxPanes):
+    return 1 + (i * 7919) % maxPanes
+
+# Purpose:  returns the label of pane j of an image with n panes
+
+def paneLabel(j, n):
+    if n == 1:
+        return ''
+    return chr(ord('A') + j)
+
+# Purpose:  returns the _Image_key of image i
+
+def imageKey(i):
+    return i + 1
+
+# Purpose:  returns the _ImagePane_key of pane j of image i
+
+def paneKey(i, j):
+    return (i + 1) * 32 + j
+
+# Purpose:  returns the images of a reference (J: number)
+
+def refImages(refNumber):
+    first = (refNumber - refBase) * imagesPerRef
+    return range(max(first, 0), min(first + imagesPerRef, numImages))
+
+# Purpose:  returns the lookuplib snapshot of a database holding the
+#           synthetic data (gxdimageload.py IMAGELOADSNAPSHOT); the
+#           images are not in it, as the stub db module does not have
+#           them either
+
+def snapshot(createdBy):
+    numRefs = (numImages + imagesPerRef - 1) // imagesPerRef
+    return {
+        'date' : '',
+        'server' : 'benchserver',
+        'database' : 'benchdb',
+        'users' : {createdBy : 1001},
+        'terms' : {'83' : {'Expression' : 6481781}},
+        'references' : dict([('J:%d' % (refBase + r), refBase + r) for r in range(numRefs)]),
+        'images' : [],
+        'keys' : {},
+        }
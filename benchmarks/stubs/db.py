@@ -0,0 +1,166 @@
+#
+# Program: db.py
+#
+# Purpose:
+#
+#       Stub of the MGI db module for the pipeline benchmark
+#       (benchmarks/pipeline.py): answers the loads' queries from the
+#       synthetic data layout (benchdata.py) instead of a database
+#
+# Envvars:
+#
+#       BENCH_SQL_LATENCY       seconds added to each query (default 0)
+#
+# Bugs:
+#
+#       Only the queries the image loads run are answered; any other
+#       select returns no rows.
+#
+
+import os
+import re
+import time
+import benchdata
+
+#globals
+
+latency = float(os.environ.get('BENCH_SQL_LATENCY', '0'))
+
+literalPattern = re.compile(r"'((?:[^']|'')*)'")
+
+def useOneConnection(value):
+    pass
+
+def set_sqlUser(user):
+    pass
+
+def set_sqlPasswordFromFile(fileName):
+    pass
+
+def get_sqlServer():
+    return 'benchserver'
+
+def get_sqlDatabase():
+    return 'benchdb'
+
+def setTrace(value = True):
+    pass
+
+def commit():
+    pass
+
+# Purpose:  returns the rows a database holding the synthetic data
+#           would return for cmd
+
+def sql(cmd, mode = 'auto'):
+
+    if latency > 0:
+        time.sleep(latency)
+
+    c = ' '.join(cmd.split())
+    literals = literalPattern.findall(c)
+
+    # keylib
+
+    if 'setval' in c or 'is_called' in c or 'ACC_AccessionMax' in c:
+        return [{'firstKey' : 1}]
+
+    # cachelib:  table stamps
+
+    if 'from pg_stat_all_tables' in c:
+        return [{'changes' : benchdata.numImages}]
+
+    # gudmapimageAssoc.py:  the number of image panes of the reference
+    # (see Cursor.execute)
+
+    if 'GXD_InSituResultImage' in c:
+        return [{'rowCount' : sum([benchdata.numPanes(i) for i in range(benchdata.numImages)])}]
+
+    # image class terms
+
+    if 'from VOC_Term' in c:
+        return [{'_Term_key' : 6481781, 'term' : t} for t in literals if t == 'Expression']
+
+    # assocResultImage.py:  panes of the references
+
+    if 'IMG_ImagePane ip' in c:
+        rows = []
+        for j in literals:
+            if not j.startswith('J:') or not j[2:].isdigit():
+                continue
+            for i in benchdata.refImages(int(j[2:])):
+                for p in range(benchdata.numPanes(i)):
+                    rows.append({'accID' : j, 'figureLabel' : benchdata.figureLabel(i),
+                                 '_ImagePane_key' : benchdata.paneKey(i, p)})
+        return rows
+
+    # assoclib:  panes of the PIX IDs
+
+    if 'IMG_ImagePane p' in c:
+        rows = []
+        for a in literals:
+            if not a.startswith('PIX:'):
+                continue
+            i = int(a[4:]) - benchdata.pixBase
+            if i < 0 or i >= benchdata.numImages:
+                continue
+            n = benchdata.numPanes(i)
+            for p in range(n):
+                rows.append({'accID' : a, 'paneLabel' : benchdata.paneLabel(p, n),
+                             '_ImagePane_key' : benchdata.paneKey(i, p)})
+        return rows
+
+    # references
+
+    if 'from ACC_Accession' in c and "'J:'" in c:
+        return [{'accID' : j, '_Object_key' : int(j[2:])} for j in literals if j.startswith('J:') and j[2:].isdigit()]
+
+    return []
+
+#
+# psycopg2-like connection for lookuplib.sqlStream and bcplib.copyBCPFiles
+#
+
+class Cursor:
+
+    def __init__(self):
+        self.itersize = 0
+        self.description = None
+        self.rows = iter([])
+
+    # gudmapimageAssoc.py:  the images of the reference, one row per pane
+
+    def execute(self, cmd):
+        if latency > 0:
+            time.sleep(latency)
+        self.description = [('_image_key',), ('figurelabel',)]
+        self.rows = ((benchdata.imageKey(i), 'GUDMAP:%d' % (i))
+                     for i in range(benchdata.numImages) for p in range(benchdata.numPanes(i)))
+
+    def fetchmany(self, size):
+        rows = []
+        for row in self.rows:
+            rows.append(row)
+            if len(rows) == size:
+                break
+        return rows
+
+    def copy_expert(self, cmd, fp):
+        while fp.read(1048576):
+            pass
+
+    def close(self):
+        pass
+
+class Connection:
+
+    def cursor(self, name = None):
+        return Cursor()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+sharedDbConnection = Connection()
@@ -0,0 +1,25 @@
+#
+# Program: loadlib.py
+#
+# Purpose:
+#
+#       Stub of the MGI loadlib module for the pipeline benchmark
+#       (benchmarks/pipeline.py)
+#
+
+#globals
+
+loaddate = '10/18/2026'
+
+def verifyUser(user, lineNum, errorFile):
+    return 1001
+
+def verifyTerm(termID, vocabKey, term, lineNum, errorFile):
+    if term == 'Expression':
+        return 6481781
+    return 0
+
+def verifyReference(jnum, lineNum, errorFile):
+    if jnum.startswith('J:') and jnum[2:].isdigit():
+        return int(jnum[2:])
+    return 0
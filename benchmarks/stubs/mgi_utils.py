@@ -0,0 +1,13 @@
+#
+# Program: mgi_utils.py
+#
+# Purpose:
+#
+#       Stub of the MGI mgi_utils module for the pipeline benchmark
+#       (benchmarks/pipeline.py)
+#
+
+import time
+
+def date(format = '%c'):
+    return time.strftime(format)
@@ -0,0 +1,234 @@
+#!/usr/local/bin/python
+
+#
+# Program: cachelib.py
+#
+# Purpose:
+#
+#       A persistent lookup cache shared by the image loads, so that
+#       repeated loads against the same references, terms, users and
+#       PIX IDs skip most of their lookup queries
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#       cached = cachelib.getValues('reference', jnums)
+#       ... look up the jnums that are not in cached ...
+#       cachelib.putValues('reference', found)
+#
+# Envvars:
+#
+#       LOOKUPCACHE             the cache file (SQLite); if empty or not
+#                               set, nothing is cached
+#       LOOKUPCACHETTL          seconds a cached value is used for
+#                               (default 604800, a week:  well above
+#                               the daily load, since the stamps catch
+#                               changes; it only bounds what they miss)
+#
+# Inputs:
+#
+# Outputs:
+#
+#       The cache file
+#
+# Exit Codes:
+#
+# Assumes:
+#
+# Bugs:
+#
+#       The statistics counters are updated by each session after its
+#       transactions end, up to a minute late (about 10 seconds for a
+#       session that has gone idle), so a change made just before a run
+#       may only be seen by a later run.  A TRUNCATE is not counted; it
+#       is only seen once the TTL has expired.
+#
+# Implementation:
+#
+#       Each kind of lookup has the tables its values are read from
+#       (stampTables), with the changes to each table that can change a
+#       cached value:  since only valid values are cached, inserts only
+#       matter where they add to a cached value (e.g. a new pane of a
+#       cached image).  The first time a kind is used in a run, those
+#       counters of each table are read from pg_stat_all_tables (the
+#       stamp), a catalog lookup that does not scan the table; if the
+#       stamp differs from the one stored with the cached values, the
+#       values of that kind are discarded.  A statistics reset changes
+#       the stamp, so it only discards the cache.
+#
+#       Values are stored as json; only values that were found (valid)
+#       are cached, so invalid keys are always looked up again.
+#
+
+import os
+import time
+import json
+import sqlite3
+import db
+import metricslib
+
+#globals
+
+cacheFileName = os.environ.get('LOOKUPCACHE', '')
+ttl = float(os.environ.get('LOOKUPCACHETTL', '604800'))
+
+batchSize = 500         # number of keys per cache query
+
+# kind : list of (table, pg_stat_all_tables counters) the values are
+# read from; 'term:<_Vocab_key>' uses the 'term' tables
+
+changed = 'n_tup_upd + n_tup_del'                   # updates, deletes
+added = 'n_tup_ins + n_tup_upd + n_tup_del'         # and inserts
+
+stampTables = {
+    'reference' : [('ACC_Accession', changed)],
+    'term' : [('VOC_Term', changed)],
+    'user' : [('MGI_User', changed)],
+    'pix' : [('ACC_Accession', changed),
+             ('IMG_ImagePane', added)],
+    'figure' : [('ACC_Accession', changed),
+                ('IMG_Image', changed),
+                ('IMG_ImagePane', added)],
+    }
+
+connection = None       # sqlite3 connection
+checked = set()         # kinds whose stamp has been checked in this run
+
+# Purpose:  opens the cache file, creating it if needed
+# Returns:  sqlite3 connection, or None if there is no cache
+# Assumes:  nothing
+# Effects:  removes the values whose TTL has expired
+# Throws:   nothing
+
+def openCache():
+
+    global connection
+
+    if connection is not None or cacheFileName == '':
+        return connection
+
+    connection = sqlite3.connect(cacheFileName, timeout = 60)
+    connection.execute('''
+        create table if not exists lookup (
+            kind text, key text, value text, loaded real,
+            primary key (kind, key))
+        ''')
+    connection.execute('''
+        create table if not exists stamp (
+            kind text primary key, stamp text)
+        ''')
+    connection.execute('delete from lookup where loaded < ?', (time.time() - ttl,))
+    connection.commit()
+
+    return connection
+
+# Purpose:  returns the stamp of the tables of a kind of lookup
+# Returns:  string
+# Assumes:  db connection
+# Effects:  queries the database statistics (not the tables)
+# Throws:   KeyError if the kind has no stampTables entry
+
+def getStamp(
+    kind            # kind of lookup (string)
+    ):
+
+    name, sep, arg = kind.partition(':')
+    stamps = []
+
+    for table, counters in stampTables[name]:
+        results = db.sql('''
+            select %s as changes
+            from pg_stat_all_tables
+            where relid = '%s'::regclass
+            ''' % (counters, table), 'auto')
+        if len(results) == 0:
+            stamps.append('')
+        else:
+            stamps.append(str(results[0]['changes']))
+
+    return '|'.join(stamps)
+
+# Purpose:  discards the cached values of a kind if its tables have
+#           changed since they were cached
+# Returns:  nothing
+# Assumes:  the cache is open
+# Effects:  queries the database once per kind per run
+# Throws:   nothing
+
+def checkStamp(
+    kind            # kind of lookup (string)
+    ):
+
+    if kind in checked:
+        return
+
+    checked.add(kind)
+
+    stamp = getStamp(kind)
+
+    row = connection.execute('select stamp from stamp where kind = ?', (kind,)).fetchone()
+
+    if row is not None and row[0] == stamp:
+        return
+
+    connection.execute('delete from lookup where kind = ?', (kind,))
+    connection.execute('insert or replace into stamp values (?, ?)', (kind, stamp))
+    connection.commit()
+    metricslib.incr('cacheInvalidations')
+
+# Purpose:  returns the cached values of a set of keys
+# Returns:  dictionary of key : value, of the keys that are cached
+# Assumes:  nothing
+# Effects:  see checkStamp
+#           adds to the cacheHits, cacheMisses counters (metricslib)
+# Throws:   nothing
+
+def getValues(
+    kind,           # kind of lookup (string)
+    keys            # keys (iterable of strings)
+    ):
+
+    keys = sorted(set(keys))
+    values = {}
+
+    if openCache() is None or len(keys) == 0:
+        return values
+
+    checkStamp(kind)
+
+    oldest = time.time() - ttl
+
+    for i in range(0, len(keys), batchSize):
+        batch = keys[i:i + batchSize]
+        cmd = 'select key, value from lookup where kind = ? and loaded >= ? and key in (%s)' \
+            % (','.join(['?'] * len(batch)))
+        for key, value in connection.execute(cmd, [kind, oldest] + batch):
+            values[key] = json.loads(value)
+
+    metricslib.incr('cacheHits', len(values))
+    metricslib.incr('cacheMisses', len(keys) - len(values))
+
+    return values
+
+# Purpose:  caches a set of values
+# Returns:  nothing
+# Assumes:  the values are valid (see Implementation)
+# Effects:  writes to the cache file
+# Throws:   nothing
+
+def putValues(
+    kind,           # kind of lookup (string)
+    values          # dictionary of key (string) : value (json-able)
+    ):
+
+    if openCache() is None or len(values) == 0:
+        return
+
+    checkStamp(kind)
+
+    loaded = time.time()
+
+    connection.executemany('insert or replace into lookup values (?, ?, ?, ?)',
+        [(kind, key, json.dumps(value), loaded) for key, value in values.items()])
+    connection.commit()
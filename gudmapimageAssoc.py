@@ -20,6 +20,8 @@
 #      REFERENCE
 #      CREATEDBY
 #      GUDMAP_LOGICALDB
+#      LOOKUPCACHE, LOOKUPCACHETTL (optional lookup cache; see cachelib.py)
+#      LOADPROFILE (1 to run under cProfile; see metricslib.py)
 #
 #  Inputs:  None
 #
@@ -27,6 +29,9 @@
 #
 #      ACC_Accession_Image.bcp
 #
+#      gudmapimageAssoc.metrics.json (in the IMAGE_ACCESSION directory);
+#      phase timings, SQL statement counts/timings (see metricslib.py)
+#
 #  Exit Codes:
 #
 #      0:  Successful completion
@@ -40,10 +45,13 @@
 
 import sys
 import os
-import string
 import db
 import mgi_utils
 import loadlib
+import bcplib
+import keylib
+import lookuplib
+import metricslib
 
 #
 #  CONSTANTS
@@ -52,6 +60,8 @@ BCP_DELIM = '\t'
 
 FULLSIZE_IMAGE_TYPE_KEY = 1072158
 
+ACC_TABLE = 'ACC_Accession'
+
 IMAGE_MGITYPE_KEY = '9'
 ACC_PRIVATE = '0'
 ACC_PREFERRED = '1'
@@ -68,6 +78,8 @@ jNumber = os.environ['REFERENCE']
 createdBy = os.environ['CREATEDBY']
 logicalDBKey = os.environ['GUDMAP_LOGICALDB']
 
+metricsFileBase = os.path.join(os.path.dirname(imageAccFile), 'gudmapimageAssoc')
+
 createdByKey = 0
 refKey = 0
 accKey = 0
@@ -81,8 +93,9 @@ accKey = 0
 # Throws: Nothing
 #
 def init ():
-    global createdByKey, refKey, accKey
+    global createdByKey, refKey
 
+    metricslib.begin(db)
     db.useOneConnection(1)
     db.set_sqlUser(user)
     db.set_sqlPasswordFromFile(passwordFile)
@@ -90,18 +103,15 @@ def init ():
     #
     # Get the created by key for the user.
     #
-    createdByKey = loadlib.verifyUser(createdBy, 0, None)
+    createdByKey = lookuplib.lookupUser(createdBy, None)
 
     #
     # Get the reference key for the J-Number.
     #
-    refKey = loadlib.verifyReference(jNumber, 0, None)
-
-    #
-    # Get the next available accession key.
-    #
-    results = db.sql('select max(_Accession_key) + 1 as maxKey from ACC_Accession', 'auto')
-    accKey = results[0]['maxKey']
+    refKey = lookuplib.lookupReferences([jNumber])[jNumber]
+    if refKey == 0:
+        sys.stderr.write('Invalid Reference: ' + jNumber + '\n')
+        sys.exit(1)
 
     return
 
@@ -114,13 +124,12 @@ def init ():
 # Throws: Nothing
 #
 def openFiles ():
-    global fpImageAccFile
 
     #
     # Open the output file.
     #
     try:
-        fpImageAccFile = open(imageAccFile, 'w')
+        bcplib.openBCPFile(ACC_TABLE, imageAccFile)
     except:
         sys.stderr.write('Cannot open output file: ' + imageAccFile + '\n')
         sys.exit(1)
@@ -140,16 +149,16 @@ def bcpFiles ():
 
     db.commit()
 
-    fpImageAccFile.close()
+    bcplib.closeBCPFiles()
 
     bcpI = '%s %s %s' % (bcpScript, db.get_sqlServer(), db.get_sqlDatabase())
     bcpII = '"\\t" "\\n" mgd'
 
-    accTable = 'ACC_Accession'
-
-    bcpCmd = '%s %s "/" %s %s' % (bcpI, accTable, imageAccFile, bcpII)
+    bcpCmd = '%s %s "/" %s %s' % (bcpI, ACC_TABLE, imageAccFile, bcpII)
 
+    metricslib.startTimer('bcp')
     os.system(bcpCmd)
+    metricslib.stopTimer('bcp')
 
     return
 
@@ -164,58 +173,89 @@ def bcpFiles ():
 def process ():
     global accKey
 
+    metricslib.startTimer('process')
+
     #
     # Get all the figure labels and image keys for each fullsize image
-    # that has been loaded for the reference.
+    # that has been loaded for the reference, one per image pane that is
+    # not yet associated with any in situ result of the reference (an
+    # image with several such panes gets a record for each, as before).
+    #
+    # The associated panes are computed once (not per candidate pane)
+    # and removed with an anti-join; the results are streamed in
+    # batches from a server-side cursor.
     #
-    results = db.sql('''
-	select i._Image_key, i.figureLabel
-	from IMG_Image i, IMG_ImagePane ii, ACC_Accession a
-	where i._Refs_key = 172505
-	and i._Image_key = ii._Image_key
-	and i._Image_key = a._Object_key 
-	and a._MGIType_key = 9 
-	and a._LogicalDB_key = 19
-	and not exists (select 1
-    	from GXD_Assay a, GXD_Specimen s, GXD_InSituResult isr, GXD_InSituResultImage p 
-    	where i._Refs_key = a._Refs_key 
-    	and a._AssayType_key in (1,6,9,10,11) 
-    	and a._Assay_key = s._Assay_key 
-    	and s._Specimen_key = isr._Specimen_key 
-    	and isr._Result_key = p._Result_key
-    	and ii._ImagePane_key = p._ImagePane_key
-	)
-    	''', 'auto')
+    query = '''
+        with associated as (
+        select distinct p._ImagePane_key
+        from GXD_Assay a, GXD_Specimen s, GXD_InSituResult isr, GXD_InSituResultImage p
+        where a._Refs_key = %d
+        and a._AssayType_key in (1,6,9,10,11)
+        and a._Assay_key = s._Assay_key
+        and s._Specimen_key = isr._Specimen_key
+        and isr._Result_key = p._Result_key
+        )
+        select %s
+        from IMG_Image i, IMG_ImagePane ii, ACC_Accession a
+        where i._Refs_key = %d
+        and i._Image_key = ii._Image_key
+        and i._Image_key = a._Object_key
+        and a._MGIType_key = 9
+        and a._LogicalDB_key = 19
+        and not exists (select 1 from associated x where x._ImagePane_key = ii._ImagePane_key)
+        %s
+        '''
 
     #
-    # Create an accession record for each fullsize image.
+    # Count the records first and reserve their accession keys before
+    # any record is written, so the keys are not taken by another
+    # process while the results are streamed.
+    #
+    results = db.sql(query % (refKey, 'count(*) as rowCount', refKey, ''), 'auto')
+    rowCount = results[0]['rowCount']
+
+    if rowCount == 0:
+        metricslib.stopTimer('process')
+        return
+
+    firstKey = keylib.reserveAccessionKeys(rowCount)
+    accKey = firstKey
+
+    results = lookuplib.sqlStream(query % (refKey,
+        'i._Image_key, i.figureLabel', refKey, 'order by i._Image_key, ii._ImagePane_key'), 'gudmapimages')
+
+    #
+    # Create an accession record for each fullsize image pane.
     #
     for r in results:
 
+        #
+        # Images loaded for the reference since the count have no
+        # reserved key; stop before anything is loaded.
+        #
+        if accKey - firstKey == rowCount:
+            sys.stderr.write('Images were loaded for %s during the run; %d keys reserved\n' % (jNumber, rowCount))
+            sys.exit(1)
+
         imageKey = r['_Image_key']
         figureLabel = r['figureLabel']
 
         #
         # The figure label is used for the acc ID (e.g. "GUDMAP:10").
         #
-        accID = figureLabel;
-	prefixPart, numericPart = string.split(accID, ':')
+        accID = figureLabel
+        prefixPart, numericPart = accID.split(':')
         prefixPart = prefixPart + ':'
 
-        fpImageAccFile.write(str(accKey) + '\t' +
-                             accID + '\t' +
-                             prefixPart + '\t' +
-                             numericPart + '\t' +
-                             str(logicalDBKey) + '\t' +
-                             str(imageKey) + '\t' +
-                             IMAGE_MGITYPE_KEY + '\t' +
-                             ACC_PRIVATE + '\t' +
-                             ACC_PREFERRED + '\t' +
-                             str(createdByKey) + '\t' +
-                             str(createdByKey) + '\t' +
-                             loaddate + '\t' + loaddate + '\n')
+        bcplib.writeBCPRow(ACC_TABLE, (accKey, accID, prefixPart, numericPart,
+                           logicalDBKey, imageKey, IMAGE_MGITYPE_KEY,
+                           ACC_PRIVATE, ACC_PREFERRED,
+                           createdByKey, createdByKey, loaddate, loaddate))
         accKey += 1
 
+    metricslib.incr('rowsWritten', accKey - firstKey)
+    metricslib.stopTimer('process')
+
     return
 
 
@@ -227,4 +267,5 @@ init()
 openFiles()
 process()
 bcpFiles()
+metricslib.end(metricsFileBase)
 
@@ -16,6 +16,20 @@
 #
 # Envvars:
 #
+#       IMAGELOADMODE           load, stream (COPY, no bcp files) or preview
+#       IMAGELOADDELTA          if 1, skip the images that are already in
+#                               IMG_Image (see Implementation); default 0
+#       IMAGELOADSNAPSHOT       preview mode only:  a snapshot file
+#                               (imagesnapshot.py) to resolve the lookups
+#                               from instead of the database
+#       IMAGELOADWORKERS        if > 1, the number of processes the image
+#                               file is processed with (see
+#                               Implementation); default 1
+#       LOOKUPCACHE             the lookup cache file (see cachelib.py);
+#                               optional
+#       LOOKUPCACHETTL          seconds a cached lookup is used for
+#       LOADPROFILE             if 1, run under cProfile (see metricslib.py)
+#
 # Inputs:
 #
 #       Image file, a tab-delimited file in the format:
@@ -52,6 +66,13 @@
 #       Diagnostics file of all input parameters and SQL commands
 #       Error file
 #
+#       gxdimageload.metrics.json       phase timings, SQL statement
+#                                       counts/timings (see metricslib.py)
+#       gxdimageload.prof               cProfile statistics (LOADPROFILE=1)
+#
+#       gxdimageload.journal            checkpoint journal (load/stream);
+#                                       removed when the load completes
+#
 # Exit Codes:
 #
 # Assumes:
@@ -62,6 +83,64 @@
 #
 # Implementation:
 #
+#       The input files are validated (gxdimagevalidate.py) before any
+#       output is written; if there are errors, all of them are written
+#       to the error file and the load stops.
+#
+#       Delta mode (IMAGELOADDELTA=1):
+#
+#       The (reference, figure label, PIX ID) of the existing images of
+#       the references in the image file are loaded with one query.  An
+#       input line whose triple exists is unchanged and is skipped, along
+#       with its image panes.  A line whose reference already has an
+#       image with the same figure label or the same PIX ID is changed;
+#       it is loaded as a new image and reported in the diagnostics file
+#       with the existing image key.  Any other line is inserted.
+#
+#       Offline preview (IMAGELOADSNAPSHOT):
+#
+#       The references, image class terms, user, existing images (delta
+#       mode) and next keys are read from the snapshot (see lookuplib.py),
+#       and no database connection is made, so a load can be validated
+#       and sized without MGD.  The MGD_DB* and PG_DBUTILS settings are
+#       not needed.
+#
+#       Sharded processing (IMAGELOADWORKERS > 1):
+#
+#       The image file is read into shards of shardLines lines, each
+#       processed by a worker process while the next one is read.  The
+#       rows a line emits (and so the keys it takes) follow from its
+#       reference, image class, PIX ID and LogicalDB|Image AccID fields,
+#       so the key ranges of each shard are computed when it is read.
+#       Each worker writes its shard's bcp, note, error and diagnostic
+#       lines to shard files (IMAGELOADDATADIR/gxdimageload.shard#.*),
+#       which are appended to the output files in input order, so the
+#       output is the same as when the file is processed by one process.
+#       All shards are appended before each row checkpoint.  The image
+#       pane file is processed by one process.
+#
+#       Checkpoint journal (IMAGELOADDATADIR/gxdimageload.journal):
+#
+#       The reserved key ranges, a checkpoint of the rows written every
+#       checkpointInterval input lines (and at an invalid line), and each
+#       bcp/copy that has committed are journaled.  If the load fails, a
+#       rerun reuses the reserved keys, skips the input lines that have
+#       already been turned into rows (the bcp and note files are cut
+#       back to the checkpoint) and does not reload the tables that have
+#       committed.
+#
+#       A checkpoint is only used if the input lines it covers have not
+#       changed, so a bad line can be fixed before the rerun; if the
+#       fixed files need more keys than were reserved, the load starts
+#       over.  Once a table has committed, the input files must not
+#       change.  Rows are only checkpointed in load mode (in stream mode
+#       they are not written to disk).
+#
+#       The PIX ID : _Image_key map that the pane file is resolved
+#       against holds every image of the load; it is a keymaplib.KeyMap,
+#       which holds a numeric PIX ID in 16 bytes instead of a dictionary
+#       entry's ~100.
+#
 # History
 #
 # 02/14/2016    sc
@@ -90,20 +169,34 @@
 import sys
 import os
 import string
+import glob
+import shutil
+import multiprocessing
+import concurrent.futures
 import db
 import mgi_utils
 import loadlib
+import inputlib
+import bcplib
+import keylib
+import lookuplib
+import keymaplib
+import journallib
+import gxdimagevalidate
+import metricslib
 
 #globals
 
 #
 # from configuration file
 #
-user = os.environ['MGD_DBUSER']
-passwordFileName = os.environ['MGD_DBPASSWORDFILE']
+user = os.environ.get('MGD_DBUSER', '')
+passwordFileName = os.environ.get('MGD_DBPASSWORDFILE', '')
 
 mode = os.environ['IMAGELOADMODE']
-bcpCommand = os.environ['PG_DBUTILS'] + '/bin/bcpin.csh '
+deltaMode = os.environ.get('IMAGELOADDELTA', '0') == '1'
+snapshotFileName = os.environ.get('IMAGELOADSNAPSHOT', '')
+bcpCommand = os.environ.get('PG_DBUTILS', '') + '/bin/bcpin.csh '
 currentDir = os.environ['IMAGELOADDATADIR']
 createdBy = os.environ['CREATEDBY']
 
@@ -132,11 +225,8 @@ inPaneFile = ''          # file descriptor
 
 # output files
 
-outImageFile = ''       # file descriptor
 outCopyrightFile = ''   # file descriptor
 outCaptionFile = ''     # file descriptor
-outPaneFile = ''        # file descriptor
-outAccFile = ''         # file descriptor
 
 imageTable = 'IMG_Image'
 paneTable = 'IMG_ImagePane'
@@ -155,6 +245,13 @@ outAccFileName = currentDir + '/' + aFileName
 diagFileName = ''       # diagnostic file name
 errorFileName = ''      # error file name
 
+# checkpoint journal
+
+journalFileName = currentDir + '/gxdimageload.journal'
+checkpointInterval = 10000      # input lines between row checkpoints
+checkpoint = None       # row checkpoint the load resumes from
+newImagePix = {}        # imagePix entries since the last row checkpoint
+
 # primary keys
 
 imageKey = 0            # IMG_Image._Image_key
@@ -163,6 +260,12 @@ accKey = 0              # ACC_Accession._Accession_key
 mgiKey = 0              # ACC_AccessionMax.maxNumericPart
 createdByKey = ''
 
+# number of rows the load will emit (see prefetchLookups)
+
+imageCount = 0          # IMG_Image rows
+paneCount = 0           # IMG_ImagePane rows
+accCount = 0            # ACC_Accession rows
+
 # accession constants
 
 imageMgiTypeKey = '9'   # Image
@@ -179,7 +282,27 @@ FSimageTypeKey = 1072158        # Full Size Image Type key
 
 # dictionaries to cache data for quicker lookup
 
-imagePix = {}
+imagePix = keymaplib.KeyMap()  # PIX ID : _Image_key
+imageClassLookup = {}   # image class term : _Term_key (0 if invalid)
+referenceLookup = {}    # J: : _Refs_key (0 if invalid)
+
+# delta mode
+
+existingImages = set()  # (_Refs_key, figure label, PIX accID) of the existing images
+existingLabels = {}     # (_Refs_key, figure label) : _Image_key
+existingPix = {}        # (_Refs_key, PIX accID) : _Image_key
+unchangedPix = set()    # PIX IDs of the unchanged input lines
+deltaCounts = {'inserted' : 0, 'unchanged' : 0, 'changed' : 0}
+
+# sharded processing
+
+numWorkers = int(os.environ.get('IMAGELOADWORKERS', '1'))
+shardLines = 2500       # image lines per shard
+shardExecutor = None    # process pool (see processImageFile)
+pendingLines = []       # (line number, tokens) read but not yet in a shard
+shardFutures = []       # shards being processed, in input order:
+                        # [shard number, keys before, keys after, future]
+shardNum = 0            # number of shards submitted
 
 loaddate = loadlib.loaddate
 
@@ -198,6 +321,8 @@ def exit(
         sys.stderr.write('\n' + str(message) + '\n')
  
     try:
+        metricslib.end(currentDir + '/gxdimageload')
+        metricslib.writeSummary(diagFile)
         diagFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
         errorFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
         diagFile.close()
@@ -208,6 +333,24 @@ def exit(
     db.useOneConnection(0)
     sys.exit(status)
  
+# Purpose: reports an invalid input line and exits
+# Returns: nothing
+# Assumes: nothing
+# Effects: exits with exit status 1
+# Throws: nothing
+
+def invalidLine(
+    lineNum,         # line number (integer)
+    line             # input line (string)
+    ):
+
+    # the lines before this one are kept for the rerun
+
+    processPendingLines()
+    checkpointRows()
+
+    exit(1, 'Invalid Line (%d): %s\n' % (lineNum, line))
+ 
 # Purpose: process command line options
 # Returns: nothing
 # Assumes: nothing
@@ -219,14 +362,25 @@ def exit(
 def init():
     global bcpCommand
     global diagFile, errorFile, inputFile, errorFileName, diagFileName
-    global outImageFile, outPaneFile, outAccFile
-    global outCopyrightFile, outCaptionFile
     global inImageFile, inPaneFile
     global createdByKey
  
-    db.useOneConnection(1)
-    db.set_sqlUser(user)
-    db.set_sqlPasswordFromFile(passwordFileName)
+    metricslib.begin(db)
+    metricslib.startTimer('init')
+
+    # offline preview:  the lookups are answered by the snapshot
+    # (IMAGELOADSNAPSHOT, or one set with lookuplib.useSnapshot())
+
+    if snapshotFileName != '':
+        try:
+            lookuplib.openSnapshot(snapshotFileName)
+        except:
+            exit(1, 'Could not read snapshot file %s\n' % snapshotFileName)
+
+    if lookuplib.snapshot is None:
+        db.useOneConnection(1)
+        db.set_sqlUser(user)
+        db.set_sqlPasswordFromFile(passwordFileName)
  
     bcpCommand = bcpCommand + db.get_sqlServer() + ' ' + db.get_sqlDatabase() + ' %s ' + currentDir + ' %s "\\t" "\\n" mgd'
 
@@ -255,42 +409,23 @@ def init():
     except:
         exit(1, 'Could not open file %s\n' % inPaneFileName)
 
-    # Output Files
-
-    try:
-        outImageFile = open(outImageFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % outImageFileName)
-
-    try:
-        outPaneFile = open(outPaneFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % outPaneFileName)
-
-    try:
-        outAccFile = open(outAccFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % outAccFileName)
-
-    try:
-        outCaptionFile = open(outCaptionFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % outCaptionFileName)
-
-    try:
-        outCopyrightFile = open(outCopyrightFileName, 'w')
-    except:
-        exit(1, 'Could not open file %s\n' % outCopyrightFileName)
-
     db.setTrace(True)
 
     diagFile.write('Start Date/Time: %s\n' % (mgi_utils.date()))
-    diagFile.write('Server: %s\n' % (db.get_sqlServer()))
-    diagFile.write('Database: %s\n' % (db.get_sqlDatabase()))
+    if lookuplib.snapshot is not None:
+        diagFile.write('Snapshot: %s\n' % (snapshotFileName))
+        diagFile.write('Snapshot Date/Time: %s\n' % (lookuplib.snapshot.get('date', '')))
+        diagFile.write('Server: %s\n' % (lookuplib.snapshot.get('server', '')))
+        diagFile.write('Database: %s\n' % (lookuplib.snapshot.get('database', '')))
+    else:
+        diagFile.write('Server: %s\n' % (db.get_sqlServer()))
+        diagFile.write('Database: %s\n' % (db.get_sqlDatabase()))
 
     errorFile.write('Start Date/Time: %s\n\n' % (mgi_utils.date()))
 
-    createdByKey = loadlib.verifyUser(createdBy, 0, errorFile)
+    createdByKey = lookuplib.lookupUser(createdBy, errorFile)
+
+    metricslib.stopTimer('init')
 
     return
 
@@ -303,35 +438,411 @@ def init():
 
 def verifyMode():
 
-    global DEBUG
+    global DEBUG, bcpon
 
     if mode == 'preview':
         DEBUG = 1
         bcpon = 0
-    elif mode != 'load':
+    elif mode not in ('load', 'stream'):
         exit(1, 'Invalid Processing Mode:  %s\n' % (mode))
 
+    # keys cannot be reserved from a snapshot
+
+    if lookuplib.snapshot is not None and mode != 'preview':
+        exit(1, 'IMAGELOADSNAPSHOT is only valid in preview mode\n')
+
+# Purpose:  validates the input files
+# Returns:  nothing
+# Assumes:  inImageFile, inPaneFile are open
+# Effects:  writes every error to the error file and exits if there
+#           are any
+# Throws:   nothing
+
+def validateInput():
+
+    metricslib.startTimer('validate')
+
+    errors = gxdimagevalidate.validateFiles(inImageFile, inPaneFile)
+
+    for e in errors:
+        errorFile.write(e + CRT)
+
+    diagFile.write('Validation errors: %d\n' % (len(errors)))
+
+    metricslib.stopTimer('validate')
+
+    if len(errors) > 0:
+        exit(1, 'Invalid input files (%d errors); see %s\n' % (len(errors), errorFileName))
+
+# Purpose:  reads the checkpoint journal of an earlier, failed load
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  opens the journal (not in preview mode)
+#           sets global checkpoint, imagePix if the rows written up to
+#           the last checkpoint can be kept
+#           exits if tables have committed from different input files
+# Throws:   nothing
+
+def readJournal():
+
+    global checkpoint, imagePix
+
+    if DEBUG:
+        return
+
+    try:
+        journallib.openJournal(journalFileName)
+    except:
+        exit(1, 'Could not open file %s\n' % journalFileName)
+
+    for e in journallib.getEntries('bcp'):
+        if not journallib.checkInput(inImageFileName, e['image'][0], e['image'][1], 1) or \
+           not journallib.checkInput(inPaneFileName, e['pane'][0], e['pane'][1], 1):
+            exit(1, '%s has committed from different input files; remove %s to load them\n' \
+                % (e['table'], journalFileName))
+
+    rows = journallib.getEntries('rows')
+
+    if mode != 'load' or len(rows) == 0:
+        return
+
+    last = rows[-1]
+
+    if journallib.checkInput(inImageFileName, last['image'][0], last['image'][1]) and \
+       journallib.checkInput(inPaneFileName, last['pane'][0], last['pane'][1]):
+        checkpoint = last
+        for e in rows:
+            imagePix.update(e['imagePix'])
+        diagFile.write('Resuming at image line %d, image pane line %d (%s)\n' \
+            % (last['image'][0], last['pane'][0], journalFileName))
+    else:
+        diagFile.write('Input files changed; not resuming (%s)\n' % (journalFileName))
+        discardCheckpoint()
+
+# Purpose:  discards the journaled rows; the load starts over
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  sets global checkpoint, imagePix
+#           writes a restart entry to the journal (keeping the
+#           reserved keys, see setPrimaryKeys)
+# Throws:   nothing
+
+def discardCheckpoint():
+
+    global checkpoint, imagePix
+
+    keys = journallib.getEntry('keys')
+
+    journallib.writeEntry({'stage' : 'restart'})
+    if keys is not None:
+        journallib.writeEntry(keys)
+
+    checkpoint = None
+    imagePix = keymaplib.KeyMap()
+
+# Purpose:  writes a checkpoint of the rows written so far to the journal
+# Returns:  nothing
+# Assumes:  the output files are open
+# Effects:  syncs the bcp and note files to disk
+#           writes a rows entry to the journal
+# Throws:   nothing
+
+def checkpointRows():
+
+    global newImagePix
+
+    if DEBUG or mode != 'load' or journallib.journalFile is None:
+        return
+
+    image = journallib.getInputState('image')
+    pane = journallib.getInputState('pane')
+
+    last = journallib.getEntry('rows')
+    if last is not None and last['image'] == image and last['pane'] == pane:
+        return
+
+    files = {}
+
+    for table in (imageTable, paneTable, accTable):
+        files[table] = bcplib.syncBCPFile(table)
+
+    for name, fp in (('copyright', outCopyrightFile), ('caption', outCaptionFile)):
+        fp.flush()
+        os.fsync(fp.fileno())
+        files[name] = [fp.tell(), 0]
+
+    journallib.writeEntry({'stage' : 'rows', 'image' : image, 'pane' : pane, 'files' : files,
+        'keys' : [imageKey, paneKey, accKey, mgiKey], 'imagePix' : newImagePix})
+
+    newImagePix = {}
+
 # Purpose:  sets global primary key variables
 # Returns:  nothing
 # Assumes:  nothing
 # Effects:  sets global primary key variables
+#           reuses the keys reserved by an earlier, failed load if the
+#           load still fits in them; else reserves new keys and
+#           journals them
 # Throws:   nothing
 
 def setPrimaryKeys():
 
     global imageKey, paneKey, accKey, mgiKey
+    global imageCount, paneCount, accCount
+
+    metricslib.startTimer('setPrimaryKeys')
+
+    keys = None
+    if not DEBUG:
+        keys = journallib.getEntry('keys')
+
+    if keys is not None and imageCount <= keys['image'][1] and \
+       paneCount <= keys['pane'][1] and accCount <= keys['acc'][1]:
+
+        imageKey, imageCount = keys['image']
+        paneKey, paneCount = keys['pane']
+        accKey, accCount = keys['acc']
+        mgiKey = keys['mgi'][0]
+        diagFile.write('Reusing the keys reserved in %s\n' % (journalFileName))
+
+    else:
+
+        if keys is not None:
+            if len(journallib.getEntries('bcp')) > 0:
+                exit(1, 'Input files need more keys than were reserved; remove %s to load them\n' \
+                    % (journalFileName))
+            if checkpoint is not None:
+                diagFile.write('Input files need more keys than were reserved; not resuming\n')
+                discardCheckpoint()
+
+        # reserve exactly the number of keys the load will emit;
+        # in preview mode nothing is reserved
+
+        reserve = not DEBUG
+
+        imageKey = keylib.reserveSequenceKeys('img_image_seq', imageCount, reserve)
+        paneKey = keylib.reserveSequenceKeys('img_imagepane_seq', paneCount, reserve)
+        accKey = keylib.reserveAccessionKeys(accCount, reserve)
+        mgiKey = keylib.reserveMGIIDs(imageCount, reserve)
+
+        if reserve:
+            journallib.writeEntry({'stage' : 'keys', 'image' : [imageKey, imageCount],
+                'pane' : [paneKey, paneCount], 'acc' : [accKey, accCount], 'mgi' : [mgiKey, imageCount]})
+
+    diagFile.write('IMG_Image keys: %s-%s\n' % (imageKey, imageKey + imageCount - 1))
+    diagFile.write('IMG_ImagePane keys: %s-%s\n' % (paneKey, paneKey + paneCount - 1))
+    diagFile.write('ACC_Accession keys: %s-%s\n' % (accKey, accKey + accCount - 1))
+    diagFile.write('MGI IDs: %s%s-%s\n' % (mgiPrefix, mgiKey, mgiKey + imageCount - 1))
+
+    # continue numbering from the checkpoint
+
+    if checkpoint is not None:
+        imageKey, paneKey, accKey, mgiKey = checkpoint['keys']
+
+    metricslib.stopTimer('setPrimaryKeys')
+
+# Purpose:  opens the output files
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  creates the bcp and note files, or cuts them back to the
+#           row checkpoint the load resumes from
+#           exits if files cannot be opened
+# Throws:   nothing
+
+def openOutputFiles():
+
+    global outCopyrightFile, outCaptionFile
+
+    # in stream mode the rows are spooled and COPY-ed (see bcpFiles)
+
+    for table, fileName in ((imageTable, outImageFileName),
+                            (paneTable, outPaneFileName),
+                            (accTable, outAccFileName)):
+        if mode == 'stream':
+            fileName = None
+        offset, rowCount = None, 0
+        if checkpoint is not None:
+            offset, rowCount = checkpoint['files'][table]
+        try:
+            bcplib.openBCPFile(table, fileName, offset, rowCount)
+        except:
+            exit(1, 'Could not open file %s\n' % fileName)
+
+    try:
+        outCaptionFile = openNoteFile(outCaptionFileName, 'caption')
+    except:
+        exit(1, 'Could not open file %s\n' % outCaptionFileName)
+
+    try:
+        outCopyrightFile = openNoteFile(outCopyrightFileName, 'copyright')
+    except:
+        exit(1, 'Could not open file %s\n' % outCopyrightFileName)
+
+# Purpose:  opens a noteload input file
+# Returns:  file descriptor
+# Assumes:  nothing
+# Effects:  creates the file, or cuts it back to the row checkpoint
+# Throws:   IOError
+
+def openNoteFile(
+    fileName,       # file name (string)
+    name            # name of the file in the row checkpoint (string)
+    ):
+
+    if checkpoint is None:
+        return open(fileName, 'w')
+
+    fp = open(fileName, 'r+')
+    fp.truncate(checkpoint['files'][name][0])
+    fp.seek(checkpoint['files'][name][0])
+
+    return fp
+
+# Purpose:  resolves all distinct Image Class terms and J-numbers in the
+#           image file using set-based queries, and counts the rows
+#           the load will emit
+# Returns:  nothing
+# Assumes:  inImageFile, inPaneFile are open
+# Effects:  sets global imageClassLookup, referenceLookup
+#           sets global imageCount, paneCount, accCount
+#           rewinds inImageFile, inPaneFile
+# Throws:   nothing
+
+def prefetchLookups():
+
+    global imageClassLookup, referenceLookup
+    global imageCount, paneCount, accCount
+
+    metricslib.startTimer('prefetchLookups')
+
+    imageClasses = set()
+    jnums = set()
+
+    # (J:, image class) : [IMG_Image rows, ACC_Accession rows]
+    rowCounts = {}
+
+    for lineNum, tokens in inputlib.readRecords(inImageFile, 1):
+
+        if len(tokens) < 3:
+            continue
+
+        jnums.add(tokens[0])
+        imageClasses.add(tokens[2])
+
+        if len(tokens) < 10:
+            continue
+
+        counts = rowCounts.setdefault((tokens[0], tokens[2]), [0, 0])
+        counts[0] = counts[0] + 1
+        counts[1] = counts[1] + countAccessions(tokens)
+
+    inImageFile.seek(0)
+
+    # errors are reported per line in processImageFile()
+
+    imageClassLookup = lookuplib.lookupTerms(imageVocabClassKey, imageClasses)
+    referenceLookup = lookuplib.lookupReferences(jnums)
+
+    # delta mode:  the unchanged lines (and their panes) emit no rows
+
+    if deltaMode:
+        loadExistingImages()
+
+    # panes are only written for the images that are loaded (a line with
+    # a valid reference and image class that is not unchanged)
+
+    loadedPix = set()
+
+    for lineNum, tokens in inputlib.readRecords(inImageFile, 10, inputlib.ignoreInvalidLine):
+        refKey = referenceLookup.get(tokens[0], 0)
+        if deltaMode and (refKey, tokens[6], getPixAccID(tokens[3])) in existingImages:
+            counts = rowCounts[(tokens[0], tokens[2])]
+            counts[0] = counts[0] - 1
+            counts[1] = counts[1] - countAccessions(tokens)
+            unchangedPix.add(tokens[3])
+        elif refKey != 0 and imageClassLookup.get(tokens[2], 0) != 0:
+            loadedPix.add(tokens[3])
+
+    inImageFile.seek(0)
 
-    results = db.sql(''' select nextval('img_image_seq') as maxKey ''', 'auto')
-    imageKey = results[0]['maxKey']
+    for lineNum, tokens in inputlib.readRecords(inPaneFile, 1):
+        if tokens[0] in loadedPix and tokens[0] not in unchangedPix:
+            paneCount = paneCount + 1
 
-    results = db.sql(''' select nextval('img_imagepane_seq') as maxKey ''', 'auto')
-    paneKey = results[0]['maxKey']
+    inPaneFile.seek(0)
 
-    results = db.sql('''select max(_Accession_key) + 1 as maxKey from ACC_Accession''', 'auto')
-    accKey = results[0]['maxKey']
+    # only lines with a valid reference and image class emit rows
 
-    results = db.sql('''select maxNumericPart + 1 as maxKey from ACC_AccessionMax where prefixPart = '%s' ''' % (mgiPrefix), 'auto')
-    mgiKey = results[0]['maxKey']
+    for (jnum, imageClass), counts in rowCounts.items():
+        if referenceLookup[jnum] != 0 and imageClassLookup[imageClass] != 0:
+            imageCount = imageCount + counts[0]
+            accCount = accCount + counts[1]
+
+    diagFile.write('Image Class terms resolved: %d\n' % (len(imageClassLookup)))
+    diagFile.write('References resolved: %d\n' % (len(referenceLookup)))
+
+    metricslib.incr('imageRows', imageCount)
+    metricslib.incr('paneRows', paneCount)
+    metricslib.incr('accessionRows', accCount)
+    metricslib.stopTimer('prefetchLookups')
+
+# Purpose:  counts the ACC_Accession rows an image line emits
+# Returns:  number of rows (integer)
+# Assumes:  tokens has 10 fields
+# Effects:  nothing
+# Throws:   nothing
+
+def countAccessions(
+    tokens          # image file fields (list of strings)
+    ):
+
+    # MGI ID, PIX ID (see getPixAccID), LogicalDB|Image AccID
+
+    count = 1
+
+    if getPixAccID(tokens[3]) != '':
+        count = count + 1
+
+    if len(tokens[9]) > 0:
+        count = count + 1
+
+    return count
+
+# Purpose:  returns the PIX accession ID the load gives an image
+# Returns:  PIX:#### or '' (GUDMAP and blank PIX IDs get none)
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   nothing
+
+def getPixAccID(
+    pixID           # PIX ID field of the image file (string)
+    ):
+
+    if pixID.find('GUDMAP') < 0 and len(pixID) > 0:
+        return pixPrefix + pixID
+
+    return ''
+
+# Purpose:  loads the existing images of the references in the image file
+# Returns:  nothing
+# Assumes:  referenceLookup has been set (prefetchLookups)
+# Effects:  sets global existingImages, existingLabels, existingPix
+# Throws:   nothing
+
+def loadExistingImages():
+
+    refKeys = set([k for k in referenceLookup.values() if k != 0])
+
+    for r in lookuplib.lookupPixImages(refKeys):
+        accID = r['accID']
+        if accID is None:
+            accID = ''
+        existingImages.add((r['_Refs_key'], r['figureLabel'], accID))
+        existingLabels[(r['_Refs_key'], r['figureLabel'])] = r['_Image_key']
+        if accID != '':
+            existingPix[(r['_Refs_key'], accID)] = r['_Image_key']
+
+    diagFile.write('Existing images: %d\n' % (len(existingImages)))
 
 # Purpose:  BCPs the data into the database
 # Returns:  nothing
@@ -339,183 +850,455 @@ def setPrimaryKeys():
 # Effects:  BCPs the data into the database
 # Throws:   nothing
 
-def bcpFiles(
-   recordsProcessed     # number of records processed (integer)
-   ):
+def bcpFiles():
 
     global referenceKey
 
+    bcplib.closeBCPFiles()
+
+    # the keys were reserved by setPrimaryKeys(); more rows than that
+    # would collide with keys handed out to someone else
+
+    for table, count in ((imageTable, imageCount), (paneTable, paneCount), (accTable, accCount)):
+        if bcplib.getRowCount(table) > count:
+            exit(1, '%s: %d rows written, %d keys reserved\n' % (table, bcplib.getRowCount(table), count))
+
     if DEBUG or not bcpon:
         return
 
-    outImageFile.close()
-    outPaneFile.close()
-    outAccFile.close()
     outCopyrightFile.close()
     outCaptionFile.close()
 
     db.commit()
 
-    bcp1 = bcpCommand % (imageTable, iFileName)
-    bcp2 = bcpCommand % (paneTable, pFileName)
-    bcp3 = bcpCommand % (accTable, aFileName)
+    # tables committed by an earlier, failed load are not loaded again
+
+    committed = [e['table'] for e in journallib.getEntries('bcp')]
+    for table in committed:
+        diagFile.write('%s: already committed (%s)\n' % (table, journalFileName))
+
+    # stream:  COPY the rows over the db connection, in one transaction
+
+    if mode == 'stream':
+        if len(committed) > 0:
+            return
+        results = bcplib.copyBCPFiles([imageTable, paneTable, accTable],
+            lookuplib.getConnection(), diagFile)
+        if len([r for r in results if r['status'] != 0]) == 0:
+            for r in results:
+                journalCommit(r['table'])
+        for r in results:
+            if r['status'] != 0:
+                exit(1, 'copy of %s failed; see %s\n' % (r['table'], diagFileName))
+        resetSequences()
+        return
 
-    for bcpCmd in [bcp1, bcp2, bcp3]:
-        diagFile.write('%s\n' % bcpCmd)
-        os.system(bcpCmd)
+    # IMG_ImagePane depends on IMG_Image;
+    # ACC_Accession can be loaded at the same time as both
 
-    # update the max Accession ID value
-    db.sql('''select * from ACC_setMax (%d)''' % (recordsProcessed), None)
-    db.commit()
+    commands = [(imageTable, bcpCommand % (imageTable, iFileName)),
+                (paneTable, bcpCommand % (paneTable, pFileName)),
+                (accTable, bcpCommand % (accTable, aFileName))]
+    commands = [c for c in commands if c[0] not in committed]
+    dependencies = {paneTable : [imageTable]}
 
-    # update img_image_seq auto-sequence
-    db.sql(''' select setval('img_image_seq', (select max(_Image_key) from IMG_Image)) ''', None)
-    db.commit()
+    results = bcplib.runBCPCommands(commands, dependencies, diagFile)
 
-    # update img_imagepane_seq auto-sequence
-    db.sql(''' select setval('img_imagepane_seq', (select max(_ImagePane_key) from IMG_ImagePane)) ''', None)
-    db.commit()
+    for r in results:
+        if r['status'] == 0:
+            journalCommit(r['table'])
+
+    for r in results:
+        if r['status'] != 0:
+            exit(1, 'bcp of %s failed (status %s); see %s\n' % (r['table'], r['status'], diagFileName))
+
+    resetSequences()
 
     return
 
+# Purpose:  moves the img_image_seq, img_imagepane_seq and
+#           acc_accession_seq sequences up to the maximum keys of their
+#           tables, for the loads that take keys as max(key) + 1
+# Returns:  nothing
+# Assumes:  db connection
+# Effects:  advances the sequences (see keylib.resetSequence)
+#           ACC_AccessionMax was advanced when the MGI IDs were reserved
+#           timed as the 'resetSequences' phase (within 'bcpFiles')
+# Throws:   nothing
+
+def resetSequences():
+
+    metricslib.startTimer('resetSequences')
+
+    for seqName in ('img_image_seq', 'img_imagepane_seq', keylib.accSequence):
+        keylib.resetSequence(seqName)
+
+    metricslib.stopTimer('resetSequences')
+
+# Purpose:  journals that a table has committed
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  writes a bcp entry to the journal
+# Throws:   nothing
+
+def journalCommit(
+    table           # table name (string)
+    ):
+
+    journallib.writeEntry({'stage' : 'bcp', 'table' : table,
+        'image' : journallib.getInputState('image'), 'pane' : journallib.getInputState('pane')})
+
+# Purpose:  writes an ACC_Accession row for the current image
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  writes to the ACC_Accession bcp file
+#           increments global accKey
+# Throws:   nothing
+
+def writeAccession(
+    accID,          # accession ID (string)
+    prefixPart,     # prefix part (string)
+    numericPart,    # numeric part (string/integer/None)
+    logicalDBKey,   # _LogicalDB_key (string)
+    private         # private (string)
+    ):
+
+    global accKey
+
+    bcplib.writeBCPRow(accTable, (accKey, accID, prefixPart, numericPart, logicalDBKey,
+        imageKey, imageMgiTypeKey, private, accPreferred,
+        createdByKey, createdByKey, loaddate, loaddate))
+
+    accKey = accKey + 1
+
 # Purpose:  processes image data
 # Returns:  nothing
 # Assumes:  nothing
 # Effects:  verifies and processes each line in the input file
+#           (in shards, by numWorkers processes, if numWorkers > 1)
 # Throws:   nothing
 
 def processImageFile():
 
-    global imageKey, accKey, mgiKey
-    global imagePix
-    global referenceKey
+    global shardExecutor
 
     lineNum = 0
 
-    # For each line in the input file
+    resumeLine = 0
+    if checkpoint is not None:
+        resumeLine = checkpoint['image'][0]
 
-    for line in inImageFile.readlines():
+    if numWorkers > 1:
 
-        error = 0
-        lineNum = lineNum + 1
+        # shard files left by a load that was killed
 
-        # Split the line into tokens
-        tokens = str.split(line[:-1], '\t')
+        for fileName in glob.glob(currentDir + '/gxdimageload.shard*'):
+            os.remove(fileName)
 
-        try:
-            jnum = tokens[0]
-            fullsizeKey = tokens[1]
-            imageClass = tokens[2]
-            pixID = tokens[3]
-            xdim = tokens[4]
-            ydim = tokens[5]
-            figureLabel = tokens[6]
-            copyrightNote = tokens[7]
-            imageNote = tokens[8]
-            imageInfo = tokens[9]
-        except:
-            exit(1, 'Invalid Line (%d): %s\n' % (lineNum, line))
+        context = multiprocessing.get_context('fork')
+        shardExecutor = concurrent.futures.ProcessPoolExecutor(max_workers = numWorkers, mp_context = context)
+
+    # For each line in the input file
 
-        imageClassKey = loadlib.verifyTerm('', imageVocabClassKey, imageClass, lineNum, errorFile)
-        if imageClassKey == 0:
-            error = 1
+    for lineNum, tokens in inputlib.readRecords(journallib.hashLines('image', inImageFile), 10, invalidLine):
 
-        referenceKey = loadlib.verifyReference(jnum, lineNum, errorFile)
-        if referenceKey == 0:
-            error = 1
+        # already turned into rows before the checkpoint
 
-        # if errors, continue to next record
-        if error:
+        if lineNum <= resumeLine:
             continue
 
-        # if no errors, process
-
-        imageTypeKey = FSimageTypeKey
-
-        outImageFile.write(str(imageKey) + TAB + \
-            str(imageClassKey) + TAB + \
-            str(imageTypeKey) + TAB + \
-            str(referenceKey) + TAB + \
-            TAB + \
-            xdim + TAB + \
-            ydim + TAB + \
-            figureLabel + TAB + \
-            str(createdByKey) + TAB + \
-            str(createdByKey) + TAB + \
-            loaddate + TAB + loaddate + CRT)
-
-        # MGI Accession ID for the image
-
-        mgiAccID = mgiPrefix + str(mgiKey)
-
-        outAccFile.write(str(accKey) + TAB + \
-            mgiPrefix + str(mgiKey) + TAB + \
-            mgiPrefix + TAB + \
-            str(mgiKey) + TAB + \
-            accLogicalDBKey + TAB + \
-            str(imageKey) + TAB + \
-            imageMgiTypeKey + TAB + \
-            accPrivate + TAB + \
-            accPreferred + TAB + \
-            str(createdByKey) + TAB + \
-            str(createdByKey) + TAB + \
-            loaddate + TAB + loaddate + CRT)
-
-        accKey = accKey + 1
-        mgiKey = mgiKey + 1
-
-        if pixID.find('GUDMAP') < 0 and len(pixID) > 0:
-            outAccFile.write(str(accKey) + TAB + \
-                pixPrefix + str(pixID) + TAB + \
-                pixPrefix + TAB + \
-                pixID + TAB + \
-                pixLogicalDBKey + TAB + \
-                str(imageKey) + TAB + \
-                imageMgiTypeKey + TAB + \
-                pixPrivate + TAB + \
-                accPreferred + TAB + \
-                str(createdByKey) + TAB + \
-                str(createdByKey) + TAB + \
-                loaddate + TAB + loaddate + CRT)
-    
-            accKey = accKey + 1
-
-        if len(imageInfo) > 0:
-
-            imageLogicalDBKey, imageID = imageInfo.split('|')
-
-            outAccFile.write(str(accKey) + TAB + \
-                imageID + TAB + \
-                imageID + TAB + \
-                TAB + \
-                imageLogicalDBKey + TAB + \
-                str(imageKey) + TAB + \
-                imageMgiTypeKey + TAB + \
-                accPrivate + TAB + \
-                accPreferred + TAB + \
-                str(createdByKey) + TAB + \
-                str(createdByKey) + TAB + \
-                loaddate + TAB + loaddate + CRT)
-    
-            accKey = accKey + 1
-
-        # Copyrights
-
-        if len(copyrightNote) > 0:
-            outCopyrightFile.write(mgiAccID + TAB + copyrightNote + CRT)
-
-        # Notes
-
-        if len(imageNote) > 0:
-            outCaptionFile.write(mgiAccID + TAB + imageNote + CRT)
-
-        imagePix[pixID] = imageKey
-        imageKey = imageKey + 1
-
-    #   end of "for line in inImageFile.readlines():"
+        if lineNum % checkpointInterval == 0:
+            processPendingLines()
+            checkpointRows()
+
+        if shardExecutor is not None:
+            pendingLines.append((lineNum, tokens))
+            if len(pendingLines) >= shardLines:
+                submitShard()
+                appendShards(0)
+        else:
+            processImageLine(lineNum, tokens)
+
+    #   end of "for lineNum, tokens in inputlib.readRecords(inImageFile...):"
+
+    processPendingLines()
+    checkpointRows()
+
+    if shardExecutor is not None:
+        shardExecutor.shutdown()
+        shardExecutor = None
+
+    if deltaMode:
+        diagFile.write('Delta: %d inserted, %d unchanged, %d changed\n' \
+            % (deltaCounts['inserted'], deltaCounts['unchanged'], deltaCounts['changed']))
 
     return lineNum
 
+# Purpose:  processes one line of the image file
+# Returns:  nothing
+# Assumes:  the output files are open
+# Effects:  writes the image's rows and notes, or its errors
+#           increments global imageKey, accKey, mgiKey
+#           adds the image to global imagePix, newImagePix
+# Throws:   nothing
+
+def processImageLine(
+    lineNum,        # line number (integer)
+    tokens          # image file fields (list of strings)
+    ):
+
+    global imageKey, mgiKey
+    global referenceKey
+
+    error = 0
+
+    jnum = tokens[0]
+    fullsizeKey = tokens[1]
+    imageClass = tokens[2]
+    pixID = tokens[3]
+    xdim = tokens[4]
+    ydim = tokens[5]
+    figureLabel = tokens[6]
+    copyrightNote = tokens[7]
+    imageNote = tokens[8]
+    imageInfo = tokens[9]
+
+    imageClassKey = imageClassLookup.get(imageClass, 0)
+    if imageClassKey == 0:
+        errorFile.write('Invalid Term (%d) %s\n' % (lineNum, imageClass))
+        error = 1
+
+    referenceKey = referenceLookup.get(jnum, 0)
+    if referenceKey == 0:
+        errorFile.write('Invalid Reference (%d): %s\n' % (lineNum, jnum))
+        error = 1
+
+    # if errors, continue to next record
+    if error:
+        return
+
+    # delta mode:  skip the images that are already loaded
+
+    if deltaMode:
+        pixAccID = getPixAccID(pixID)
+        if (referenceKey, figureLabel, pixAccID) in existingImages:
+            deltaCounts['unchanged'] = deltaCounts['unchanged'] + 1
+            return
+        existingKey = existingLabels.get((referenceKey, figureLabel), existingPix.get((referenceKey, pixAccID)))
+        if existingKey is not None:
+            diagFile.write('Changed (%d): %s %s %s; existing _Image_key %s\n' \
+                % (lineNum, jnum, figureLabel, pixAccID, existingKey))
+            deltaCounts['changed'] = deltaCounts['changed'] + 1
+        else:
+            deltaCounts['inserted'] = deltaCounts['inserted'] + 1
+
+    # if no errors, process
+
+    imageTypeKey = FSimageTypeKey
+
+    bcplib.writeBCPRow(imageTable, (imageKey, imageClassKey, imageTypeKey, referenceKey, None,
+        xdim, ydim, figureLabel, createdByKey, createdByKey, loaddate, loaddate))
+
+    # MGI Accession ID for the image
+
+    mgiAccID = mgiPrefix + str(mgiKey)
+
+    writeAccession(mgiAccID, mgiPrefix, mgiKey, accLogicalDBKey, accPrivate)
+
+    mgiKey = mgiKey + 1
+
+    if pixID.find('GUDMAP') < 0 and len(pixID) > 0:
+        writeAccession(pixPrefix + pixID, pixPrefix, pixID, pixLogicalDBKey, pixPrivate)
+
+    if len(imageInfo) > 0:
+        imageLogicalDBKey, imageID = imageInfo.split('|')
+        writeAccession(imageID, imageID, None, imageLogicalDBKey, accPrivate)
+
+    # Copyrights
+
+    if len(copyrightNote) > 0:
+        outCopyrightFile.write(mgiAccID + TAB + copyrightNote + CRT)
+
+    # Notes
+
+    if len(imageNote) > 0:
+        outCaptionFile.write(mgiAccID + TAB + imageNote + CRT)
+
+    imagePix[pixID] = imageKey
+    newImagePix[pixID] = imageKey
+    imageKey = imageKey + 1
+
+# Purpose:  returns the number of IMG_Image and ACC_Accession rows an
+#           image line emits (see processImageLine)
+# Returns:  [image rows, accession rows]
+# Assumes:  the lookups have been loaded (prefetchLookups)
+# Effects:  nothing
+# Throws:   nothing
+
+def countImageLineRows(
+    tokens          # image file fields (list of strings)
+    ):
+
+    referenceKey = referenceLookup.get(tokens[0], 0)
+
+    if imageClassLookup.get(tokens[2], 0) == 0 or referenceKey == 0:
+        return [0, 0]
+
+    if deltaMode and (referenceKey, tokens[6], getPixAccID(tokens[3])) in existingImages:
+        return [0, 0]
+
+    return [1, countAccessions(tokens)]
+
+# Purpose:  processes the image lines that have been read (pendingLines)
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  see submitShard, appendShards; waits for all of the shards
+# Throws:   nothing
+
+def processPendingLines():
+
+    if len(pendingLines) > 0:
+        submitShard()
+
+    appendShards(1)
+
+# Purpose:  starts a worker on the image lines that have been read
+#           (pendingLines)
+# Returns:  nothing
+# Assumes:  shardExecutor has been started
+# Effects:  sets global imageKey, accKey, mgiKey past the shard's keys
+#           adds the shard to global shardFutures
+# Throws:   nothing
+
+def submitShard():
+
+    global pendingLines, shardNum
+    global imageKey, accKey, mgiKey
+
+    lines = pendingLines
+    pendingLines = []
+
+    keys = [imageKey, accKey, mgiKey]
+
+    for lineNum, tokens in lines:
+        imageRows, accRows = countImageLineRows(tokens)
+        imageKey = imageKey + imageRows
+        mgiKey = mgiKey + imageRows
+        accKey = accKey + accRows
+
+    # the workers are forked with the output files as they are now
+
+    bcplib.flushBCPFiles()
+    for fp in (outCopyrightFile, outCaptionFile, errorFile, diagFile):
+        fp.flush()
+
+    future = shardExecutor.submit(processShard, (shardNum, lines, keys))
+    shardFutures.append([shardNum, keys, [imageKey, accKey, mgiKey], future])
+
+    shardNum = shardNum + 1
+
+# Purpose:  appends the shards that have been processed to the output
+#           files, in input order
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  see appendShard
+#           exits if a shard did not use the keys computed for it
+# Throws:   nothing
+
+def appendShards(
+    wait            # if 1, wait for all of the shards (integer)
+    ):
+
+    while len(shardFutures) > 0 and (wait or shardFutures[0][3].done()):
+        num, keysBefore, keysAfter, future = shardFutures.pop(0)
+        result = future.result()
+        if result['keys'] != keysAfter:
+            exit(1, 'Shard %d used keys %s-%s; %s-%s were computed\n' \
+                % (num, keysBefore, result['keys'], keysBefore, keysAfter))
+        appendShard(result)
+
+# Purpose:  processes one shard of image lines (in a worker process)
+# Returns:  dictionary of shard files (name : file name), rows (table :
+#           number of rows), keys ([imageKey, accKey, mgiKey] after the
+#           shard), imagePix and deltaCounts of the shard
+# Assumes:  runs in a process forked from the load
+# Effects:  writes the shard files
+# Throws:   nothing
+
+def processShard(
+    shard           # (shard number, [(line number, tokens), ...],
+                    #  [first imageKey, accKey, mgiKey])
+    ):
+
+    global imageKey, accKey, mgiKey
+    global imagePix, newImagePix
+    global outCopyrightFile, outCaptionFile, errorFile, diagFile
+
+    num, lines, keys = shard
+
+    imageKey, accKey, mgiKey = keys
+    imagePix = {}
+    newImagePix = {}
+    for k in deltaCounts:
+        deltaCounts[k] = 0
+
+    files = {}
+    for name in (imageTable, accTable, 'copyright', 'caption', 'error', 'diagnostics'):
+        files[name] = '%s/gxdimageload.shard%d.%s' % (currentDir, num, name)
+
+    bcplib.openBCPFile(imageTable, files[imageTable])
+    bcplib.openBCPFile(accTable, files[accTable])
+    outCopyrightFile = open(files['copyright'], 'w')
+    outCaptionFile = open(files['caption'], 'w')
+    errorFile = open(files['error'], 'w')
+    diagFile = open(files['diagnostics'], 'w')
+
+    for lineNum, tokens in lines:
+        processImageLine(lineNum, tokens)
+
+    rows = {}
+    for table in (imageTable, accTable):
+        bcplib.closeBCPFile(table)
+        rows[table] = bcplib.getRowCount(table)
+
+    for fp in (outCopyrightFile, outCaptionFile, errorFile, diagFile):
+        fp.close()
+
+    return {'files' : files, 'rows' : rows, 'keys' : [imageKey, accKey, mgiKey],
+            'imagePix' : imagePix, 'deltaCounts' : dict(deltaCounts)}
+
+# Purpose:  appends a shard's files to the output files
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  writes to the output files and removes the shard files
+#           adds the shard's images to global imagePix, newImagePix
+#           adds the shard's counts to global deltaCounts
+# Throws:   nothing
+
+def appendShard(
+    result          # see processShard
+    ):
+
+    files = result['files']
+
+    for table in (imageTable, accTable):
+        bcplib.appendBCPFile(table, files[table], result['rows'][table])
+
+    for name, fp in (('copyright', outCopyrightFile), ('caption', outCaptionFile),
+                     ('error', errorFile), ('diagnostics', diagFile)):
+        shardFile = open(files[name], 'r')
+        shutil.copyfileobj(shardFile, fp)
+        shardFile.close()
+
+    for fileName in files.values():
+        os.remove(fileName)
+
+    imagePix.update(result['imagePix'])
+    newImagePix.update(result['imagePix'])
+
+    for k in deltaCounts:
+        deltaCounts[k] = deltaCounts[k] + result['deltaCounts'][k]
+
 # Purpose:  processes image pane data
 # Returns:  nothing
 # Assumes:  nothing
@@ -527,46 +1310,72 @@ def processImagePaneFile():
     global imagePix, paneKey
 
     lineNum = 0
+
+    resumeLine = 0
+    if checkpoint is not None:
+        resumeLine = checkpoint['pane'][0]
+
     # For each line in the input file
-    for line in inPaneFile.readlines():
 
-        error = 0
-        lineNum = lineNum + 1
+    for lineNum, tokens in inputlib.readRecords(journallib.hashLines('pane', inPaneFile), 4, invalidLine):
 
-        # Split the line into tokens
-        tokens = str.split(line[:-1], '\t')
+        if lineNum <= resumeLine:
+            continue
 
-        try:
-            pixID = tokens[0]
-            paneLabel = tokens[1]
-            paneWidth = tokens[2]
-            paneHeight = tokens[3]
-        except:
-            exit(1, 'Invalid Line (%d): %s\n' % (lineNum, line))
+        if lineNum % checkpointInterval == 0:
+            checkpointRows()
+
+        pixID = tokens[0]
+
+        # delta mode:  the image (and its panes) are already loaded
+
+        if pixID in unchangedPix:
+            continue
+
+        # the image was not loaded (invalid reference, image class)
+
+        imageKeyOfPane = imagePix.get(pixID)
+
+        if imageKeyOfPane is None:
+            errorFile.write('Invalid Image (%d): %s\n' % (lineNum, pixID))
+            continue
+
+        paneLabel = tokens[1]
+        paneWidth = tokens[2]
+        paneHeight = tokens[3]
 
         paneX = 0
         paneY = 0
 
-        outPaneFile.write(str(paneKey) + TAB + \
-            str(imagePix[pixID]) + TAB + \
-            mgi_utils.prvalue(paneLabel) + TAB + \
-            str(paneX) + TAB + \
-            str(paneY) + TAB + \
-            str(paneWidth) + TAB + \
-            str(paneHeight) + TAB + \
-            loaddate + TAB + loaddate + CRT)
+        bcplib.writeBCPRow(paneTable, (paneKey, imageKeyOfPane, paneLabel,
+            paneX, paneY, paneWidth, paneHeight, loaddate, loaddate))
 
         paneKey = paneKey + 1
 
-    #   end of "for line in inPaneFile.readlines():"
+    #   end of "for lineNum, tokens in inputlib.readRecords(inPaneFile...):"
+
+    checkpointRows()
 
     return lineNum
 
 def process():
 
-    recordsProcessed = processImageFile()
-    recordsProcessed = recordsProcessed + processImagePaneFile()
-    bcpFiles(recordsProcessed)
+    metricslib.startTimer('processImageFile')
+    processImageFile()
+    metricslib.stopTimer('processImageFile')
+
+    metricslib.startTimer('processImagePaneFile')
+    processImagePaneFile()
+    metricslib.stopTimer('processImagePaneFile')
+
+    metricslib.startTimer('bcpFiles')
+    bcpFiles()
+    metricslib.stopTimer('bcpFiles')
+
+    # the load is complete; a rerun starts a new load
+
+    if not DEBUG:
+        journallib.removeJournal()
 
 #
 # Main
@@ -574,7 +1383,11 @@ def process():
 
 init()
 verifyMode()
+validateInput()
+readJournal()
+prefetchLookups()
 setPrimaryKeys()
+openOutputFiles()
 process()
 exit(0)
 
@@ -0,0 +1,231 @@
+#!/usr/local/bin/python
+
+#
+# Program: gxdimagevalidate.py
+#
+# Purpose:
+#
+#       Validate the gxdimageload.py image and image pane files, and
+#       report every error in them, before anything is loaded.
+#       gxdimageload.py runs it as a gate; it can also be run on its own.
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#       gxdimagevalidate.py [image file] [image pane file]
+#
+# Envvars:
+#
+# Inputs:
+#
+#       Image file and Image Pane file (see gxdimageload.py)
+#
+# Outputs:
+#
+#       The errors, one per line, to stdout
+#
+# Exit Codes:
+#
+#       0:  the files are valid
+#       1:  errors were found
+#
+# Assumes:
+#
+# Bugs:
+#
+# Implementation:
+#
+#       Each file is read once into columns (one list per field); each
+#       check then runs over a whole column:
+#
+#       image file:
+#               number of fields (10)
+#               X, Y Dimension are blank or integers
+#               LogicalDB|Image AccID is blank or ####|accID
+#               PIX IDs are unique
+#       image pane file:
+#               number of fields (4)
+#               X, Y Dimension are blank or integers
+#               each PIX ID is in the image file
+#
+#       Checks against the database (reference, image class) are done
+#       by gxdimageload.py.
+#
+
+import sys
+import re
+
+#globals
+
+TAB = '\t'
+CRT = '\n'
+
+imageFields = 10
+paneFields = 4
+
+dimensionPattern = re.compile(r'\d*$')
+imageInfoPattern = re.compile(r'\d+\|[^|\s]+$')
+
+# Purpose:  reads a tab-delimited file into columns
+# Returns:  (line numbers, columns, errors)
+#           line numbers: list of the line number of each record
+#           columns: list of numFields lists (one value per record)
+#           errors: list of (line number, message) for the lines that do
+#           not have numFields fields (these are not in the columns)
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   nothing
+
+def readColumns(
+    fp,             # file descriptor
+    numFields       # number of expected fields (integer)
+    ):
+
+    lineNums = []
+    records = []
+    errors = []
+
+    lineNum = 0
+
+    for line in fp:
+
+        lineNum = lineNum + 1
+
+        if line.endswith(CRT):
+            line = line[:-1]
+
+        tokens = str.split(line, TAB)
+
+        if len(tokens) < numFields:
+            errors.append((lineNum, 'Invalid Line (%d): %s' % (lineNum, line)))
+            continue
+
+        lineNums.append(lineNum)
+        records.append(tokens[:numFields])
+
+    if len(records) == 0:
+        return lineNums, [[] for i in range(numFields)], errors
+
+    return lineNums, [list(c) for c in zip(*records)], errors
+
+# Purpose:  checks a column against a pattern
+# Returns:  list of (line number, message) for the values that do not match
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   nothing
+
+def checkColumn(
+    lineNums,       # line numbers (list of integers)
+    column,         # column values (list of strings)
+    pattern,        # compiled regular expression
+    label           # column name for the message (string)
+    ):
+
+    match = pattern.match
+
+    return [(lineNums[i], 'Invalid %s (%d): %s' % (label, lineNums[i], column[i])) \
+            for i in range(len(column)) if match(column[i]) is None]
+
+# Purpose:  validates the image file
+# Returns:  (list of (line number, message), set of the file's PIX IDs)
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   nothing
+
+def validateImageFile(
+    fp              # image file descriptor
+    ):
+
+    lineNums, columns, errors = readColumns(fp, imageFields)
+
+    errors = errors + checkColumn(lineNums, columns[4], dimensionPattern, 'X Dimension')
+    errors = errors + checkColumn(lineNums, columns[5], dimensionPattern, 'Y Dimension')
+
+    imageInfo = columns[9]
+    errors = errors + [(lineNums[i], 'Invalid LogicalDB|Image AccID (%d): %s' % (lineNums[i], imageInfo[i])) \
+                       for i in range(len(imageInfo)) if imageInfo[i] != '' and imageInfoPattern.match(imageInfo[i]) is None]
+
+    firstLine = {}      # PIX ID : line number of its first image
+
+    for lineNum, pixID in zip(lineNums, columns[3]):
+        if pixID == '':
+            continue
+        if pixID in firstLine:
+            errors.append((lineNum, 'Duplicate PIX ID (%d): %s (line %d)' % (lineNum, pixID, firstLine[pixID])))
+        else:
+            firstLine[pixID] = lineNum
+
+    errors.sort()
+
+    return errors, set(firstLine)
+
+# Purpose:  validates the image pane file
+# Returns:  list of (line number, message)
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   nothing
+
+def validatePaneFile(
+    fp,             # image pane file descriptor
+    pixIDs          # PIX IDs of the image file (set of strings)
+    ):
+
+    lineNums, columns, errors = readColumns(fp, paneFields)
+
+    errors = errors + checkColumn(lineNums, columns[2], dimensionPattern, 'X Dimension')
+    errors = errors + checkColumn(lineNums, columns[3], dimensionPattern, 'Y Dimension')
+
+    errors = errors + [(lineNums[i], 'Invalid Image (%d): %s' % (lineNums[i], columns[0][i])) \
+                       for i in range(len(lineNums)) if columns[0][i] not in pixIDs]
+
+    errors.sort()
+
+    return errors
+
+# Purpose:  validates the image and image pane files
+# Returns:  list of error messages (strings), image file first, each
+#           file in line order
+# Assumes:  nothing
+# Effects:  rewinds imageFp, paneFp
+# Throws:   nothing
+
+def validateFiles(
+    imageFp,        # image file descriptor
+    paneFp          # image pane file descriptor
+    ):
+
+    imageErrors, pixIDs = validateImageFile(imageFp)
+    paneErrors = validatePaneFile(paneFp, pixIDs)
+
+    imageFp.seek(0)
+    paneFp.seek(0)
+
+    return ['Image File: ' + e[1] for e in imageErrors] + \
+           ['Image Pane File: ' + e[1] for e in paneErrors]
+
+#
+# Main
+#
+
+if __name__ == '__main__':
+
+    if len(sys.argv) != 3:
+        sys.stderr.write('Usage: %s [image file] [image pane file]\n' % (sys.argv[0]))
+        sys.exit(1)
+
+    imageFp = open(sys.argv[1], 'r')
+    paneFp = open(sys.argv[2], 'r')
+
+    errors = validateFiles(imageFp, paneFp)
+
+    imageFp.close()
+    paneFp.close()
+
+    for e in errors:
+        print(e)
+
+    if len(errors) > 0:
+        sys.exit(1)
+
+    sys.exit(0)
@@ -0,0 +1,168 @@
+#!/usr/local/bin/python
+
+#
+# Program: imagesizelib.py
+#
+# Purpose:
+#
+#       Some common routines for reading image dimensions (width, height)
+#       from JPEG and PNG file headers, without decoding the image
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#       width, height = imagesizelib.getImageSize('/data/pixeldb/1234.jpg')
+#       sizes = imagesizelib.getImageSizes(fileNames)
+#
+# Envvars:
+#
+# Inputs:
+#
+# Outputs:
+#
+# Exit Codes:
+#
+# Assumes:
+#
+# Bugs:
+#
+# Implementation:
+#
+#       JPEG: walks the marker segments (seeking over each one) up to the
+#       first SOFn frame header, which holds the height and width.
+#
+#       PNG: the width and height are the first 8 bytes of the IHDR
+#       chunk, which always starts at byte 16.
+#
+#       getImageSizes() spreads the files over a process pool.
+#
+
+import os
+import struct
+import multiprocessing
+import concurrent.futures
+
+#globals
+
+pngSignature = b'\x89PNG\r\n\x1a\n'
+
+# SOFn markers that carry the frame size (not DHT, JPG, DAC)
+
+jpegSOFMarkers = set(range(0xC0, 0xD0)) - set([0xC4, 0xC8, 0xCC])
+
+# markers without a length field:  RST0-RST7, SOI, TEM
+# (EOI is handled by readJPEGSize(); it ends the scan)
+
+jpegStandaloneMarkers = set(range(0xD0, 0xD9)) | set([0x01])
+
+chunkSize = 256         # files per process pool task
+
+# Purpose:  reads the dimensions of a JPEG file
+# Returns:  (width, height) or None if not found
+# Assumes:  fp is positioned after the SOI marker
+# Effects:  nothing
+# Throws:   IOError
+
+def readJPEGSize(
+    fp              # file descriptor (binary)
+    ):
+
+    while 1:
+
+        b = fp.read(1)
+
+        # skip fill bytes up to the next marker
+
+        while b and b != b'\xff':
+            b = fp.read(1)
+        while b == b'\xff':
+            b = fp.read(1)
+        if not b:
+            return None
+
+        marker = ord(b)
+
+        if marker in jpegStandaloneMarkers:
+            continue
+
+        if marker == 0xD9 or marker == 0xDA:    # EOI, SOS: no frame header
+            return None
+
+        header = fp.read(2)
+        if len(header) < 2:
+            return None
+        length = struct.unpack('>H', header)[0]
+
+        if marker in jpegSOFMarkers:
+            frame = fp.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack('>xHH', frame)
+            return width, height
+
+        fp.seek(length - 2, os.SEEK_CUR)
+
+# Purpose:  reads the dimensions of a JPEG or PNG file from its header
+# Returns:  (width, height) or None if the file is not a JPEG/PNG
+#           or the header is not valid
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   IOError
+
+def getImageSize(
+    fileName        # image file name (string)
+    ):
+
+    fp = open(fileName, 'rb')
+
+    try:
+        head = fp.read(24)
+
+        if head[:8] == pngSignature and head[12:16] == b'IHDR':
+            return struct.unpack('>II', head[16:24])
+
+        if head[:2] == b'\xff\xd8':
+            fp.seek(2)
+            return readJPEGSize(fp)
+
+        return None
+    finally:
+        fp.close()
+
+# Purpose:  getImageSize() for use in a process pool
+# Returns:  (width, height), None, or the error message (string)
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   nothing
+
+def getImageSizeOrError(
+    fileName        # image file name (string)
+    ):
+
+    try:
+        return getImageSize(fileName)
+    except (IOError, OSError, struct.error) as e:
+        return str(e)
+
+# Purpose:  reads the dimensions of a list of image files in parallel
+# Returns:  list of (width, height) or None, in fileNames order
+#           (None for a file that cannot be read or is not a JPEG/PNG)
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   nothing
+
+def getImageSizes(
+    fileNames,          # image file names (list of strings)
+    numWorkers = None   # number of processes (default: number of cpus)
+    ):
+
+    if len(fileNames) <= chunkSize:
+        sizes = [getImageSizeOrError(f) for f in fileNames]
+    else:
+        context = multiprocessing.get_context('fork')
+        with concurrent.futures.ProcessPoolExecutor(max_workers = numWorkers, mp_context = context) as executor:
+            sizes = list(executor.map(getImageSizeOrError, fileNames, chunksize = chunkSize))
+
+    return [s if isinstance(s, tuple) else None for s in sizes]
+
@@ -0,0 +1,176 @@
+#!/usr/local/bin/python
+
+#
+# Program: imagesnapshot.py
+#
+# Purpose:
+#
+#       Writes a snapshot of the lookup tables the image load reads
+#       (see lookuplib.py), so that gxdimageload.py can be previewed
+#       without a database connection (IMAGELOADSNAPSHOT)
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#       imagesnapshot.py [snapshot file] [image file]
+#
+#       With an image file, only the references of the image file (and
+#       their images) are written; without one, all of them are.
+#
+# Envvars:
+#
+#       MGD_DBUSER
+#       MGD_DBPASSWORDFILE
+#
+# Inputs:
+#
+#       Image file (see gxdimageload.py); optional
+#
+# Outputs:
+#
+#       Snapshot file (json; see lookuplib.py)
+#
+# Exit Codes:
+#
+#       0:  Successful completion
+#       1:  An error occurred
+#
+# Assumes:
+#
+# Bugs:
+#
+#       The next keys are those of the time of the snapshot; a preview
+#       run from it reports the keys a load would have used then.
+#
+# Implementation:
+#
+
+import sys
+import os
+import json
+import db
+import mgi_utils
+import inputlib
+import keylib
+import lookuplib
+
+#globals
+
+imageVocabClassKey = 83         # Image Class Vocabulary
+
+sequences = ['img_image_seq', 'img_imagepane_seq', keylib.accSequence]
+
+# Purpose:  returns the references of the image file, or all references
+# Returns:  dictionary of J: : _Refs_key
+# Assumes:  db connection
+# Effects:  queries the database
+# Throws:   nothing
+
+def getReferences(
+    imageFileName   # image file name (string), or None
+    ):
+
+    if imageFileName is not None:
+        fp = open(imageFileName, 'r')
+        jnums = set([tokens[0] for lineNum, tokens in inputlib.readRecords(fp, 1)])
+        fp.close()
+        references = lookuplib.lookupReferences(jnums)
+        return dict([(j, k) for j, k in references.items() if k != 0])
+
+    references = {}
+
+    for r in lookuplib.sqlStream('''
+        select accID, _Object_key
+        from ACC_Accession
+        where _MGIType_key = 1
+        and _LogicalDB_key = 1
+        and prefixPart = 'J:'
+        and preferred = 1
+        '''):
+        references[r['accID']] = r['_Object_key']
+
+    return references
+
+# Purpose:  builds the snapshot
+# Returns:  dictionary (see lookuplib.py)
+# Assumes:  db connection
+# Effects:  queries the database
+# Throws:   nothing
+
+def makeSnapshot(
+    imageFileName   # image file name (string), or None
+    ):
+
+    snapshot = {
+        'date' : mgi_utils.date(),
+        'server' : db.get_sqlServer(),
+        'database' : db.get_sqlDatabase(),
+        'users' : {},
+        'terms' : {},
+        'references' : getReferences(imageFileName),
+        'images' : [],
+        'keys' : {},
+        }
+
+    for r in db.sql('select _User_key, login from MGI_User', 'auto'):
+        snapshot['users'][r['login']] = r['_User_key']
+
+    terms = {}
+    for r in db.sql('''
+        select _Term_key, term
+        from VOC_Term
+        where _Vocab_key = %d
+        ''' % (imageVocabClassKey), 'auto'):
+        terms[r['term']] = r['_Term_key']
+    snapshot['terms'][str(imageVocabClassKey)] = terms
+
+    for r in lookuplib.lookupPixImages(snapshot['references'].values()):
+        accID = r['accID']
+        if accID is None:
+            accID = ''
+        snapshot['images'].append([r['_Image_key'], r['_Refs_key'], r['figureLabel'], accID])
+
+    snapshot['images'].sort()
+
+    for seqName in sequences:
+        snapshot['keys'][seqName] = keylib.reserveSequenceKeys(seqName, 0, 0)
+    snapshot['keys'][keylib.mgiPrefix] = keylib.reserveMGIIDs(0, 0)
+
+    return snapshot
+
+#
+# Main
+#
+
+if __name__ == '__main__':
+
+    if len(sys.argv) not in (2, 3):
+        sys.stderr.write('Usage: %s [snapshot file] [image file]\n' % (sys.argv[0]))
+        sys.exit(1)
+
+    snapshotFileName = sys.argv[1]
+    imageFileName = None
+    if len(sys.argv) == 3:
+        imageFileName = sys.argv[2]
+
+    db.useOneConnection(1)
+    db.set_sqlUser(os.environ['MGD_DBUSER'])
+    db.set_sqlPasswordFromFile(os.environ['MGD_DBPASSWORDFILE'])
+
+    snapshot = makeSnapshot(imageFileName)
+
+    db.useOneConnection(0)
+
+    # written to a temporary file first, so that a failure does not
+    # leave a partial snapshot behind
+
+    fp = open(snapshotFileName + '.tmp', 'w')
+    json.dump(snapshot, fp, sort_keys = True)
+    fp.write('\n')
+    fp.close()
+    os.replace(snapshotFileName + '.tmp', snapshotFileName)
+
+    print('%s: %d references, %d images, %d users' % (snapshotFileName,
+        len(snapshot['references']), len(snapshot['images']), len(snapshot['users'])))
+
+    sys.exit(0)
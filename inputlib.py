@@ -0,0 +1,100 @@
+#!/usr/local/bin/python
+
+#
+# Program: inputlib.py
+#
+# Purpose:
+#
+#       Some common routines for reading the tab-delimited input files
+#       (image file, image pane file, pixel file)
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#       for lineNum, tokens in inputlib.readRecords(fp, 4):
+#               ...
+#
+# Envvars:
+#
+# Inputs:
+#
+# Outputs:
+#
+# Exit Codes:
+#
+# Assumes:
+#
+# Bugs:
+#
+# Implementation:
+#
+#       The input file is read one line at a time, so memory use does
+#       not depend on the size of the input file.
+#
+
+import sys
+
+#globals
+
+TAB = '\t'
+CRT = '\n'
+
+# Purpose:  default handling of an invalid input line
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  writes the error to stderr and exits
+# Throws:   nothing
+
+def exitInvalidLine(
+    lineNum,        # line number (integer)
+    line            # input line (string)
+    ):
+
+    sys.stderr.write('\nInvalid Line (%d): %s\n' % (lineNum, line))
+    sys.exit(1)
+
+# Purpose:  ignores an invalid input line
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   nothing
+
+def ignoreInvalidLine(
+    lineNum,        # line number (integer)
+    line            # input line (string)
+    ):
+
+    pass
+
+# Purpose:  reads a tab-delimited file one record at a time
+# Returns:  generator of (line number, list of fields)
+# Assumes:  fp is open for reading
+# Effects:  for any line with fewer than numFields fields, calls
+#           invalidLine(lineNum, line); the line is skipped if
+#           invalidLine returns
+# Throws:   nothing
+
+def readRecords(
+    fp,                             # file descriptor
+    numFields,                      # number of expected fields (integer)
+    invalidLine = exitInvalidLine   # function(lineNum, line)
+    ):
+
+    lineNum = 0
+
+    for line in fp:
+
+        lineNum = lineNum + 1
+
+        if line.endswith(CRT):
+            line = line[:-1]
+
+        tokens = str.split(line, TAB)
+
+        if len(tokens) < numFields:
+            invalidLine(lineNum, line)
+            continue
+
+        yield lineNum, tokens
+
@@ -0,0 +1,237 @@
+#!/usr/local/bin/python
+
+#
+# Program: journallib.py
+#
+# Purpose:
+#
+#       Some common routines for keeping a load's checkpoint journal,
+#       so that a failed load can be rerun from where it stopped
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#       journallib.openJournal('/data/loads/gxdimageload.journal')
+#       keys = journallib.getEntry('keys')
+#       journallib.writeEntry({'stage' : 'keys', ...})
+#
+#       for lineNum, tokens in inputlib.readRecords(
+#               journallib.hashLines('image', fp), 10):
+#               ...
+#       lines, digest = journallib.getInputState('image')
+#       ...
+#       journallib.removeJournal()
+#
+# Envvars:
+#
+# Inputs:
+#
+# Outputs:
+#
+#       The journal file
+#
+# Exit Codes:
+#
+# Assumes:
+#
+# Bugs:
+#
+# Implementation:
+#
+#       The journal is append-only: one JSON object per line, each with
+#       a 'stage' (e.g. keys, rows, bcp).  Each entry is flushed and
+#       fsync-ed as it is written, so the journal never claims more than
+#       was done.  A partial last line (the load died while writing it)
+#       is ignored.
+#
+#       A 'restart' entry discards the entries before it.
+#
+#       hashLines() keeps a running hash of the input lines that have
+#       been read, so a checkpoint can record exactly which lines it
+#       covers; on rerun checkInput() verifies that those lines have
+#       not changed.  The hash of a line is added when the next line is
+#       requested, so while a line is being processed the hash covers
+#       the lines before it.
+#
+
+import os
+import json
+import hashlib
+
+#globals
+
+CRT = '\n'
+
+journalFileName = None
+journalFile = None      # file descriptor (append)
+entries = []            # journal entries, oldest first
+
+inputHashes = {}        # input name : [lines read, sha1]
+
+# Purpose:  opens (creating if needed) the journal and reads its entries
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  sets global journalFileName, journalFile, entries
+# Throws:   IOError
+
+def openJournal(
+    fileName        # journal file name (string)
+    ):
+
+    global journalFileName, journalFile, entries
+
+    journalFileName = fileName
+    entries = []
+
+    if os.path.exists(fileName):
+        fp = open(fileName, 'r')
+        for line in fp:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if entry['stage'] == 'restart':
+                entries = []
+            else:
+                entries.append(entry)
+        fp.close()
+
+    journalFile = open(fileName, 'a')
+
+# Purpose:  appends an entry to the journal
+# Returns:  nothing
+# Assumes:  openJournal() has been called
+# Effects:  writes the entry to the journal file and syncs it to disk
+# Throws:   IOError
+
+def writeEntry(
+    entry           # journal entry (dictionary with a 'stage')
+    ):
+
+    global entries
+
+    journalFile.write(json.dumps(entry, sort_keys = True) + CRT)
+    journalFile.flush()
+    os.fsync(journalFile.fileno())
+
+    if entry['stage'] == 'restart':
+        entries = []
+    else:
+        entries.append(entry)
+
+# Purpose:  returns the journal entries of a stage
+# Returns:  list of entries, oldest first
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   nothing
+
+def getEntries(
+    stage           # stage (string)
+    ):
+
+    return [e for e in entries if e['stage'] == stage]
+
+# Purpose:  returns the latest journal entry of a stage
+# Returns:  entry (dictionary) or None
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   nothing
+
+def getEntry(
+    stage           # stage (string)
+    ):
+
+    stageEntries = getEntries(stage)
+
+    if len(stageEntries) == 0:
+        return None
+
+    return stageEntries[-1]
+
+# Purpose:  closes and removes the journal (the load is complete)
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  removes the journal file
+# Throws:   OSError
+
+def removeJournal():
+
+    global journalFile, entries
+
+    if journalFile is None:
+        return
+
+    journalFile.close()
+    journalFile = None
+    entries = []
+
+    os.remove(journalFileName)
+
+# Purpose:  reads the lines of an input file, hashing them as they are read
+# Returns:  generator of lines
+# Assumes:  nothing
+# Effects:  updates inputHashes[name]
+# Throws:   nothing
+
+def hashLines(
+    name,           # input name (string)
+    fp              # file descriptor
+    ):
+
+    state = [0, hashlib.sha1()]
+    inputHashes[name] = state
+
+    for line in fp:
+        yield line
+        state[1].update(line.encode())
+        state[0] = state[0] + 1
+
+# Purpose:  returns how much of an input has been read (hashLines())
+# Returns:  [number of lines, hex digest of those lines]
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   nothing
+
+def getInputState(
+    name            # input name (string)
+    ):
+
+    if name not in inputHashes:
+        return [0, hashlib.sha1().hexdigest()]
+
+    state = inputHashes[name]
+    return [state[0], state[1].hexdigest()]
+
+# Purpose:  verifies that the first lines of an input file are the ones
+#           a checkpoint was taken at
+# Returns:  1 if the file has at least numLines lines (exactly numLines
+#           if wholeFile) and their hash is digest, else 0
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   IOError
+
+def checkInput(
+    fileName,       # input file name (string)
+    numLines,       # number of lines (integer)
+    digest,         # hex digest of those lines (string)
+    wholeFile = 0   # if true, the file must have no more lines (boolean)
+    ):
+
+    h = hashlib.sha1()
+    n = 0
+    moreLines = 0
+
+    fp = open(fileName, 'r')
+    for line in fp:
+        if n == numLines:
+            moreLines = 1
+            break
+        h.update(line.encode())
+        n = n + 1
+    fp.close()
+
+    if wholeFile and moreLines:
+        return 0
+
+    return n == numLines and h.hexdigest() == digest
@@ -0,0 +1,170 @@
+#!/usr/local/bin/python
+
+#
+# Program: keylib.py
+#
+# Purpose:
+#
+#       Some common routines for allocating primary keys and MGI IDs
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#       imageKey = keylib.reserveSequenceKeys('img_image_seq', numImages)
+#       accKey = keylib.reserveAccessionKeys(numAccessions)
+#       mgiKey = keylib.reserveMGIIDs(numImages)
+#       ... load ...
+#       keylib.resetSequence('img_image_seq')
+#
+# Envvars:
+#
+# Inputs:
+#
+# Outputs:
+#
+# Exit Codes:
+#
+# Assumes:
+#
+#       Other loads may still take keys as max(key) + 1 without
+#       advancing the sequence, so a sequence can fall behind its table.
+#       A reservation never starts below max(key) + 1 of the table, and
+#       resetSequence() moves the sequence up to max(key) after a load.
+#
+#       Any other session that takes keys from the sequence, or inserts
+#       into the table, while a block is being reserved either locks the
+#       table (as keylib does) or waits on it; a bare nextval() between
+#       the nextval() and setval() of a reservation is not prevented.
+#
+# Bugs:
+#
+# Implementation:
+#
+#       Each routine reserves a contiguous block of 'count' keys and
+#       returns the first key of the block.  The sequence (or
+#       ACC_AccessionMax) is advanced past the block at the same time.
+#       A sequence block is reserved in one transaction that holds a
+#       share row exclusive lock on the table, so reservations (and
+#       inserts by other loads) are serialized; the max(key) floor is
+#       read from the table's primary key index.
+#
+#       If 'reserve' is false (preview), or count is 0, the next key
+#       is returned and nothing is advanced.  If a lookuplib snapshot is
+#       open, the next key is the one recorded in the snapshot.
+#
+
+import db
+import lookuplib
+
+#globals
+
+accSequence = 'acc_accession_seq'
+mgiPrefix = 'MGI:'
+
+# sequence : (table, primary key) the sequence's keys go into
+
+sequenceTables = {
+    'img_image_seq' : ('IMG_Image', '_Image_key'),
+    'img_imagepane_seq' : ('IMG_ImagePane', '_ImagePane_key'),
+    accSequence : ('ACC_Accession', '_Accession_key'),
+    }
+
+# Purpose:  reserves a block of keys from a sequence
+# Returns:  the first key of the block (integer)
+# Assumes:  seqName is in sequenceTables
+# Effects:  locks the sequence's table until the reservation commits
+#           advances the sequence to the end of the block
+# Throws:   nothing
+
+def reserveSequenceKeys(
+    seqName,        # sequence name (string)
+    count,          # number of keys to reserve (integer)
+    reserve = 1     # if 0, do not advance the sequence
+    ):
+
+    table, keyName = sequenceTables[seqName]
+
+    if not reserve or count == 0:
+        if lookuplib.snapshot is not None:
+            return lookuplib.getSnapshotKey(seqName)
+        results = db.sql('''
+            select greatest(case when is_called then last_value + 1 else last_value end,
+                (select coalesce(max(%s), 0) + 1 from %s)) as firstKey
+            from %s
+            ''' % (keyName, table, seqName), 'auto')
+        return results[0]['firstKey']
+
+    db.sql('lock table %s in share row exclusive mode' % (table), None)
+    results = db.sql('''
+        select setval('%s', greatest(nextval('%s'),
+            (select coalesce(max(%s), 0) + 1 from %s)) + %d - 1) - %d + 1 as firstKey
+        ''' % (seqName, seqName, keyName, table, count, count), 'auto')
+    db.commit()
+
+    return results[0]['firstKey']
+
+# Purpose:  moves a sequence up to the maximum key of its table, after
+#           a load (see Assumes)
+# Returns:  nothing
+# Assumes:  seqName is in sequenceTables
+# Effects:  advances the sequence; never moves it back
+# Throws:   nothing
+
+def resetSequence(
+    seqName         # sequence name (string)
+    ):
+
+    table, keyName = sequenceTables[seqName]
+
+    db.sql('''
+        select setval('%s', greatest((select coalesce(max(%s), 1) from %s), last_value))
+        from %s
+        ''' % (seqName, keyName, table, seqName), None)
+    db.commit()
+
+# Purpose:  reserves a block of ACC_Accession._Accession_key values
+# Returns:  the first key of the block (integer)
+# Assumes:  nothing
+# Effects:  advances the ACC_Accession sequence by count
+# Throws:   nothing
+
+def reserveAccessionKeys(
+    count,          # number of keys to reserve (integer)
+    reserve = 1     # if 0, do not advance the sequence
+    ):
+
+    return reserveSequenceKeys(accSequence, count, reserve)
+
+# Purpose:  reserves a block of MGI ID numeric parts from ACC_AccessionMax
+# Returns:  the first numeric part of the block (integer)
+# Assumes:  nothing
+# Effects:  advances ACC_AccessionMax.maxNumericPart by count
+# Throws:   nothing
+
+def reserveMGIIDs(
+    count,              # number of IDs to reserve (integer)
+    reserve = 1,        # if 0, do not advance ACC_AccessionMax
+    prefix = mgiPrefix  # prefix part (string)
+    ):
+
+    if not reserve or count == 0:
+        if lookuplib.snapshot is not None:
+            return lookuplib.getSnapshotKey(prefix)
+        results = db.sql('''
+            select maxNumericPart + 1 as firstKey
+            from ACC_AccessionMax
+            where prefixPart = '%s'
+            ''' % (prefix), 'auto')
+        return results[0]['firstKey']
+
+    results = db.sql('''
+        update ACC_AccessionMax
+        set maxNumericPart = maxNumericPart + %d
+        where prefixPart = '%s'
+        returning maxNumericPart - %d + 1 as firstKey
+        ''' % (count, prefix, count), 'auto')
+    db.commit()
+
+    return results[0]['firstKey']
+
@@ -0,0 +1,355 @@
+#!/usr/local/bin/python
+
+#
+# Program: keymaplib.py
+#
+# Purpose:
+#
+#       Compact in-memory maps of accession IDs to integer keys, for the
+#       lookups a load holds for all of its input (e.g. PIX ID : image
+#       key), in place of dictionaries
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#       imagePix = keymaplib.KeyMap()
+#       imagePix['1234'] = imageKey
+#       imageKey = imagePix.get('1234')
+#
+#       panes = keymaplib.KeyGroups('PIX:')
+#       panes.setGroup('PIX:1234', [(paneLabel, paneKey), ...])
+#       panes.getGroup('PIX:1234')              # [(paneLabel, paneKey), ...]
+#       panes.getValues('PIX:1234')             # [paneKey, ...]
+#       panes.find('PIX:1234', paneLabel)       # paneKey, or None
+#
+# Envvars:
+#
+# Inputs:
+#
+# Outputs:
+#
+# Exit Codes:
+#
+# Assumes:
+#
+# Bugs:
+#
+#       Values must be integers that fit in 64 bits.  Nothing can be
+#       deleted.  KeyGroups.find() searches the labels of a group in
+#       order, so it is for small groups (e.g. the panes of an image), not
+#       for thousands of labels (e.g. the figures of a reference; see
+#       benchmarks/keymap.py).
+#
+# Implementation:
+#
+#       KeyMap:
+#
+#       A key that is its prefix followed by a number, written without
+#       leading zeros (e.g. '1234', 'PIX:1234'), is held as that number
+#       in an open-addressing table (linear probing) of two array('q')
+#       columns, 16 bytes per slot, grown by doubling at 2/3 full.  Any
+#       other key (e.g. 'GUDMAP:1234', '01234') is held in a dictionary.
+#       A dictionary entry for a numeric ID costs a str, an int and a
+#       hash table slot (about 100 bytes); see benchmarks/keymap.py.
+#
+#       KeyGroups:
+#
+#       The pairs of a group are stored together, as a count followed by
+#       the values in one array('q') and the labels (interned, so equal
+#       labels are stored once) in a list at the same positions; a KeyMap
+#       holds the position of each group.
+#
+
+import sys
+from array import array
+
+#globals
+
+emptySlot = -1          # key column value of an unused slot
+maxDigits = 18          # numbers with more digits are held in the dictionary
+
+# Purpose:  a map of accession IDs to integers (see Implementation)
+# Assumes:  nothing
+
+class KeyMap:
+
+    # Purpose:  creates an empty map
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  nothing
+    # Throws:   nothing
+
+    def __init__(self,
+        prefix = '',        # prefix of the numeric keys (string)
+        capacity = 1024     # initial number of slots (power of 2)
+        ):
+
+        self.prefix = prefix
+        self.numbers = 0
+        self.mask = capacity - 1
+        self.slotKeys = array('q', [emptySlot]) * capacity
+        self.slotValues = array('q', [0]) * capacity
+        self.others = {}
+
+    # Purpose:  returns the number of a numeric key
+    # Returns:  integer, or -1 if the key is held in the dictionary
+    # Assumes:  nothing
+    # Effects:  nothing
+    # Throws:   nothing
+
+    def number(self,
+        key                 # key (string)
+        ):
+
+        if not key.startswith(self.prefix):
+            return -1
+
+        digits = key[len(self.prefix):]
+
+        if not digits.isdigit() or not digits.isascii() or len(digits) > maxDigits:
+            return -1
+
+        if digits[0] == '0' and digits != '0':
+            return -1
+
+        return int(digits)
+
+    # Purpose:  returns the slot of a number
+    # Returns:  integer (the number's slot, or the empty slot it goes in)
+    # Assumes:  number >= 0
+    # Effects:  nothing
+    # Throws:   nothing
+
+    def slot(self,
+        number              # number (integer)
+        ):
+
+        keys = self.slotKeys
+        mask = self.mask
+        i = (number * 2654435761) & mask
+
+        while 1:
+            k = keys[i]
+            if k == number or k == emptySlot:
+                return i
+            i = (i + 1) & mask
+
+    # Purpose:  doubles the number of slots
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  rehashes the numeric keys
+    # Throws:   nothing
+
+    def grow(self):
+
+        oldKeys = self.slotKeys
+        oldValues = self.slotValues
+        capacity = 2 * len(oldKeys)
+
+        mask = capacity - 1
+        keys = array('q', [emptySlot]) * capacity
+        values = array('q', [0]) * capacity
+
+        for number, value in zip(oldKeys, oldValues):
+            if number == emptySlot:
+                continue
+            i = (number * 2654435761) & mask
+            while keys[i] != emptySlot:
+                i = (i + 1) & mask
+            keys[i] = number
+            values[i] = value
+
+        self.mask = mask
+        self.slotKeys = keys
+        self.slotValues = values
+
+    def __setitem__(self, key, value):
+
+        number = self.number(key)
+
+        if number < 0:
+            self.others[key] = value
+            return
+
+        i = self.slot(number)
+
+        if self.slotKeys[i] == emptySlot:
+            if 3 * (self.numbers + 1) > 2 * len(self.slotKeys):
+                self.grow()
+                i = self.slot(number)
+            self.slotKeys[i] = number
+            self.numbers = self.numbers + 1
+
+        self.slotValues[i] = value
+
+    def get(self, key, default = None):
+
+        number = self.number(key)
+
+        if number < 0:
+            return self.others.get(key, default)
+
+        i = self.slot(number)
+
+        if self.slotKeys[i] == emptySlot:
+            return default
+
+        return self.slotValues[i]
+
+    def __getitem__(self, key):
+
+        value = self.get(key)
+
+        if value is None:
+            raise KeyError(key)
+
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return self.numbers + len(self.others)
+
+    # Purpose:  returns the entries of the map
+    # Returns:  generator of (key, value); the numeric keys come first,
+    #           in no particular order
+    # Assumes:  nothing
+    # Effects:  nothing
+    # Throws:   nothing
+
+    def items(self):
+
+        for number, value in zip(self.slotKeys, self.slotValues):
+            if number != emptySlot:
+                yield (self.prefix + str(number), value)
+
+        for item in self.others.items():
+            yield item
+
+    def keys(self):
+        return [key for key, value in self.items()]
+
+    def update(self, other):
+
+        for key, value in other.items():
+            self[key] = value
+
+# Purpose:  a map of accession IDs to lists of (label, integer) pairs
+#           (see Implementation)
+# Assumes:  nothing
+
+class KeyGroups:
+
+    # Purpose:  creates an empty map
+    # Returns:  nothing
+    # Assumes:  nothing
+    # Effects:  nothing
+    # Throws:   nothing
+
+    def __init__(self,
+        prefix = ''         # prefix of the numeric keys (string)
+        ):
+
+        self.positions = KeyMap(prefix)
+        self.values = array('q')
+        self.labels = []
+
+    # Purpose:  sets the pairs of a group
+    # Returns:  nothing
+    # Assumes:  the group has not been set
+    # Effects:  nothing
+    # Throws:   nothing
+
+    def setGroup(self,
+        key,                # group key (string)
+        pairs               # [(label (string or None), value (integer)), ...]
+        ):
+
+        self.positions[key] = len(self.values)
+        self.values.append(len(pairs))
+        self.labels.append(None)
+
+        for label, value in pairs:
+            if label is not None:
+                label = sys.intern(label)
+            self.labels.append(label)
+            self.values.append(value)
+
+    # Purpose:  returns the pairs of a group
+    # Returns:  [(label, value), ...], or None if the group has not been set
+    # Assumes:  nothing
+    # Effects:  nothing
+    # Throws:   nothing
+
+    def getGroup(self,
+        key                 # group key (string)
+        ):
+
+        i = self.positions.get(key)
+
+        if i is None:
+            return None
+
+        n = self.values[i]
+
+        return list(zip(self.labels[i + 1:i + 1 + n], self.values[i + 1:i + 1 + n]))
+
+    # Purpose:  returns the values of a group
+    # Returns:  array of values, or None if the group has not been set
+    # Assumes:  nothing
+    # Effects:  nothing
+    # Throws:   nothing
+
+    def getValues(self,
+        key                 # group key (string)
+        ):
+
+        i = self.positions.get(key)
+
+        if i is None:
+            return None
+
+        return self.values[i + 1:i + 1 + self.values[i]]
+
+    # Purpose:  returns the value of a label in a group
+    # Returns:  the value of the last pair with the label, or None
+    # Assumes:  nothing
+    # Effects:  nothing
+    # Throws:   nothing
+
+    def find(self,
+        key,                # group key (string)
+        label               # label (string or None)
+        ):
+
+        i = self.positions.get(key)
+
+        if i is None:
+            return None
+
+        start = i + 1
+        stop = start + self.values[i]
+        j = -1
+
+        # list.index() searches in C; it is repeated only for a label
+        # that is in the group more than once
+
+        while 1:
+            try:
+                j = self.labels.index(label, start, stop)
+            except ValueError:
+                break
+            start = j + 1
+
+        if j < 0:
+            return None
+
+        return self.values[j]
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def __len__(self):
+        return len(self.positions)
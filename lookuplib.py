@@ -0,0 +1,360 @@
+#!/usr/local/bin/python
+
+#
+# Program: lookuplib.py
+#
+# Purpose:
+#
+#       Some common routines for set-based (bulk) lookups, and the
+#       lookups of the image loads (references, terms, users, images),
+#       which are answered by the database or by a snapshot
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#       for inList in lookuplib.sqlInBatches(values):
+#               results = db.sql('... where accID in (%s)' % (inList), 'auto')
+#
+#       for r in lookuplib.sqlStream('select ...'):
+#               ...
+#
+#       lookuplib.openSnapshot(fileName)        # optional; see below
+#       referenceLookup = lookuplib.lookupReferences(jnums)
+#       termLookup = lookuplib.lookupTerms(vocabKey, terms)
+#       userKey = lookuplib.lookupUser(login, errorFile)
+#       for r in lookuplib.lookupPixImages(refKeys):
+#               ...
+#
+# Envvars:
+#
+# Inputs:
+#
+# Outputs:
+#
+# Exit Codes:
+#
+# Assumes:
+#
+# Bugs:
+#
+# Implementation:
+#
+#       Snapshot:
+#
+#       A json file (written by imagesnapshot.py) of the rows the lookups
+#       read, so that a preview can run without a database connection:
+#
+#       {"date" : ..., "server" : ..., "database" : ...,
+#        "users" : {login : _User_key},
+#        "terms" : {_Vocab_key : {term : _Term_key}},
+#        "references" : {J: : _Refs_key},
+#        "images" : [[_Image_key, _Refs_key, figureLabel, PIX accID], ...],
+#        "keys" : {sequence name or prefixPart : next key}}
+#
+#       Once a snapshot is open (openSnapshot, or useSnapshot with the
+#       same structure in memory), the lookups and the keylib previews
+#       are answered from it; nothing in it is written back.
+#
+#       Otherwise, the references, terms and users are read from the
+#       lookup cache (cachelib.py; LOOKUPCACHE) and only the keys that
+#       are not cached are looked up in the database.
+#
+
+import re
+import time
+import json
+import db
+import loadlib
+import cachelib
+import metricslib
+
+#globals
+
+batchSize = 500         # number of values per set-based lookup query
+streamSize = 10000      # number of rows per server-side cursor fetch
+
+snapshot = None         # snapshot the lookups are answered from (None: the database)
+
+# Purpose:  quotes a list of values for use in a sql 'in' clause
+# Returns:  string
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   nothing
+
+def sqlInList(
+    values          # list of values (list of strings)
+    ):
+
+    return ','.join(["'%s'" % (str(v).replace("'", "''")) for v in values])
+
+# Purpose:  splits a list of values into sql 'in' clauses
+# Returns:  generator of strings (see sqlInList)
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   nothing
+
+def sqlInBatches(
+    values          # values (iterable of strings)
+    ):
+
+    values = sorted(set(values))
+
+    for i in range(0, len(values), batchSize):
+        yield sqlInList(values[i:i + batchSize])
+
+# Purpose:  returns the connection used by the db module
+# Returns:  database connection
+# Assumes:  db.useOneConnection(1) has been called
+# Effects:  nothing
+# Throws:   nothing
+
+def getConnection():
+
+    if db.sharedDbConnection is None:
+        db.sql('select 1', 'auto')
+
+    return db.sharedDbConnection
+
+# Purpose:  runs a query through a server-side cursor, fetching
+#           streamSize rows at a time, instead of materializing
+#           all of the results (as db.sql() does)
+# Returns:  generator of dictionaries (column name : value)
+# Assumes:  db.useOneConnection(1) has been called
+# Effects:  the cursor is closed when the results are exhausted
+#           column names are returned in the case used in cmd
+#           (as db.sql() does), e.g. '_Image_key' not '_image_key'
+# Throws:   nothing
+
+def sqlStream(
+    cmd,                # sql select command (string)
+    name = 'sqlstream'  # server-side cursor name (string)
+    ):
+
+    names = dict([(w.lower(), w) for w in re.findall(r'\w+', cmd)])
+
+    # the time spent in the database (not in the caller) is recorded
+    # with the statement metrics
+
+    startTime = time.time()
+    cursor = getConnection().cursor(name)
+    cursor.itersize = streamSize
+    cursor.execute(cmd)
+    elapsed = time.time() - startTime
+
+    try:
+        while 1:
+            startTime = time.time()
+            rows = cursor.fetchmany(streamSize)
+            elapsed = elapsed + time.time() - startTime
+            if not rows:
+                break
+            columns = [names.get(c[0], c[0]) for c in cursor.description]
+            for row in rows:
+                yield dict(zip(columns, row))
+    finally:
+        cursor.close()
+        metricslib.recordStatement(cmd, elapsed)
+
+
+# Purpose:  answers the lookups from a snapshot file
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  sets global snapshot
+# Throws:   IOError, ValueError if the file cannot be read
+
+def openSnapshot(
+    fileName        # snapshot file name (string)
+    ):
+
+    fp = open(fileName, 'r')
+    useSnapshot(json.load(fp))
+    fp.close()
+
+# Purpose:  answers the lookups from a snapshot held in memory
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  sets global snapshot
+# Throws:   nothing
+
+def useSnapshot(
+    data            # snapshot (dictionary; see Implementation), or None
+    ):
+
+    global snapshot
+
+    if data is not None:
+        for section in ('users', 'terms', 'references', 'keys'):
+            data.setdefault(section, {})
+        data.setdefault('images', [])
+
+    snapshot = data
+
+# Purpose:  returns the next key of a sequence or accession prefix
+#           recorded in the snapshot
+# Returns:  integer (1 if the snapshot does not have it)
+# Assumes:  a snapshot is open
+# Effects:  nothing
+# Throws:   nothing
+
+def getSnapshotKey(
+    name            # sequence name or prefixPart (string)
+    ):
+
+    return snapshot['keys'].get(name, 1)
+
+# Purpose:  looks up the _Term_key of each term of a vocabulary
+# Returns:  dictionary of term : _Term_key (0 if invalid)
+# Assumes:  nothing
+# Effects:  queries the database (unless a snapshot is open) for the
+#           terms that are not in the lookup cache, and caches them
+# Throws:   nothing
+
+def lookupTerms(
+    vocabKey,       # _Vocab_key (string or integer)
+    terms           # terms (iterable of strings)
+    ):
+
+    terms = set(terms)
+    lookup = {}
+
+    if snapshot is not None:
+        vocab = snapshot['terms'].get(str(vocabKey), {})
+        lowerVocab = dict([(t.lower(), k) for t, k in vocab.items()])
+        for term in terms:
+            lookup[term] = vocab.get(term, lowerVocab.get(term.lower(), 0))
+        return lookup
+
+    kind = 'term:%s' % (vocabKey)
+    lookup = cachelib.getValues(kind, terms)
+    terms = terms - set(lookup.keys())
+
+    for inList in sqlInBatches(terms):
+        results = db.sql('''
+            select _Term_key, term
+            from VOC_Term
+            where _Vocab_key = %s
+            and term in (%s)
+            ''' % (vocabKey, inList), 'auto')
+        for r in results:
+            lookup[r['term']] = r['_Term_key']
+
+    # anything the set-based query did not find is checked once by
+    # loadlib (case differences, etc.)
+
+    for term in terms:
+        if term not in lookup:
+            lookup[term] = loadlib.verifyTerm('', vocabKey, term, 0, None)
+
+    cachelib.putValues(kind, dict([(t, lookup[t]) for t in terms if lookup[t] != 0]))
+
+    return lookup
+
+# Purpose:  looks up the _Refs_key of each J:
+# Returns:  dictionary of J: : _Refs_key (0 if invalid)
+# Assumes:  nothing
+# Effects:  queries the database (unless a snapshot is open) for the
+#           J: that are not in the lookup cache, and caches them
+# Throws:   nothing
+
+def lookupReferences(
+    jnums           # J: numbers (iterable of strings)
+    ):
+
+    jnums = set(jnums)
+    lookup = {}
+
+    if snapshot is not None:
+        references = snapshot['references']
+        for jnum in jnums:
+            lookup[jnum] = references.get(jnum, references.get(jnum.upper(), 0))
+        return lookup
+
+    lookup = cachelib.getValues('reference', jnums)
+    jnums = jnums - set(lookup.keys())
+
+    for inList in sqlInBatches(jnums):
+        results = db.sql('''
+            select accID, _Object_key
+            from ACC_Accession
+            where _MGIType_key = 1
+            and _LogicalDB_key = 1
+            and prefixPart = 'J:'
+            and preferred = 1
+            and accID in (%s)
+            ''' % (inList), 'auto')
+        for r in results:
+            lookup[r['accID']] = r['_Object_key']
+
+    for jnum in jnums:
+        if jnum not in lookup:
+            lookup[jnum] = loadlib.verifyReference(jnum, 0, None)
+
+    cachelib.putValues('reference', dict([(j, lookup[j]) for j in jnums if lookup[j] != 0]))
+
+    return lookup
+
+# Purpose:  looks up the _User_key of a login
+# Returns:  _User_key (0 if invalid)
+# Assumes:  nothing
+# Effects:  queries the database (unless a snapshot is open or the
+#           login is in the lookup cache), and caches it
+#           writes an error to errorFile if the login is invalid
+# Throws:   nothing
+
+def lookupUser(
+    login,          # MGI_User.login (string)
+    errorFile       # error file descriptor (or None)
+    ):
+
+    if snapshot is None:
+        cached = cachelib.getValues('user', [login])
+        if login in cached:
+            return cached[login]
+        userKey = loadlib.verifyUser(login, 0, errorFile)
+        if userKey != 0:
+            cachelib.putValues('user', {login : userKey})
+        return userKey
+
+    userKey = snapshot['users'].get(login, 0)
+
+    if userKey == 0 and errorFile is not None:
+        errorFile.write('Invalid User:  %s\n' % (login))
+
+    return userKey
+
+# Purpose:  looks up the images of the references, with their PIX IDs
+# Returns:  generator of dictionaries (_Image_key, _Refs_key, figureLabel,
+#           accID); accID is None if the image has no PIX ID
+# Assumes:  nothing
+# Effects:  queries the database (unless a snapshot is open)
+# Throws:   nothing
+
+def lookupPixImages(
+    refKeys         # _Refs_key values (iterable of integers)
+    ):
+
+    refKeys = set(refKeys)
+
+    if snapshot is not None:
+        for imageKey, refKey, figureLabel, accID in snapshot['images']:
+            if refKey in refKeys:
+                if accID == '':
+                    accID = None
+                yield {'_Image_key' : imageKey, '_Refs_key' : refKey,
+                       'figureLabel' : figureLabel, 'accID' : accID}
+        return
+
+    # _MGIType_key 9 = Image, _LogicalDB_key 19 = PIX
+
+    for inList in sqlInBatches(refKeys):
+        results = db.sql('''
+            select i._Image_key, i._Refs_key, i.figureLabel, a.accID
+            from IMG_Image i
+            left outer join ACC_Accession a on (a._Object_key = i._Image_key
+                and a._MGIType_key = 9
+                and a._LogicalDB_key = 19)
+            where i._Refs_key in (%s)
+            ''' % (inList), 'auto')
+        for r in results:
+            yield r
@@ -0,0 +1,287 @@
+#!/usr/local/bin/python
+
+#
+# Program: metricslib.py
+#
+# Purpose:
+#
+#       Some common routines for collecting load metrics
+#       (counters, distinct values, phase timings, SQL statement
+#       counts/timings) and writing them as one machine-readable (json)
+#       summary
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#       metricslib.begin(db)
+#       metricslib.startTimer('process')
+#       metricslib.incr('rowsRead')
+#       metricslib.countValue('missingLabels', figureLabel)
+#       metricslib.stopTimer('process')
+#       metricslib.writeSummary(diagFile)
+#       metricslib.end('/data/loads/gxdimageload')
+#
+# Envvars:
+#
+#       LOADPROFILE             if 1, run the load under cProfile
+#                               (see end())
+#
+# Inputs:
+#
+# Outputs:
+#
+#       end(fileBase) writes:
+#
+#       fileBase.metrics.json   the summary
+#       fileBase.prof           cProfile statistics (LOADPROFILE=1);
+#                               python -m pstats fileBase.prof
+#
+# Exit Codes:
+#
+# Assumes:
+#
+# Bugs:
+#
+# Implementation:
+#
+#       begin(db) replaces db.sql with a wrapper that counts and times
+#       every statement by its shape: the statement with its whitespace
+#       collapsed and its literals replaced by ?, so that the same query
+#       with different values (e.g. each batch of an in-list) is counted
+#       together.
+#
+
+import os
+import re
+import json
+import time
+import cProfile
+
+#globals
+
+counters = {}       # name : count
+values = {}         # name : {value : count}
+timings = {}        # name : elapsed seconds
+startTimes = {}     # name : start time of a running timer
+statements = {}     # statement shape : [count, elapsed seconds]
+
+profileEnabled = os.environ.get('LOADPROFILE', '0') == '1'
+profiler = None     # cProfile.Profile if profileEnabled
+
+literalPattern = re.compile(r"'(?:[^']|'')*'")
+numberPattern = re.compile(r'\b\d+(?:\.\d+)?\b')
+inListPattern = re.compile(r'\(\?(?:, ?\?)*\)')
+
+# Purpose:  increments a counter
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  updates global counters
+# Throws:   nothing
+
+def incr(
+    name,           # counter name (string)
+    n = 1           # increment (integer)
+    ):
+
+    counters[name] = counters.get(name, 0) + n
+
+# Purpose:  counts an occurrence of a value (e.g. a missing label), so
+#           the summary lists each distinct value once
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  updates global values
+# Throws:   nothing
+
+def countValue(
+    name,           # name of the value set (string)
+    value           # value (string)
+    ):
+
+    d = values.setdefault(name, {})
+    d[value] = d.get(value, 0) + 1
+
+# Purpose:  starts a timer
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  updates global startTimes
+# Throws:   nothing
+
+def startTimer(
+    name            # timer name (string)
+    ):
+
+    startTimes[name] = time.time()
+
+# Purpose:  stops a timer; the elapsed time is added to the timing
+# Returns:  elapsed seconds (float)
+# Assumes:  startTimer(name) has been called
+# Effects:  updates global timings, startTimes
+# Throws:   nothing
+
+def stopTimer(
+    name            # timer name (string)
+    ):
+
+    elapsed = time.time() - startTimes.pop(name)
+    timings[name] = timings.get(name, 0.0) + elapsed
+
+    return elapsed
+
+# Purpose:  adds to a timing (e.g. the runtime of a bcp command)
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  updates global timings
+# Throws:   nothing
+
+def addTiming(
+    name,           # timer name (string)
+    elapsed         # seconds (float)
+    ):
+
+    timings[name] = timings.get(name, 0.0) + elapsed
+
+# Purpose:  returns the shape of a SQL statement
+# Returns:  string
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   nothing
+
+def statementShape(
+    cmd             # SQL statement (string or list of strings)
+    ):
+
+    if isinstance(cmd, list):
+        cmd = '; '.join(cmd)
+
+    shape = ' '.join(cmd.split())
+    shape = literalPattern.sub('?', shape)
+    shape = numberPattern.sub('?', shape)
+    shape = inListPattern.sub('(?)', shape)
+
+    return shape
+
+# Purpose:  counts and times one SQL statement
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  updates global statements
+# Throws:   nothing
+
+def recordStatement(
+    cmd,            # SQL statement (string or list of strings)
+    elapsed         # seconds (float)
+    ):
+
+    s = statements.setdefault(statementShape(cmd), [0, 0.0])
+    s[0] = s[0] + 1
+    s[1] = s[1] + elapsed
+
+# Purpose:  counts and times every db.sql() call
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  replaces dbModule.sql with a wrapper (once)
+# Throws:   nothing
+
+def instrumentDB(
+    dbModule        # the db module
+    ):
+
+    sql = dbModule.sql
+
+    if getattr(sql, 'instrumented', 0):
+        return
+
+    def timedSQL(cmd, *args, **kwargs):
+        startTime = time.time()
+        try:
+            return sql(cmd, *args, **kwargs)
+        finally:
+            recordStatement(cmd, time.time() - startTime)
+
+    timedSQL.instrumented = 1
+    dbModule.sql = timedSQL
+
+# Purpose:  starts collecting the metrics of a load
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  instruments dbModule (instrumentDB), starts the 'total'
+#           timer, and starts the profiler if LOADPROFILE=1
+# Throws:   nothing
+
+def begin(
+    dbModule = None # the db module
+    ):
+
+    global profiler
+
+    if dbModule is not None:
+        instrumentDB(dbModule)
+
+    startTimer('total')
+
+    if profileEnabled and profiler is None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+# Purpose:  finishes collecting the metrics of a load and writes them
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  stops the 'total' timer and the profiler
+#           writes fileBase.metrics.json (and fileBase.prof)
+# Throws:   IOError
+
+def end(
+    fileBase        # output file name, without extension (string)
+    ):
+
+    global profiler
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(fileBase + '.prof')
+        profiler = None
+
+    if 'total' in startTimes:
+        stopTimer('total')
+
+    fp = open(fileBase + '.metrics.json', 'w')
+    json.dump(getSummary(), fp, indent = 1, sort_keys = True)
+    fp.write('\n')
+    fp.close()
+
+# Purpose:  returns the summary of all metrics
+# Returns:  dictionary
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   nothing
+
+def getSummary():
+
+    summary = {
+        'counters' : counters,
+        'timings' : dict([(name, round(t, 3)) for name, t in timings.items()]),
+        'values' : {},
+        'statements' : {}
+        }
+
+    for shape, (count, elapsed) in statements.items():
+        summary['statements'][shape] = {'count' : count, 'seconds' : round(elapsed, 3)}
+
+    for name, d in values.items():
+        summary['values'][name] = {'distinct' : len(d), 'counts' : d}
+
+    return summary
+
+# Purpose:  writes the summary of all metrics as one json line
+# Returns:  nothing
+# Assumes:  fp is open for writing
+# Effects:  writes to fp
+# Throws:   nothing
+
+def writeSummary(
+    fp              # file descriptor
+    ):
+
+    fp.write('METRICS %s\n' % (json.dumps(getSummary(), sort_keys = True)))
+    fp.flush()
+
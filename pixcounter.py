@@ -0,0 +1,126 @@
+#!/usr/local/bin/python
+
+#
+# Program: pixcounter.py
+#
+# Purpose:
+#
+#       Reserve a block of PIX IDs from the pixel DB accession counter.
+#       Concurrent (or aborted) intake jobs never get the same PIX ID.
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#       from a shell script:
+#
+#               pixcounter.py reserve [number of IDs]
+#
+#               prints the first PIX ID of the block; the block is
+#               first PIX ID .. first PIX ID + number of IDs - 1
+#
+#               example (csh): set accID=`${PYTHON} pixcounter.py reserve 25`
+#
+#       from python:
+#
+#               accID = pixcounter.reserveBlock(counterFileName, 25)
+#
+# Envvars:
+#
+#       PIXELDBCOUNTER          pixel DB accession counter
+#
+# Inputs:
+#
+#       Pixel DB accession counter; contains the next PIX ID to use
+#
+# Outputs:
+#
+#       Pixel DB accession counter; advanced past the block
+#
+# Exit Codes:
+#
+#       0:  Successful completion
+#       1:  Fatal error occurred
+#
+# Assumes:
+#
+# Bugs:
+#
+# Implementation:
+#
+#       The counter is read and advanced while holding an exclusive
+#       fcntl lock on <counter>.lock.  The new value is written to a
+#       temporary file in the same directory and renamed over the
+#       counter, so the counter is never seen half-written, even if the
+#       job is killed.
+#
+
+import sys
+import os
+import fcntl
+import tempfile
+
+# Purpose:  reserves a block of PIX IDs
+# Returns:  the first PIX ID of the block (integer)
+# Assumes:  nothing
+# Effects:  advances the counter by count
+# Throws:   IOError, ValueError
+
+def reserveBlock(
+    counterFileName,    # pixel DB accession counter (string)
+    count               # number of PIX IDs to reserve (integer)
+    ):
+
+    if count < 0:
+        raise ValueError('Invalid number of PIX IDs: %d' % (count))
+
+    lockFile = open(counterFileName + '.lock', 'a')
+    fcntl.lockf(lockFile, fcntl.LOCK_EX)
+
+    try:
+        fp = open(counterFileName, 'r')
+        accID = int(fp.read().strip())
+        fp.close()
+
+        if count > 0:
+            counterDir = os.path.dirname(os.path.abspath(counterFileName))
+            fd, tmpFileName = tempfile.mkstemp(dir = counterDir, prefix = '.counter.')
+            try:
+                fp = os.fdopen(fd, 'w')
+                fp.write('%d\n' % (accID + count))
+                fp.flush()
+                os.fsync(fd)
+                fp.close()
+                os.chmod(tmpFileName, 0o664)
+                os.rename(tmpFileName, counterFileName)
+            except:
+                os.remove(tmpFileName)
+                raise
+
+            dirFd = os.open(counterDir, os.O_RDONLY)
+            os.fsync(dirFd)
+            os.close(dirFd)
+    finally:
+        fcntl.lockf(lockFile, fcntl.LOCK_UN)
+        lockFile.close()
+
+    return accID
+
+#
+# Main
+#
+
+if __name__ == '__main__':
+
+    if len(sys.argv) != 3 or sys.argv[1] != 'reserve':
+        sys.stderr.write('Usage: %s reserve [number of IDs]\n' % (sys.argv[0]))
+        sys.exit(1)
+
+    try:
+        print(reserveBlock(os.environ['PIXELDBCOUNTER'], int(sys.argv[2])))
+    except (IOError, OSError, ValueError, KeyError) as e:
+        sys.stderr.write('Cannot reserve PIX IDs: %s\n' % (e))
+        sys.exit(1)
+
+    sys.exit(0)
+
@@ -0,0 +1,287 @@
+#!/usr/local/bin/python
+
+#
+# Program: pixindex.py
+#
+# Purpose:
+#
+#       Maintain the pixel DB content index: content hash -> PIX ID
+#       of the files in ${PIXELDBDATA}.  pixload.py (PIXLOAD_DEDUP=1)
+#       uses it to map a resubmitted image to its existing PIX ID instead
+#       of copying it again.
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#       pixindex.py update
+#
+#       scans ${PIXELDBDATA} and hashes any <PIX ID>.jpg file that is new
+#       or has changed (size/mtime) since the last scan; run it before
+#       pixload.py with PIXLOAD_DEDUP=1 (the first run hashes the whole
+#       pixel DB)
+#
+# Envvars:
+#
+#       PIXELDBDATA             pixel DB data directory
+#       PIXELDBINDEX            content index (default:
+#                               ${PIXELDBDATA}/accession/pixindex.db)
+#       PIXLOAD_WORKERS         number of parallel hashes (default 8)
+#
+# Inputs:
+#
+#       ${PIXELDBDATA}/<PIX ID>.jpg
+#
+# Outputs:
+#
+#       content index (sqlite)
+#
+# Exit Codes:
+#
+#       0:  Successful completion
+#       1:  Fatal error occurred
+#
+# Assumes:
+#
+# Bugs:
+#
+# Implementation:
+#
+#       The index is a sqlite database with two tables:
+#
+#       pixfile (pixID, size, mtime, hash)  one row per pixel DB file;
+#               size/mtime tell update() which files need re-hashing
+#       content (hash, pixID)               the (lowest) PIX ID of each
+#               distinct file content
+#
+#       The content row of a hash is recomputed from pixfile whenever a
+#       file with that hash is added, changes or disappears, so it never
+#       points to a file that no longer has that content.
+#
+
+import sys
+import os
+import re
+import hashlib
+import sqlite3
+import concurrent.futures
+
+#globals
+
+pixelDBData = os.environ.get('PIXELDBDATA', '')
+indexFileName = os.environ.get('PIXELDBINDEX', os.path.join(pixelDBData, 'accession', 'pixindex.db'))
+numWorkers = int(os.environ.get('PIXLOAD_WORKERS', '8'))
+
+pixFilePattern = re.compile(r'^(\d+)\.jpg$')
+
+# Purpose:  computes the content hash of a file
+# Returns:  hex digest (string)
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   IOError
+
+def fileHash(
+    fileName        # file name (string)
+    ):
+
+    h = hashlib.sha1()
+
+    fp = open(fileName, 'rb')
+    for block in iter(lambda: fp.read(1048576), b''):
+        h.update(block)
+    fp.close()
+
+    return h.hexdigest()
+
+# Purpose:  computes the content hash of a list of files in parallel
+# Returns:  list of hex digests, in fileNames order
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   IOError
+
+def fileHashes(
+    fileNames       # file names (list of strings)
+    ):
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers = numWorkers) as executor:
+        return list(executor.map(fileHash, fileNames))
+
+# Purpose:  opens (creating if needed) the content index
+# Returns:  sqlite connection
+# Assumes:  nothing
+# Effects:  creates the index tables
+# Throws:   sqlite3.Error
+
+def openIndex(
+    fileName = None     # index file name (string); default indexFileName
+    ):
+
+    if fileName is None:
+        fileName = indexFileName
+
+    conn = sqlite3.connect(fileName, timeout = 300)
+    conn.execute('''create table if not exists pixfile (
+        pixID integer primary key, size integer, mtime real, hash text)''')
+    conn.execute('''create table if not exists content (
+        hash text primary key, pixID integer)''')
+    conn.execute('create index if not exists pixfile_hash on pixfile (hash)')
+    conn.commit()
+
+    return conn
+
+# Purpose:  points the content row of a hash to the lowest PIX ID
+#           whose file has that content
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  replaces the content row, or deletes it if no file has
+#           that content any more
+# Throws:   sqlite3.Error
+
+def refreshContent(
+    conn,           # sqlite connection
+    hash            # content hash (string)
+    ):
+
+    pixID = conn.execute('select min(pixID) from pixfile where hash = ?', (hash,)).fetchone()[0]
+
+    if pixID is None:
+        conn.execute('delete from content where hash = ?', (hash,))
+    else:
+        conn.execute('insert or replace into content values (?, ?)', (hash, pixID))
+
+# Purpose:  adds a pixel DB file to the index
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  inserts/replaces the pixfile row; refreshes the content rows
+#           of its old hash (if it changed) and of its new hash
+# Throws:   sqlite3.Error
+
+def addFile(
+    conn,           # sqlite connection
+    pixID,          # PIX ID (integer)
+    hash,           # content hash (string)
+    size,           # file size (integer)
+    mtime           # file modification time (float)
+    ):
+
+    removeFile(conn, pixID)
+    conn.execute('insert into pixfile values (?, ?, ?, ?)', (pixID, size, mtime, hash))
+    refreshContent(conn, hash)
+
+# Purpose:  removes a pixel DB file from the index
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  deletes the pixfile row; refreshes the content row of its hash
+# Throws:   sqlite3.Error
+
+def removeFile(
+    conn,           # sqlite connection
+    pixID           # PIX ID (integer)
+    ):
+
+    row = conn.execute('select hash from pixfile where pixID = ?', (pixID,)).fetchone()
+
+    if row is None:
+        return
+
+    conn.execute('delete from pixfile where pixID = ?', (pixID,))
+    refreshContent(conn, row[0])
+
+# Purpose:  looks up the PIX ID of a file content
+# Returns:  PIX ID (integer) or None
+# Assumes:  nothing
+# Effects:  if dataDir is given, stats the matched pixel DB file
+# Throws:   sqlite3.Error
+
+def lookupHash(
+    conn,           # sqlite connection
+    hash,           # content hash (string)
+    dataDir = None  # pixel DB data directory (string); if given, a match
+                    # whose file has changed since it was indexed is ignored
+    ):
+
+    row = conn.execute('''select c.pixID, f.size, f.mtime
+        from content c, pixfile f
+        where c.hash = ?
+        and c.pixID = f.pixID''', (hash,)).fetchone()
+
+    if row is None:
+        return None
+
+    pixID, size, mtime = row
+
+    if dataDir is not None:
+        try:
+            st = os.stat(os.path.join(dataDir, '%d.jpg' % (pixID)))
+        except OSError:
+            return None
+        if (st.st_size, st.st_mtime) != (size, mtime):
+            return None
+
+    return pixID
+
+# Purpose:  brings the index up to date with ${PIXELDBDATA}
+# Returns:  number of files (re)hashed
+# Assumes:  nothing
+# Effects:  hashes new/changed pixel DB files and adds them to the index;
+#           removes the files that no longer exist from the index
+# Throws:   IOError, sqlite3.Error
+
+def update(
+    conn,                   # sqlite connection
+    dataDir = pixelDBData   # pixel DB data directory (string)
+    ):
+
+    indexed = {}
+    for pixID, size, mtime in conn.execute('select pixID, size, mtime from pixfile'):
+        indexed[pixID] = (size, mtime)
+
+    changed = []
+    found = set()
+
+    for entry in os.scandir(dataDir):
+        match = pixFilePattern.match(entry.name)
+        if match is None or not entry.is_file():
+            continue
+        st = entry.stat()
+        pixID = int(match.group(1))
+        found.add(pixID)
+        if indexed.get(pixID) != (st.st_size, st.st_mtime):
+            changed.append((pixID, entry.path, st.st_size, st.st_mtime))
+
+    for pixID in set(indexed) - found:
+        removeFile(conn, pixID)
+
+    # lowest PIX IDs first, so the oldest copy of a content is kept
+
+    changed.sort()
+
+    hashes = fileHashes([c[1] for c in changed])
+
+    for (pixID, fileName, size, mtime), hash in zip(changed, hashes):
+        addFile(conn, pixID, hash, size, mtime)
+
+    conn.commit()
+
+    return len(changed)
+
+#
+# Main
+#
+
+if __name__ == '__main__':
+
+    if len(sys.argv) != 2 or sys.argv[1] != 'update':
+        sys.stderr.write('Usage: %s update\n' % (sys.argv[0]))
+        sys.exit(1)
+
+    try:
+        conn = openIndex()
+        print('%d file(s) indexed' % (update(conn)))
+        conn.close()
+    except (IOError, OSError, sqlite3.Error) as e:
+        sys.stderr.write('Cannot update %s: %s\n' % (indexFileName, e))
+        sys.exit(1)
+
+    sys.exit(0)
+
@@ -0,0 +1,430 @@
+#!/usr/local/bin/python
+
+#
+# Program: pixload.py
+#
+# Purpose:
+#
+#       Take a directory of image files and "load" them into PixelDB:
+#       assign each file the next PIX ID and copy it to
+#       ${PIXELDBDATA}/<PIX ID>.jpg
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#       pixload.py [image file directory] [output file] [file pattern]
+#
+#       example: pixload.py data/tr4800/images/10.5dpc pix10.5dpc '*.jpg'
+#
+#       the file pattern is optional (default: all files in the directory)
+#
+# Envvars:
+#
+#       PIXELDBDATA             pixel DB data directory
+#       PIXELDBCOUNTER          pixel DB accession counter
+#       PIXLOAD_WORKERS         number of parallel copies (default 8)
+#       PIXLOAD_VERIFY          if 1 (default), checksum each copy
+#       PIXLOAD_DEDUP           if 1, do not copy files already in the
+#                               pixel DB (see pixindex.py); default 0
+#       PIXELDBINDEX            pixel DB content index (see pixindex.py)
+#       PIX_IMAGEFILE           if set, image file to write (see Outputs)
+#       PIX_PANEFILE            if set, image pane file to write
+#       REFERENCE               J:#### for the PIX_IMAGEFILE rows
+#       IMAGECLASS              image class for the PIX_IMAGEFILE rows
+#                               (default: Expression)
+#
+# Inputs:
+#
+#       A directory containing image files
+#
+#       Pixel DB accession counter; contains the first PIX ID to use
+#
+# Outputs:
+#
+#       A tab-delimited output file (e.g. Pix_Fullsize.txt) of:
+#               image file name
+#               pixel DB id
+#               with PIXLOAD_DEDUP only:  new | duplicate (the file's
+#               content is already in the pixel DB under this pixel DB
+#               id, or is the same as an earlier file in this directory;
+#               it was not copied)
+#
+#       Pixel DB accession counter; advanced past the assigned PIX IDs
+#
+#       If PIX_IMAGEFILE/PIX_PANEFILE are set, gxdimageload.py image and
+#       image pane input files for the new (not duplicate) files, with
+#       the X/Y dimensions read from the image headers
+#       (see imagesizelib.py); figure label is the file name without
+#       its extension, the copyright/image note/accession fields are
+#       left blank for the curators
+#
+#       Files copied/sec to stdout
+#
+# Exit Codes:
+#
+#       0:  Successful completion
+#       1:  Fatal error occurred
+#
+# Assumes:
+#
+# Bugs:
+#
+# Implementation:
+#
+#       The PIX IDs for the whole directory are reserved as one block
+#       (pixcounter.py) before any file is copied, so several pixload
+#       jobs can run at the same time.
+#
+#       With PIXLOAD_DEDUP, every file is hashed first and looked up in
+#       the pixel DB content index; only new content gets a PIX ID and is
+#       copied, and the copies are added to the index.  The index is
+#       built and brought up to date by a separate 'pixindex.py update'
+#       step, so pixload.py does not scan ${PIXELDBDATA}; a match is only
+#       used if the matched file still has the size/mtime it was indexed
+#       with.
+#
+#       Files are copied by a bounded pool of worker threads.  Each copy
+#       tries, in order: a copy-on-write clone (FICLONE), copy_file_range(),
+#       sendfile(), and a plain buffered copy; the first one the
+#       filesystem supports is used.
+#
+
+import sys
+import os
+import fcntl
+import glob
+import shutil
+import time
+import concurrent.futures
+import pixcounter
+import pixindex
+import imagesizelib
+
+#globals
+
+pixelDBData = os.environ['PIXELDBDATA']
+pixelDBCounter = os.environ['PIXELDBCOUNTER']
+numWorkers = int(os.environ.get('PIXLOAD_WORKERS', '8'))
+verifyCopy = os.environ.get('PIXLOAD_VERIFY', '1') == '1'
+dedup = os.environ.get('PIXLOAD_DEDUP', '0') == '1'
+
+imageFileName = os.environ.get('PIX_IMAGEFILE', '')
+paneFileName = os.environ.get('PIX_PANEFILE', '')
+jNumber = os.environ.get('REFERENCE', '')
+imageClass = os.environ.get('IMAGECLASS', 'Expression')
+
+TAB = '\t'
+CRT = '\n'
+
+FICLONE = 0x40049409    # linux ioctl: clone (reflink) a file
+
+# Purpose:  assigns PIX IDs to a list of files
+# Returns:  list of (file name, PIX ID, 'new' or 'duplicate'), in
+#           fileNames order
+# Assumes:  nothing
+# Effects:  reserves one PIX ID per new file content from the pixel DB
+#           accession counter (see pixcounter.py)
+# Throws:   IOError, ValueError
+
+def assignPixIDs(
+    fileNames,      # file names (list of strings)
+    hashes,         # content hash of each file (list of strings) or None
+    conn            # content index (sqlite connection) or None
+    ):
+
+    assigned = [None] * len(fileNames)  # per file: (PIX ID, 'new' or 'duplicate')
+    newFiles = []                       # indexes of the files to copy
+    firstFile = {}                      # hash : index of the first new file with it
+
+    for i in range(len(fileNames)):
+
+        if conn is not None:
+
+            accID = pixindex.lookupHash(conn, hashes[i], pixelDBData)
+            if accID is not None:
+                assigned[i] = (accID, 'duplicate')
+                continue
+
+            # same content as an earlier file in this directory
+
+            if hashes[i] in firstFile:
+                continue
+
+            firstFile[hashes[i]] = i
+
+        newFiles.append(i)
+
+    accID = pixcounter.reserveBlock(pixelDBCounter, len(newFiles))
+
+    for n in range(len(newFiles)):
+        assigned[newFiles[n]] = (accID + n, 'new')
+
+    for i in range(len(fileNames)):
+        if assigned[i] is None:
+            assigned[i] = (assigned[firstFile[hashes[i]]][0], 'duplicate')
+
+    return [(fileNames[i], assigned[i][0], assigned[i][1]) for i in range(len(fileNames))]
+
+# Purpose:  copies the contents of one open file to another, using the
+#           fastest method the filesystem supports
+# Returns:  name of the method used (string)
+# Assumes:  nothing
+# Effects:  writes to outFile
+# Throws:   OSError
+
+def copyData(
+    inFile,         # source file (binary file object)
+    outFile,        # target file (binary file object)
+    size            # size of the source (integer)
+    ):
+
+    inFd = inFile.fileno()
+    outFd = outFile.fileno()
+
+    try:
+        fcntl.ioctl(outFd, FICLONE, inFd)
+        return 'clone'
+    except OSError:
+        pass
+
+    for method in ('copy_file_range', 'sendfile'):
+
+        if not hasattr(os, method):
+            continue
+
+        try:
+            copied = 0
+            while copied < size:
+                if method == 'copy_file_range':
+                    n = os.copy_file_range(inFd, outFd, size - copied)
+                else:
+                    n = os.sendfile(outFd, inFd, copied, size - copied)
+                if n == 0:
+                    break
+                copied = copied + n
+            if copied == size:
+                return method
+        except OSError:
+            pass
+
+        # start over with the next method
+
+        os.lseek(inFd, 0, os.SEEK_SET)
+        os.lseek(outFd, 0, os.SEEK_SET)
+        os.ftruncate(outFd, 0)
+
+    shutil.copyfileobj(inFile, outFile, 1048576)
+
+    return 'copy'
+
+# Purpose:  copies one image file into the pixel DB
+# Returns:  (PIX ID, copy method)
+# Assumes:  nothing
+# Effects:  creates ${PIXELDBDATA}/<PIX ID>.jpg
+# Throws:   IOError if the copy fails or does not match the source
+
+def copyImage(
+    inFileName,     # source image file (string)
+    accID,          # PIX ID (integer)
+    hash            # content hash of the source (string) or None
+    ):
+
+    outFileName = '%s/%d.jpg' % (pixelDBData, accID)
+    size = os.path.getsize(inFileName)
+
+    inFile = open(inFileName, 'rb')
+    outFile = open(outFileName, 'wb')
+    method = copyData(inFile, outFile, size)
+    inFile.close()
+    outFile.close()
+
+    if verifyCopy and hash is None:
+        hash = pixindex.fileHash(inFileName)
+
+    if os.path.getsize(outFileName) != size or \
+       (verifyCopy and pixindex.fileHash(outFileName) != hash):
+        raise IOError('Copy of %s to %s does not match the source' % (inFileName, outFileName))
+
+    return accID, method
+
+# Purpose:  copies the new image files into the pixel DB in parallel
+# Returns:  dictionary of copy method : number of files
+# Assumes:  nothing
+# Effects:  copies the files; exits if any copy fails
+# Throws:   nothing
+
+def copyImages(
+    imageDir,       # image file directory (string)
+    pixIDs,         # list of (file name, PIX ID, 'new' or 'duplicate')
+    hashes          # file name : content hash
+    ):
+
+    methods = {}
+    errors = 0
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers = numWorkers) as executor:
+
+        futures = [executor.submit(copyImage, os.path.join(imageDir, fileName), accID, hashes.get(fileName)) \
+                   for fileName, accID, status in pixIDs if status == 'new']
+
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                accID, method = future.result()
+                methods[method] = methods.get(method, 0) + 1
+            except (IOError, OSError) as e:
+                sys.stderr.write('%s\n' % (e))
+                errors = errors + 1
+
+    if errors > 0:
+        sys.stderr.write('%d file(s) could not be copied\n' % (errors))
+        sys.exit(1)
+
+    return methods
+
+# Purpose:  writes the file name/PIX ID output file
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  creates/overwrites outputFileName; the new/duplicate status
+#           is only written with PIXLOAD_DEDUP (without it every file is
+#           new, and the file keeps its two fields)
+# Throws:   IOError
+
+def writeOutputFile(
+    outputFileName, # output file name (string)
+    pixIDs          # list of (file name, PIX ID, 'new' or 'duplicate')
+    ):
+
+    fp = open(outputFileName, 'w')
+    for fileName, accID, status in pixIDs:
+        if dedup:
+            fp.write(fileName + TAB + str(accID) + TAB + status + CRT)
+        else:
+            fp.write(fileName + TAB + str(accID) + CRT)
+    fp.close()
+
+# Purpose:  writes the gxdimageload.py image and image pane files for
+#           the new files, with their dimensions
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  creates/overwrites imageFileName, paneFileName (if set)
+#           reports files whose dimensions cannot be read to stderr
+# Throws:   IOError
+
+def writeImageFiles(
+    imageDir,       # image file directory (string)
+    pixIDs          # list of (file name, PIX ID, 'new' or 'duplicate')
+    ):
+
+    newFiles = [(fileName, accID) for fileName, accID, status in pixIDs if status == 'new']
+    sizes = imagesizelib.getImageSizes([os.path.join(imageDir, f) for f, accID in newFiles])
+
+    if imageFileName != '':
+        imageFile = open(imageFileName, 'w')
+    else:
+        imageFile = None
+
+    if paneFileName != '':
+        paneFile = open(paneFileName, 'w')
+    else:
+        paneFile = None
+
+    for (fileName, accID), size in zip(newFiles, sizes):
+
+        if size is None:
+            sys.stderr.write('Cannot read the dimensions of %s\n' % (fileName))
+            xdim = ydim = ''
+        else:
+            xdim, ydim = str(size[0]), str(size[1])
+
+        figureLabel = os.path.splitext(fileName)[0]
+
+        if imageFile is not None:
+            imageFile.write(TAB.join([jNumber, '', imageClass, str(accID), xdim, ydim,
+                                      figureLabel, '', '', '']) + CRT)
+
+        if paneFile is not None:
+            paneFile.write(TAB.join([str(accID), '', xdim, ydim]) + CRT)
+
+    if imageFile is not None:
+        imageFile.close()
+
+    if paneFile is not None:
+        paneFile.close()
+
+# Purpose:  adds the newly copied files to the content index
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  updates the content index
+# Throws:   sqlite3.Error
+
+def indexImages(
+    conn,           # content index (sqlite connection)
+    pixIDs,         # list of (file name, PIX ID, 'new' or 'duplicate')
+    hashes          # file name : content hash
+    ):
+
+    for fileName, accID, status in pixIDs:
+        if status == 'new':
+            st = os.stat('%s/%d.jpg' % (pixelDBData, accID))
+            pixindex.addFile(conn, accID, hashes[fileName], st.st_size, st.st_mtime)
+
+    conn.commit()
+
+#
+# Main
+#
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 3:
+        sys.stderr.write('Usage: %s [image file directory] [output file] [file pattern]\n' % (sys.argv[0]))
+        sys.exit(1)
+
+    imageDir = sys.argv[1]
+    outputFileName = sys.argv[2]
+    if len(sys.argv) > 3:
+        pattern = sys.argv[3]
+    else:
+        pattern = '*'
+
+    fileNames = sorted([os.path.basename(f) for f in glob.glob(os.path.join(imageDir, pattern)) \
+                        if os.path.isfile(f)])
+
+    startTime = time.time()
+
+    conn = None
+    hashes = {}
+
+    if dedup:
+        if not os.path.exists(pixindex.indexFileName):
+            sys.stderr.write('%s does not exist; run pixindex.py update first\n' % (pixindex.indexFileName))
+            sys.exit(1)
+        conn = pixindex.openIndex()
+
+    if dedup or verifyCopy:
+        hashes = dict(zip(fileNames, pixindex.fileHashes([os.path.join(imageDir, f) for f in fileNames])))
+
+    pixIDs = assignPixIDs(fileNames, [hashes.get(f) for f in fileNames], conn)
+    newIDs = [p[1] for p in pixIDs if p[2] == 'new']
+
+    if len(newIDs) > 0:
+        print('starting pix id: %d' % (newIDs[0]))
+        print('ending pix id: %d' % (newIDs[-1]))
+
+    methods = copyImages(imageDir, pixIDs, hashes)
+    writeOutputFile(outputFileName, pixIDs)
+
+    if imageFileName != '' or paneFileName != '':
+        writeImageFiles(imageDir, pixIDs)
+
+    if conn is not None:
+        indexImages(conn, pixIDs, hashes)
+        conn.close()
+
+    elapsed = time.time() - startTime
+    print('%d files copied, %d duplicates in %.2f sec (%.1f files/sec) %s' \
+        % (len(newIDs), len(pixIDs) - len(newIDs), elapsed, len(pixIDs) / max(elapsed, 0.001), methods))
+
+    sys.exit(0)
+
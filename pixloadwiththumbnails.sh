@@ -18,6 +18,7 @@
 #      PIXELDB_FILES
 #      PIX_FULLSIZE
 #      PIX_THUMBNAIL
+#      PIXELDBTHUMBNAILS
 #
 #  Inputs:
 #
@@ -47,6 +48,9 @@
 #      - Pixel DB accession counter (/data/pixeldb/accession/counter).  This
 #        file is updated with the next available number.
 #
+#      - A thumbnail of each new fullsize image, PIXELDBTHUMBNAILS/<pix id>.jpg
+#        (see pixthumbnail.py)
+#
 #  Exit Codes:
 #
 #      0:  Successful completion
@@ -60,26 +64,19 @@
 #
 ###########################################################################
 
-# Get the first accession number to be used.
-#
-ACCID=`cat ${PIXELDBCOUNTER}`
-
 echo ${PIX_FULLSIZE}
-rm -f ${PIX_FULLSIZE}
-touch ${PIX_FULLSIZE}
 #rm -f ${PIX_THUMBNAIL}
 #touch ${PIX_THUMBNAIL}
 
-echo "Starting pix id: ${ACCID}"
-cd ${FULLSIZE_IMAGE_DIR}
-for FILE in `ls ${FULLSIZE_IMAGE_DIR}`
-do
-    PIXELDBFILE=${PIXELDBDATA}/${ACCID}.jpg
-    cp ${FILE} ${PIXELDBFILE}
-    echo "${FILE}	${ACCID}" >> ${PIX_FULLSIZE}
-    LAST_ACCID=${ACCID}
-    ACCID=`expr ${ACCID} + 1`
-done
+# pixload.py assigns the pix ids, advances the pixel DB counter,
+# copies the fullsize images in parallel and writes ${PIX_FULLSIZE}
+#
+${PYTHON} `dirname $0`/pixload.py ${FULLSIZE_IMAGE_DIR} ${PIX_FULLSIZE} || exit 1
+
+# pixthumbnail.py generates the thumbnails of the new fullsize images
+# in parallel; thumbnails that are already up to date are skipped
+#
+${PYTHON} `dirname $0`/pixthumbnail.py ${PIX_FULLSIZE} || exit 1
 
 #echo "Starting pix id: ${ACCID}"
 #cd ${THUMBNAIL_IMAGE_DIR}
@@ -93,8 +90,3 @@ done
 #done
 #echo "Ending pix id: ${LAST_ACCID}"
 
-# Advance the pixel DB counter to the next available accession number.
-#
-echo "Advance pixel DB counter to: ${ACCID}"
-echo ${ACCID} > ${PIXELDBCOUNTER}
-
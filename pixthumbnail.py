@@ -0,0 +1,214 @@
+#!/usr/local/bin/python
+
+#
+# Program: pixthumbnail.py
+#
+# Purpose:
+#
+#       Generate the web thumbnails of the full-size images that
+#       pixload.py has added to the pixel DB.
+#
+# Requirements Satisfied by This Program:
+#
+# Usage:
+#
+#       pixthumbnail.py [pixload output file]
+#
+#       example: pixthumbnail.py Pix_Fullsize.txt
+#
+# Envvars:
+#
+#       PIXELDBDATA             pixel DB data directory
+#       PIXELDBTHUMBNAILS       thumbnail directory
+#                               (default: ${PIXELDBDATA}/thumbnails)
+#       THUMBNAILCMD            thumbnail command (default: convert)
+#       THUMBNAILSIZE           maximum thumbnail geometry (default: 150x150)
+#       PIXLOAD_WORKERS         number of processes (default: number of cpus)
+#
+# Inputs:
+#
+#       pixload.py output file (image file name, pixel DB id, and with
+#       PIXLOAD_DEDUP, new | duplicate); thumbnails are generated for the
+#       "new" pixel DB ids (all of them, if there is no status)
+#
+#       ${PIXELDBDATA}/<PIX ID>.jpg
+#
+# Outputs:
+#
+#       ${PIXELDBTHUMBNAILS}/<PIX ID>.jpg
+#
+#       Thumbnails created/up to date/failed to stdout
+#
+# Exit Codes:
+#
+#       0:  Successful completion
+#       1:  Fatal error occurred (one or more thumbnails failed)
+#
+# Assumes:
+#
+#       THUMBNAILCMD takes ImageMagick "convert" arguments:
+#               -thumbnail [THUMBNAILSIZE] [full-size file] [thumbnail file]
+#
+# Bugs:
+#
+# Implementation:
+#
+#       A thumbnail is up to date (and is skipped) if it exists and is not
+#       older than its full-size image, so a rerun only does the work that
+#       is left.
+#
+#       Each thumbnail is written to a temporary file in the thumbnail
+#       directory and renamed into place, so an interrupted run never
+#       leaves a partial thumbnail that looks up to date.
+#
+#       The thumbnails are spread over a process pool; the image scaling
+#       is CPU bound and scales with the number of cores.
+#
+
+import sys
+import os
+import shlex
+import subprocess
+import time
+import multiprocessing
+import concurrent.futures
+import inputlib
+
+#globals
+
+pixelDBData = os.environ['PIXELDBDATA']
+thumbnailDir = os.environ.get('PIXELDBTHUMBNAILS', os.path.join(pixelDBData, 'thumbnails'))
+thumbnailCmd = shlex.split(os.environ.get('THUMBNAILCMD', 'convert'))
+thumbnailSize = os.environ.get('THUMBNAILSIZE', '150x150')
+numWorkers = int(os.environ.get('PIXLOAD_WORKERS', str(os.cpu_count())))
+
+# Purpose:  reads the PIX IDs of the new files from a pixload output file
+# Returns:  list of PIX IDs (integers)
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   IOError, ValueError
+
+def readPixIDs(
+    fp              # pixload.py output file (file descriptor)
+    ):
+
+    pixIDs = []
+
+    for lineNum, tokens in inputlib.readRecords(fp, 2):
+        # without PIXLOAD_DEDUP there is no status; every file is new
+        # older 2-column files have no status; every file was new
+
+        if len(tokens) > 2 and tokens[2] != 'new':
+            continue
+
+        pixIDs.append(int(tokens[1]))
+
+    return pixIDs
+
+# Purpose:  determines whether a thumbnail is up to date
+# Returns:  1 if the thumbnail exists and is not older than the
+#           full-size image, else 0
+# Assumes:  nothing
+# Effects:  nothing
+# Throws:   OSError if the full-size image does not exist
+
+def isUpToDate(
+    imageFileName,      # full-size image file (string)
+    thumbnailFileName   # thumbnail file (string)
+    ):
+
+    try:
+        thumbnailTime = os.stat(thumbnailFileName).st_mtime
+    except FileNotFoundError:
+        return 0
+
+    return thumbnailTime >= os.stat(imageFileName).st_mtime
+
+# Purpose:  generates the thumbnail of one pixel DB image
+# Returns:  (PIX ID, 'created', 'uptodate' or the error message)
+# Assumes:  nothing
+# Effects:  creates ${PIXELDBTHUMBNAILS}/<PIX ID>.jpg
+# Throws:   nothing
+
+def makeThumbnail(
+    pixID           # PIX ID (integer)
+    ):
+
+    imageFileName = '%s/%d.jpg' % (pixelDBData, pixID)
+    thumbnailFileName = '%s/%d.jpg' % (thumbnailDir, pixID)
+    tmpFileName = '%s/.%d.%d.jpg' % (thumbnailDir, pixID, os.getpid())
+
+    try:
+        if isUpToDate(imageFileName, thumbnailFileName):
+            return pixID, 'uptodate'
+
+        result = subprocess.run(thumbnailCmd + ['-thumbnail', thumbnailSize, imageFileName, tmpFileName],
+                                stdout = subprocess.PIPE, stderr = subprocess.STDOUT,
+                                universal_newlines = True)
+
+        if result.returncode != 0 or not os.path.exists(tmpFileName):
+            return pixID, '%s: status %d %s' % (imageFileName, result.returncode, result.stdout.strip())
+
+        os.replace(tmpFileName, thumbnailFileName)
+
+    except OSError as e:
+        return pixID, '%s: %s' % (imageFileName, e)
+
+    finally:
+        if os.path.exists(tmpFileName):
+            os.remove(tmpFileName)
+
+    return pixID, 'created'
+
+# Purpose:  generates the thumbnails of a list of pixel DB images
+#           in parallel
+# Returns:  dictionary of 'created'/'uptodate'/'failed' : count
+# Assumes:  nothing
+# Effects:  creates the thumbnails; reports each failure to stderr
+# Throws:   nothing
+
+def makeThumbnails(
+    pixIDs          # PIX IDs (list of integers)
+    ):
+
+    counts = {'created' : 0, 'uptodate' : 0, 'failed' : 0}
+
+    context = multiprocessing.get_context('fork')
+    with concurrent.futures.ProcessPoolExecutor(max_workers = numWorkers, mp_context = context) as executor:
+        for pixID, status in executor.map(makeThumbnail, pixIDs):
+            if status in counts:
+                counts[status] = counts[status] + 1
+            else:
+                sys.stderr.write('Cannot create thumbnail %d: %s\n' % (pixID, status))
+                counts['failed'] = counts['failed'] + 1
+
+    return counts
+
+#
+# Main
+#
+
+if __name__ == '__main__':
+
+    if len(sys.argv) != 2:
+        sys.stderr.write('Usage: %s [pixload output file]\n' % (sys.argv[0]))
+        sys.exit(1)
+
+    startTime = time.time()
+
+    fp = open(sys.argv[1], 'r')
+    pixIDs = readPixIDs(fp)
+    fp.close()
+
+    os.makedirs(thumbnailDir, exist_ok = True)
+
+    counts = makeThumbnails(pixIDs)
+
+    elapsed = time.time() - startTime
+    print('%d thumbnails created, %d up to date, %d failed in %.2f sec (%.1f files/sec)' \
+        % (counts['created'], counts['uptodate'], counts['failed'], elapsed, len(pixIDs) / max(elapsed, 0.001)))
+
+    if counts['failed'] > 0:
+        sys.exit(1)
+
+    sys.exit(0)
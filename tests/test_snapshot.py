@@ -0,0 +1,222 @@
+#!/usr/local/bin/python
+
+#
+# Program: test_snapshot.py
+#
+# Purpose:
+#
+#       Tests of the gxdimageload.py preview run from a lookup snapshot
+#       (lookuplib.useSnapshot):  the bcp, note and error files it writes,
+#       with the snapshot as the only source of references, terms, users,
+#       existing images and keys
+#
+# Usage:
+#
+#       python -m pytest tests
+#       python -m unittest discover tests
+#
+# Implementation:
+#
+#       Each test runs gxdimageload.py in a subprocess (its settings are
+#       read from the environment when it is imported).  Any db query or
+#       opened connection fails the run.  If the MGI db, loadlib and mgi_utils
+#       modules are not installed, those of benchmarks/stubs are used.
+#       Load dates (the last two fields of each bcp row) are not compared.
+#
+
+import sys
+import os
+import json
+import subprocess
+import tempfile
+import unittest
+
+repoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+stubDir = os.path.join(repoDir, 'benchmarks', 'stubs')
+
+TAB = '\t'
+
+snapshot = {
+    'date' : 'snapshot date',
+    'server' : 'snapshotserver',
+    'database' : 'snapshotdb',
+    'users' : {'imageload' : 1001},
+    'terms' : {'83' : {'Expression' : 6481781}},
+    'references' : {'J:100' : 100, 'J:101' : 101},
+    'images' : [[500, 100, 'Fig 9', 'PIX:9009']],
+    'keys' : {'img_image_seq' : 1000, 'img_imagepane_seq' : 2000,
+              'acc_accession_seq' : 3000, 'MGI:' : 70000},
+    }
+
+imageLines = [
+    ['J:100', '', 'Expression', '5001', '100', '200', 'Fig 1', 'copyright 1', 'note 1', ''],
+    ['J:101', '', 'Expression', '5002', '300', '400', 'Fig 2', '', '', '105|X2'],
+    ['J:999', '', 'Expression', '5003', '10', '10', 'Fig 3', '', '', ''],
+    ['J:100', '', 'Bogus', '5004', '10', '10', 'Fig 4', '', '', ''],
+    ['J:100', '', 'Expression', '9009', '50', '60', 'Fig 9', '', '', ''],
+    ]
+
+paneLines = [
+    ['5001', '', '100', '200'],
+    ['5002', 'A', '10', '10'],
+    ['5002', 'B', '20', '20'],
+    ['5003', '', '1', '1'],
+    ['9009', '', '50', '60'],
+    ]
+
+# runs gxdimageload.py with the snapshot set by lookuplib.useSnapshot()
+
+driver = '''
+import sys, json, runpy
+import db, lookuplib
+
+def noDatabase(*args, **kwargs):
+    raise AssertionError('database used in a snapshot preview')
+
+def noConnection(value):
+    if value:
+        noDatabase()
+
+db.sql = noDatabase
+db.useOneConnection = noConnection
+db.sharedDbConnection = None
+
+lookuplib.useSnapshot(json.loads(sys.argv[1]))
+runpy.run_path(sys.argv[2], run_name = '__main__')
+'''
+
+# Purpose:  writes a tab-delimited file
+# Returns:  nothing
+
+def writeLines(fileName, lines):
+    fp = open(fileName, 'w')
+    for tokens in lines:
+        fp.write(TAB.join(tokens) + '\n')
+    fp.close()
+
+# Purpose:  reads a tab-delimited file
+# Returns:  list of rows (lists of fields), without the last 'dates' fields
+
+def readRows(fileName, dates = 0):
+    fp = open(fileName, 'r')
+    rows = [line[:-1].split(TAB) for line in fp]
+    fp.close()
+    if dates > 0:
+        rows = [row[:-dates] for row in rows]
+    return rows
+
+class SnapshotPreviewTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dataDir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    # Purpose:  runs the preview
+    # Returns:  subprocess.CompletedProcess
+
+    def runPreview(self, delta = '0', mode = 'preview'):
+
+        d = self.dataDir
+        writeLines(os.path.join(d, 'image.txt'), imageLines)
+        writeLines(os.path.join(d, 'pane.txt'), paneLines)
+
+        env = dict(os.environ)
+        for name in ('IMAGELOADSNAPSHOT', 'LOOKUPCACHE', 'IMAGELOADWORKERS', 'LOADPROFILE'):
+            env.pop(name, None)
+        env.update({
+            'IMAGELOADMODE' : mode,
+            'IMAGELOADDELTA' : delta,
+            'IMAGELOADDATADIR' : d,
+            'CREATEDBY' : 'imageload',
+            'COPYRIGHTFILE' : os.path.join(d, 'copyright.in'),
+            'CAPTIONFILE' : os.path.join(d, 'caption.in'),
+            'IMAGEFILE' : os.path.join(d, 'image.txt'),
+            'IMAGEPANEFILE' : os.path.join(d, 'pane.txt'),
+            'QUALIFIER_FULLSIZE' : 'test',
+            })
+
+        path = [repoDir]
+        try:
+            import db, loadlib, mgi_utils
+        except ImportError:
+            path.append(stubDir)
+        env['PYTHONPATH'] = os.pathsep.join(path)
+
+        return subprocess.run([sys.executable, '-c', driver, json.dumps(snapshot),
+            os.path.join(repoDir, 'gxdimageload.py')], env = env, cwd = d,
+            stdout = subprocess.PIPE, stderr = subprocess.STDOUT, universal_newlines = True)
+
+    def outputFile(self, name):
+        return os.path.join(self.dataDir, name)
+
+    def testPreview(self):
+
+        p = self.runPreview()
+        self.assertEqual(p.returncode, 0, p.stdout)
+
+        # keys start at the snapshot's next keys
+
+        self.assertEqual(readRows(self.outputFile('IMG_Image_test.bcp'), 2), [
+            ['1000', '6481781', '1072158', '100', '', '100', '200', 'Fig 1', '1001', '1001'],
+            ['1001', '6481781', '1072158', '101', '', '300', '400', 'Fig 2', '1001', '1001'],
+            ['1002', '6481781', '1072158', '100', '', '50', '60', 'Fig 9', '1001', '1001'],
+            ])
+
+        self.assertEqual(readRows(self.outputFile('IMG_ImagePane_test.bcp'), 2), [
+            ['2000', '1000', '', '0', '0', '100', '200'],
+            ['2001', '1001', 'A', '0', '0', '10', '10'],
+            ['2002', '1001', 'B', '0', '0', '20', '20'],
+            ['2003', '1002', '', '0', '0', '50', '60'],
+            ])
+
+        self.assertEqual(readRows(self.outputFile('ACC_Accession_test.bcp'), 2), [
+            ['3000', 'MGI:70000', 'MGI:', '70000', '1', '1000', '9', '0', '1', '1001', '1001'],
+            ['3001', 'PIX:5001', 'PIX:', '5001', '19', '1000', '9', '1', '1', '1001', '1001'],
+            ['3002', 'MGI:70001', 'MGI:', '70001', '1', '1001', '9', '0', '1', '1001', '1001'],
+            ['3003', 'PIX:5002', 'PIX:', '5002', '19', '1001', '9', '1', '1', '1001', '1001'],
+            ['3004', 'X2', 'X2', '', '105', '1001', '9', '0', '1', '1001', '1001'],
+            ['3005', 'MGI:70002', 'MGI:', '70002', '1', '1002', '9', '0', '1', '1001', '1001'],
+            ['3006', 'PIX:9009', 'PIX:', '9009', '19', '1002', '9', '1', '1', '1001', '1001'],
+            ])
+
+        self.assertEqual(readRows(self.outputFile('copyright.in')), [['MGI:70000', 'copyright 1']])
+        self.assertEqual(readRows(self.outputFile('caption.in')), [['MGI:70000', 'note 1']])
+
+        errors = [row[0] for row in readRows(self.outputFile('gxdimageload.error'))]
+        self.assertIn('Invalid Reference (3): J:999', errors)
+        self.assertIn('Invalid Term (4) Bogus', errors)
+        self.assertIn('Invalid Image (4): 5003', errors)
+
+        diagnostics = open(self.outputFile('gxdimageload.diagnostics')).read()
+        self.assertIn('Server: snapshotserver\n', diagnostics)
+        self.assertIn('Database: snapshotdb\n', diagnostics)
+
+    def testDelta(self):
+
+        # PIX:9009 (J:100, Fig 9) is an existing image of the snapshot
+
+        p = self.runPreview(delta = '1')
+        self.assertEqual(p.returncode, 0, p.stdout)
+
+        images = readRows(self.outputFile('IMG_Image_test.bcp'), 2)
+        self.assertEqual([row[7] for row in images], ['Fig 1', 'Fig 2'])
+
+        panes = readRows(self.outputFile('IMG_ImagePane_test.bcp'), 2)
+        self.assertEqual([row[1] for row in panes], ['1000', '1001', '1001'])
+
+        errors = [row[0] for row in readRows(self.outputFile('gxdimageload.error'))]
+        self.assertNotIn('Invalid Image (5): 9009', errors)
+
+    def testLoadMode(self):
+
+        # keys cannot be reserved from a snapshot
+
+        p = self.runPreview(mode = 'load')
+        self.assertEqual(p.returncode, 1, p.stdout)
+        self.assertIn('only valid in preview mode', p.stdout)
+
+if __name__ == '__main__':
+    unittest.main()